@@ -0,0 +1,371 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+from array import array
+from datetime import datetime, timezone
+from pathlib import Path
+
+from .db import PACKET_COLUMNS
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"MVA1"
+DAY_SECONDS = 86400
+
+ARCHIVE_COLUMNS = ("id", *(name.strip() for name in PACKET_COLUMNS.split(",")))
+INT_COLUMNS = {
+    "id",
+    "rx_time",
+    "from_id",
+    "to_id",
+    "portnum",
+    "rssi",
+    "hop_limit",
+    "hop_start",
+    "via_mqtt",
+    "channel",
+    "created_at",
+}
+FLOAT_COLUMNS = {"snr"}
+# Few distinct values per day, so stored as a value list plus one code per row.
+DICT_COLUMNS = {"portname", "gateway_id"}
+
+
+def day_start(timestamp: int) -> int:
+    return int(timestamp) - int(timestamp) % DAY_SECONDS
+
+
+def _day_name(start: int) -> str:
+    return datetime.fromtimestamp(start, tz=timezone.utc).strftime("%Y-%m-%d")
+
+
+def _encode_numbers(values: list, typecode: str) -> bytes:
+    nulls = bytes(value is None for value in values)
+    numbers = array(typecode, (0 if value is None else value for value in values))
+    return nulls + numbers.tobytes()
+
+
+def _decode_numbers(blob: bytes, rows: int, typecode: str) -> list:
+    nulls = blob[:rows]
+    numbers = array(typecode)
+    numbers.frombytes(blob[rows:])
+    return [None if null else value for null, value in zip(nulls, numbers)]
+
+
+def _encode_column(name: str, values: list) -> tuple[str, bytes]:
+    if name in INT_COLUMNS:
+        return "int", _encode_numbers(values, "q")
+    if name in FLOAT_COLUMNS:
+        return "float", _encode_numbers(values, "d")
+    if name in DICT_COLUMNS:
+        lookup: dict[str | None, int] = {}
+        codes = array("i", (lookup.setdefault(value, len(lookup)) for value in values))
+        return "dict", json.dumps(list(lookup)).encode("utf-8") + b"\n" + codes.tobytes()
+    return "json", json.dumps(values).encode("utf-8")
+
+
+def _decode_column(encoding: str, blob: bytes, rows: int) -> list:
+    if encoding == "int":
+        return _decode_numbers(blob, rows, "q")
+    if encoding == "float":
+        return _decode_numbers(blob, rows, "d")
+    if encoding == "dict":
+        head, _, body = blob.partition(b"\n")
+        values = json.loads(head)
+        codes = array("i")
+        codes.frombytes(body)
+        return [values[code] for code in codes]
+    return json.loads(blob)
+
+
+def _summaries(columns: dict[str, list]) -> dict:
+    ports: dict[int, list] = {}
+    channels: dict[int | None, list] = {}
+    for portnum, portname, channel, created_at in zip(
+        columns["portnum"], columns["portname"], columns["channel"], columns["created_at"]
+    ):
+        port = ports.setdefault(portnum, [portname, 0, created_at])
+        port[1] += 1
+        port[2] = max(port[2], created_at)
+        entry = channels.setdefault(channel, [0, created_at])
+        entry[0] += 1
+        entry[1] = max(entry[1], created_at)
+    return {
+        "port_counts": [[portnum, *values] for portnum, values in ports.items()],
+        "channel_counts": [[channel, *values] for channel, values in channels.items()],
+    }
+
+
+class DayFile:
+    # One UTC day of packets. The header carries per-column offsets, the
+    # distinct ports, channels and gateways for skipping whole files, and
+    # precomputed port/channel counts for windows that cover the full day.
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as handle:
+            if handle.read(4) != MAGIC:
+                raise ValueError(f"{path} is not a packet archive")
+            (length,) = struct.unpack("<I", handle.read(4))
+            self.header = json.loads(handle.read(length))
+        self.data_offset = 8 + length
+        self.rows = self.header["rows"]
+        self.mtime = path.stat().st_mtime_ns
+
+    def read(self, names: tuple[str, ...]) -> dict[str, list]:
+        columns = {}
+        with self.path.open("rb") as handle:
+            for name in names:
+                meta = self.header["columns"][name]
+                handle.seek(self.data_offset + meta["offset"])
+                blob = zlib.decompress(handle.read(meta["length"]))
+                columns[name] = _decode_column(meta["encoding"], blob, self.rows)
+        return columns
+
+    def may_match(
+        self,
+        portnums: list[int] | None = None,
+        channel: int | None = None,
+        gateway_id: str | None = None,
+    ) -> bool:
+        header = self.header
+        if portnums and not set(portnums) & set(header["portnums"]):
+            return False
+        if channel is not None and channel not in header["channels"]:
+            return False
+        if gateway_id and gateway_id not in header["gateways"]:
+            return False
+        return True
+
+
+def write_day_file(path: Path, start: int, columns: dict[str, list]) -> None:
+    rows = len(columns["id"])
+    header = {
+        "day": _day_name(start),
+        "start": start,
+        "rows": rows,
+        "min_created_at": min(columns["created_at"]),
+        "max_created_at": max(columns["created_at"]),
+        "portnums": sorted({value for value in columns["portnum"] if value is not None}),
+        "channels": sorted({value for value in columns["channel"] if value is not None}),
+        "gateways": sorted({value for value in columns["gateway_id"] if value is not None}),
+        **_summaries(columns),
+        "columns": {},
+    }
+    blobs = []
+    offset = 0
+    for name in ARCHIVE_COLUMNS:
+        encoding, raw = _encode_column(name, columns[name])
+        blob = zlib.compress(raw, 6)
+        header["columns"][name] = {"encoding": encoding, "offset": offset, "length": len(blob)}
+        blobs.append(blob)
+        offset += len(blob)
+    encoded = json.dumps(header).encode("utf-8")
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("wb") as handle:
+        handle.write(MAGIC)
+        handle.write(struct.pack("<I", len(encoded)))
+        handle.write(encoded)
+        for blob in blobs:
+            handle.write(blob)
+    os.replace(tmp, path)
+
+
+class PacketArchive:
+    def __init__(self, directory: Path) -> None:
+        self.directory = Path(directory)
+        self._files: dict[int, DayFile] = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, start: int) -> Path:
+        return self.directory / f"packets-{_day_name(start)}.mva"
+
+    def day_files(self, start: int, end: int) -> list[DayFile]:
+        files = []
+        for path in sorted(self.directory.glob("packets-*.mva")):
+            day = int(
+                datetime.strptime(path.stem[len("packets-"):], "%Y-%m-%d")
+                .replace(tzinfo=timezone.utc)
+                .timestamp()
+            )
+            if day + DAY_SECONDS <= start or day >= end:
+                continue
+            with self._lock:
+                cached = self._files.get(day)
+                if cached is None or path.stat().st_mtime_ns != cached.mtime:
+                    cached = DayFile(path)
+                    self._files[day] = cached
+            files.append(cached)
+        return files
+
+    def append_day(self, start: int, columns: dict[str, list]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path_for(start)
+        if path.exists():
+            # Late packets for a day that was already archived.
+            existing = DayFile(path).read(ARCHIVE_COLUMNS)
+            known = set(existing["id"])
+            keep = [index for index, packet_id in enumerate(columns["id"]) if packet_id not in known]
+            columns = {
+                name: existing[name] + [columns[name][index] for index in keep]
+                for name in ARCHIVE_COLUMNS
+            }
+        write_day_file(path, start, columns)
+
+    def _scan(
+        self,
+        start: int,
+        end: int,
+        names: tuple[str, ...],
+        portnums: list[int] | None,
+        channel: int | None,
+        gateway_id: str | None,
+    ):
+        for day in self.day_files(start, end):
+            if not day.may_match(portnums, channel, gateway_id):
+                continue
+            wanted = set(names) | {"created_at"}
+            if portnums:
+                wanted.add("portnum")
+            if channel is not None:
+                wanted.add("channel")
+            if gateway_id:
+                wanted.add("gateway_id")
+            columns = day.read(tuple(wanted))
+            allowed = set(portnums) if portnums else None
+            for index, created_at in enumerate(columns["created_at"]):
+                if created_at is None or created_at < start or created_at >= end:
+                    continue
+                if allowed is not None and columns["portnum"][index] not in allowed:
+                    continue
+                if channel is not None and columns["channel"][index] != channel:
+                    continue
+                if gateway_id and columns["gateway_id"][index] != gateway_id:
+                    continue
+                yield tuple(columns[name][index] for name in names)
+
+    def ports_summary(
+        self,
+        start: int,
+        end: int,
+        channel: int | None = None,
+        gateway_id: str | None = None,
+    ) -> dict[tuple[int, str], list]:
+        totals: dict[tuple[int, str], list] = {}
+
+        def add(portnum, portname, count, last_seen):
+            entry = totals.setdefault((portnum, portname), [0, last_seen])
+            entry[0] += count
+            entry[1] = max(entry[1], last_seen)
+
+        ranges = [(start, end)]
+        if channel is None and not gateway_id:
+            for day in self.day_files(start, end):
+                if self._covers(start, end, day):
+                    for portnum, portname, count, last_seen in day.header["port_counts"]:
+                        add(portnum, portname, count, last_seen)
+            ranges = self._partial_ranges(start, end)
+        for bounds in ranges:
+            for portnum, portname, created_at in self._scan(
+                *bounds, ("portnum", "portname", "created_at"), None, channel, gateway_id
+            ):
+                add(portnum, portname, 1, created_at)
+        return totals
+
+    def channels_summary(
+        self,
+        start: int,
+        end: int,
+        portnums: list[int] | None = None,
+        gateway_id: str | None = None,
+    ) -> dict[int | None, list]:
+        totals: dict[int | None, list] = {}
+
+        def add(channel, count, last_seen):
+            entry = totals.setdefault(channel, [0, last_seen])
+            entry[0] += count
+            entry[1] = max(entry[1], last_seen)
+
+        ranges = [(start, end)]
+        if not portnums and not gateway_id:
+            for day in self.day_files(start, end):
+                if self._covers(start, end, day):
+                    for channel, count, last_seen in day.header["channel_counts"]:
+                        add(channel, count, last_seen)
+            ranges = self._partial_ranges(start, end)
+        for bounds in ranges:
+            for channel, created_at in self._scan(
+                *bounds, ("channel", "created_at"), portnums, None, gateway_id
+            ):
+                add(channel, 1, created_at)
+        return totals
+
+    @staticmethod
+    def _covers(start: int, end: int, day: DayFile) -> bool:
+        return start <= day.header["start"] and day.header["start"] + DAY_SECONDS <= end
+
+    @staticmethod
+    def _partial_ranges(start: int, end: int) -> list[tuple[int, int]]:
+        # The ends of [start, end) not covered by whole days, which are
+        # answered from the file headers instead of scanned.
+        first_full = day_start(start) + (DAY_SECONDS if start % DAY_SECONDS else 0)
+        last_full = day_start(end)
+        if first_full >= last_full:
+            return [(start, end)]
+        return [
+            bounds
+            for bounds in ((start, first_full), (last_full, end))
+            if bounds[0] < bounds[1]
+        ]
+
+
+def archive_packets(
+    conn: sqlite3.Connection,
+    read_conn: sqlite3.Connection,
+    lock: threading.Lock,
+    archive: PacketArchive,
+    before: int,
+    batch_size: int = 5000,
+) -> dict:
+    # Moves whole days older than `before` out of the packets table. Rows are
+    # read without the writer lock (nothing rewrites old packets), written to
+    # the day file, and only then deleted, together with their search index
+    # entries, in short locked batches.
+    stats = {"days": 0, "packets": 0}
+    select = f"SELECT id, {PACKET_COLUMNS} FROM packets WHERE created_at >= ? AND created_at < ? ORDER BY id"
+    while True:
+        oldest = read_conn.execute("SELECT MIN(created_at) FROM packets").fetchone()[0]
+        if oldest is None or day_start(oldest) + DAY_SECONDS > before:
+            break
+        start = day_start(oldest)
+        rows = read_conn.execute(select, (start, start + DAY_SECONDS)).fetchall()
+        columns = {name: [row[index] for row in rows] for index, name in enumerate(ARCHIVE_COLUMNS)}
+        archive.append_day(start, columns)
+        texts = dict(
+            (packet_id, text) for packet_id, text in zip(columns["id"], columns["text"]) if text
+        )
+        ids = columns["id"]
+        for offset in range(0, len(ids), batch_size):
+            chunk = ids[offset:offset + batch_size]
+            with lock:
+                # packets_fts uses external content, so its entries have to be
+                # removed with the original text before the rows go away.
+                conn.executemany(
+                    "INSERT INTO packets_fts (packets_fts, rowid, text) VALUES ('delete', ?, ?)",
+                    [(packet_id, texts[packet_id]) for packet_id in chunk if packet_id in texts],
+                )
+                conn.execute(
+                    f"DELETE FROM packets WHERE id IN ({','.join('?' for _ in chunk)})",
+                    chunk,
+                )
+                conn.commit()
+        stats["days"] += 1
+        stats["packets"] += len(ids)
+        logger.info("archived %d packets from %s", len(ids), _day_name(start))
+    return stats
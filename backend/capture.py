@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+MAGIC = b"MVCAP1\n"
+RECORD_HEADER = struct.Struct("<dHI")
+FLUSH_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+
+class CaptureWriter:
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        self._size = 0
+        self._last_flush = 0.0
+        self._sequence = 0
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _open(self, now: float) -> None:
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now))
+        path = self.directory / f"capture-{stamp}-{self._sequence:04d}.bin"
+        while path.exists():
+            self._sequence += 1
+            path = self.directory / f"capture-{stamp}-{self._sequence:04d}.bin"
+        self._sequence += 1
+        self._file = open(path, "ab", buffering=1024 * 1024)
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+        logger.info("capturing MQTT traffic to %s", path)
+
+    def write(self, topic: str, payload: bytes, received_at: float | None = None) -> None:
+        now = received_at if received_at is not None else time.time()
+        topic_bytes = topic.encode("utf-8")[:0xFFFF]
+        header = RECORD_HEADER.pack(now, len(topic_bytes), len(payload))
+        with self._lock:
+            if self._file is None or self._size >= self.max_bytes:
+                self.close_file()
+                self._open(now)
+            self._file.write(header)
+            self._file.write(topic_bytes)
+            self._file.write(payload)
+            self._size += len(header) + len(topic_bytes) + len(payload)
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                self._file.flush()
+                self._last_flush = now
+
+    def close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self) -> None:
+        with self._lock:
+            self.close_file()
+
+
+def read_capture(path: Path) -> Iterator[tuple[float, str, bytes]]:
+    with open(path, "rb") as handle:
+        magic = handle.read(len(MAGIC))
+        if not magic:
+            return
+        if magic != MAGIC:
+            raise ValueError(f"Not a capture file: {path}")
+        while True:
+            header = handle.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            received_at, topic_len, payload_len = RECORD_HEADER.unpack(header)
+            body = handle.read(topic_len + payload_len)
+            if len(body) < topic_len + payload_len:
+                # Truncated tail from a writer that was killed mid-record.
+                return
+            yield received_at, body[:topic_len].decode("utf-8", errors="replace"), body[topic_len:]
+
+
+def capture_files(paths: Iterable[Path]) -> list[Path]:
+    files: list[Path] = []
+    for path in paths:
+        path = Path(path)
+        if path.is_dir():
+            files.extend(sorted(path.glob("capture-*.bin")))
+        else:
+            files.append(path)
+    return files
+
+
+def iter_captures(paths: Iterable[Path]) -> Iterator[tuple[float, str, bytes]]:
+    for path in capture_files(paths):
+        yield from read_capture(path)
+
+
+def replay(
+    records: Iterable[tuple[float, str, bytes]],
+    handler,
+    speed: float | None = 1.0,
+) -> int:
+    count = 0
+    first_at = None
+    started = time.monotonic()
+    for received_at, topic, payload in records:
+        if speed and speed > 0:
+            if first_at is None:
+                first_at = received_at
+            due = (received_at - first_at) / speed
+            delay = due - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
+        handler(received_at, topic, payload)
+        count += 1
+    return count
+
+
+def _parse_speed(value: str) -> float | None:
+    if value.lower() in {"max", "0"}:
+        return None
+    return float(value.rstrip("xX"))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Replay captured MQTT traffic through the ingest pipeline.")
+    parser.add_argument("paths", nargs="+", type=Path, help="capture files or directories")
+    parser.add_argument("--speed", default="max", help="1 for original pace, 10x for ten times faster, max for no delay")
+    parser.add_argument("--db", type=Path, help="database to write (defaults to DB_PATH)")
+    parser.add_argument("--live-timestamps", action="store_true", help="stamp packets with replay time instead of capture time")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.db is not None:
+        os.environ["DB_PATH"] = str(args.db)
+
+    from . import main as backend_main
+
+    app = backend_main.create_app()
+    backend_main.open_storage(app)
+    config = app.state.config
+    keys_b64 = config.decode_keys_b64 or [config.default_key_b64]
+    stored = 0
+
+    def handle(received_at: float, topic: str, payload: bytes) -> None:
+        nonlocal stored
+        decoded = backend_main._decode_message(
+            topic,
+            payload,
+            keys_b64,
+            received_at=None if args.live_timestamps else received_at,
+        )
+        if decoded is None:
+            return
+        packet_id = backend_main._store_packet(app, decoded)
+        if packet_id is None:
+            return
+        if packet_id == backend_main.THINNED:
+            backend_main._publish_packet(app, decoded, None)
+            return
+        backend_main._publish_packet(app, decoded, packet_id)
+        stored += 1
+
+    started = time.monotonic()
+    count = replay(iter_captures(args.paths), handle, speed=_parse_speed(args.speed))
+    backend_main._flush_pending(app, force=True)
+    elapsed = time.monotonic() - started
+    logger.info(
+        "replayed %d messages (%d stored) in %.1fs (%.0f msg/s)",
+        count,
+        stored,
+        elapsed,
+        count / elapsed if elapsed else 0,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,26 @@ from dataclasses import dataclass
 from pathlib import Path
 
 
+@dataclass(frozen=True)
+class MqttSubscription:
+    broker: str
+    port: int
+    user: str
+    password: str
+    topic: str
+    share_group: str = ""
+
+    @property
+    def subscribe_topic(self) -> str:
+        if self.share_group:
+            return f"$share/{self.share_group}/{self.topic}"
+        return self.topic
+
+    @property
+    def label(self) -> str:
+        return f"{self.broker}:{self.port}/{self.subscribe_topic}"
+
+
 @dataclass(frozen=True)
 class AppConfig:
     mqtt_broker: str
@@ -14,6 +34,22 @@ class AppConfig:
     default_key_b64: str
     decode_keys_b64: list[str]
     db_path: Path
+    position_history: bool = False
+    capture_dir: Path | None = None
+    capture_max_bytes: int = 256 * 1024 * 1024
+    mqtt_client_id: str = "meshviz-decoder"
+    mqtt_subscriptions: tuple[MqttSubscription, ...] = ()
+    store_thin: tuple[tuple[str, int], ...] = ()
+    store_thin_mode: str = "pressure"
+    store_thin_queue: int = 5000
+    archive_dir: Path | None = None
+    archive_after_days: int = 8
+
+
+def _parse_bool(value: str | None, default: bool = False) -> bool:
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in {"1", "true", "yes", "on"}
 
 
 def _clean_value(value: str) -> str:
@@ -25,6 +61,53 @@ def _clean_value(value: str) -> str:
     return value
 
 
+def _normalize_topic(topic: str) -> str:
+    topic = topic.strip()
+    if topic.endswith("#/"):
+        topic = topic[:-2] + "#"
+    return topic.rstrip("/")
+
+
+def _parse_topics(value: str) -> list[str]:
+    return [_normalize_topic(item) for item in value.split(",") if item.strip()]
+
+
+def _parse_thin(value: str) -> tuple[tuple[str, int], ...]:
+    intervals = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, seconds = item.partition(":")
+        intervals.append((name.strip(), int(seconds or "0")))
+    return tuple(intervals)
+
+
+def _parse_subscriptions(raw: dict[str, str]) -> tuple[MqttSubscription, ...]:
+    subscriptions = []
+    share_group = raw.get("MQTT_SHARE_GROUP", "")
+    index = 1
+    while True:
+        suffix = "" if index == 1 else f"_{index}"
+        broker = raw.get(f"MQTT_BROKER{suffix}")
+        if broker is None:
+            if index > 1:
+                break
+            broker = "localhost"
+        for topic in _parse_topics(raw.get(f"MQTT_TOPIC{suffix}", "msh/#")):
+            subscriptions.append(
+                MqttSubscription(
+                    broker=broker,
+                    port=int(raw.get(f"MQTT_PORT{suffix}", "1883")),
+                    user=raw.get(f"MQTT_USER{suffix}", ""),
+                    password=raw.get(f"MQTT_PASS{suffix}", ""),
+                    topic=topic,
+                    share_group=raw.get(f"MQTT_SHARE_GROUP{suffix}", share_group),
+                )
+            )
+        index += 1
+    return tuple(subscriptions)
+
+
 def load_config(path: Path, db_path: Path) -> AppConfig:
     raw: dict[str, str] = {}
     if not path.exists():
@@ -39,10 +122,7 @@ def load_config(path: Path, db_path: Path) -> AppConfig:
         key, value = stripped.split("=", 1)
         raw[key.strip()] = _clean_value(value)
 
-    mqtt_topic = raw.get("MQTT_TOPIC", "msh/#")
-    if mqtt_topic.endswith("#/"):
-        mqtt_topic = mqtt_topic[:-2] + "#"
-    mqtt_topic = mqtt_topic.rstrip("/")
+    mqtt_topic = ",".join(_parse_topics(raw.get("MQTT_TOPIC", "msh/#")))
 
     default_key = raw.get("DEFAULT_KEY", "AQ==")
     raw_keys = raw.get("DECODE_KEYS", "")
@@ -63,4 +143,17 @@ def load_config(path: Path, db_path: Path) -> AppConfig:
         default_key_b64=default_key,
         decode_keys_b64=combined_keys,
         db_path=db_path,
+        position_history=_parse_bool(raw.get("POSITION_HISTORY")),
+        capture_dir=Path(raw["CAPTURE_DIR"]) if raw.get("CAPTURE_DIR") else None,
+        capture_max_bytes=int(raw.get("CAPTURE_MAX_MB", "256")) * 1024 * 1024,
+        mqtt_client_id=raw.get("MQTT_CLIENT_ID", "meshviz-decoder"),
+        mqtt_subscriptions=_parse_subscriptions(raw),
+        store_thin=_parse_thin(
+            raw.get("STORE_THIN", "POSITION_APP:30,TELEMETRY_APP:60,MAP_REPORT_APP:300")
+        ),
+        store_thin_mode=raw.get("STORE_THIN_MODE", "pressure").strip().lower(),
+        store_thin_queue=int(raw.get("STORE_THIN_QUEUE", "5000")),
+        archive_dir=Path(raw["ARCHIVE_DIR"]) if raw.get("ARCHIVE_DIR") else None,
+        # Never below the 7-day window the live endpoints query.
+        archive_after_days=max(int(raw.get("ARCHIVE_AFTER_DAYS", "8")), 8),
     )
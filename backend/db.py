@@ -1,11 +1,19 @@
 from __future__ import annotations
 
+import os
+import re
 import sqlite3
+import threading
 import time
 from pathlib import Path
 
+from .metrics import DB_INSERT
+from .packet import PacketRecord
+from .profiling import ProfiledConnection
+
 
 SCHEMA = """
+PRAGMA auto_vacuum = INCREMENTAL;
 PRAGMA journal_mode = WAL;
 
 CREATE TABLE IF NOT EXISTS packets (
@@ -35,12 +43,180 @@ CREATE TABLE IF NOT EXISTS nodes (
     last_seen INTEGER
 );
 
+CREATE TABLE IF NOT EXISTS node_positions (
+    node_id INTEGER PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    altitude REAL,
+    packet_id INTEGER,
+    updated_at INTEGER
+);
+
+CREATE TABLE IF NOT EXISTS node_position_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    node_id INTEGER NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    altitude REAL,
+    packet_id INTEGER,
+    created_at INTEGER
+);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS node_positions_rtree USING rtree (
+    node_id,
+    min_lat, max_lat,
+    min_lon, max_lon
+);
+
+CREATE TABLE IF NOT EXISTS telemetry_samples (
+    node_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (node_id, metric, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS telemetry_rollups (
+    node_id INTEGER NOT NULL,
+    metric TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    sum REAL NOT NULL,
+    min REAL NOT NULL,
+    max REAL NOT NULL,
+    PRIMARY KEY (node_id, metric, step, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS node_adjacency (
+    node_id INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    peer_id INTEGER NOT NULL,
+    portnum INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    last_seen INTEGER,
+    PRIMARY KEY (node_id, bucket, peer_id, portnum)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS traffic_rollups (
+    step INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    portnum INTEGER NOT NULL,
+    channel INTEGER NOT NULL,
+    gateway_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    rssi_count INTEGER NOT NULL,
+    rssi_sum REAL NOT NULL,
+    rssi_min INTEGER,
+    rssi_max INTEGER,
+    snr_count INTEGER NOT NULL,
+    snr_sum REAL NOT NULL,
+    snr_min REAL,
+    snr_max REAL,
+    PRIMARY KEY (step, bucket, portnum, channel, gateway_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS node_traffic_rollups (
+    step INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    node_id INTEGER NOT NULL,
+    portnum INTEGER NOT NULL,
+    channel INTEGER NOT NULL,
+    gateway_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    rssi_count INTEGER NOT NULL,
+    rssi_sum REAL NOT NULL,
+    rssi_min INTEGER,
+    rssi_max INTEGER,
+    snr_count INTEGER NOT NULL,
+    snr_sum REAL NOT NULL,
+    snr_min REAL,
+    snr_max REAL,
+    PRIMARY KEY (step, bucket, node_id, portnum, channel, gateway_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS metric_sketches (
+    step INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    nodes BLOB NOT NULL,
+    senders TEXT NOT NULL,
+    gateways TEXT NOT NULL,
+    channels TEXT NOT NULL,
+    PRIMARY KEY (step, bucket)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS gateway_reception (
+    gateway_id TEXT NOT NULL,
+    node_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    first_heard INTEGER NOT NULL,
+    last_heard INTEGER NOT NULL,
+    rssi_count INTEGER NOT NULL,
+    rssi_sum REAL NOT NULL,
+    rssi_best INTEGER,
+    snr_count INTEGER NOT NULL,
+    snr_sum REAL NOT NULL,
+    snr_best REAL,
+    hops_count INTEGER NOT NULL,
+    hops_sum INTEGER NOT NULL,
+    hops_min INTEGER,
+    PRIMARY KEY (gateway_id, node_id)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS gateway_stats (
+    gateway_id TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    nodes INTEGER NOT NULL,
+    first_heard INTEGER NOT NULL,
+    last_heard INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS graph_layout (
+    node_id INTEGER PRIMARY KEY,
+    x REAL NOT NULL,
+    y REAL NOT NULL,
+    updated_at INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS packet_thinning (
+    bucket INTEGER NOT NULL,
+    portnum INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (bucket, portnum)
+) WITHOUT ROWID;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS packets_fts USING fts5 (
+    text,
+    content = 'packets',
+    content_rowid = 'id',
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+
 CREATE INDEX IF NOT EXISTS idx_packets_time ON packets (created_at DESC);
 CREATE INDEX IF NOT EXISTS idx_packets_port ON packets (portnum);
 CREATE INDEX IF NOT EXISTS idx_packets_from_to ON packets (from_id, to_id);
+CREATE INDEX IF NOT EXISTS idx_packets_to_time ON packets (to_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_node_positions_updated ON node_positions (updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_gateway_reception_node ON gateway_reception (node_id);
+CREATE INDEX IF NOT EXISTS idx_position_history_node ON node_position_history (node_id, created_at DESC);
 """
 
 BROADCAST_ID = 0xFFFFFFFF
+POSITION_PORTNUM = 3
+TELEMETRY_ROLLUP_STEPS = (60, 900, 3600)
+ADJACENCY_BUCKET_SECONDS = 300
+TRAFFIC_ROLLUP_STEPS = (60, 300, 3600)
+NODE_TRAFFIC_ROLLUP_STEPS = (300, 3600)
+# Rollup keys cannot be NULL, so missing values are stored as these.
+NO_PORTNUM = -1
+NO_CHANNEL = -1
+NO_GATEWAY = ""
+TIMELINE_GROUPS = {
+    "portnum": "portnum",
+    "channel": "channel",
+    "gateway": "gateway_id",
+    "node": "node_id",
+}
 
 
 def _build_packet_conditions(
@@ -76,25 +252,69 @@ def _where_clause(conditions: list[str]) -> str:
     return f"WHERE {' AND '.join(conditions)}"
 
 
+def _tune(conn: sqlite3.Connection) -> None:
+    conn.execute("PRAGMA busy_timeout = 5000")
+    conn.execute(f"PRAGMA cache_size = -{int(os.environ.get('SQLITE_CACHE_MB', '64')) * 1024}")
+    conn.execute(f"PRAGMA mmap_size = {int(os.environ.get('SQLITE_MMAP_MB', '256')) * 1024 * 1024}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
 def connect(db_path: Path) -> sqlite3.Connection:
     db_path.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn = sqlite3.connect(str(db_path), check_same_thread=False, factory=ProfiledConnection)
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA busy_timeout = 5000")
+    _tune(conn)
     conn.executescript(SCHEMA)
+    # Safe with WAL: a power loss can drop the last commits but never corrupts.
+    conn.execute("PRAGMA synchronous = NORMAL")
     return conn
 
 
 def connect_read(db_path: Path) -> sqlite3.Connection:
-    conn = sqlite3.connect(str(db_path), check_same_thread=False)
+    conn = sqlite3.connect(str(db_path), check_same_thread=False, factory=ProfiledConnection)
     conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA busy_timeout = 5000")
+    _tune(conn)
     conn.execute("PRAGMA query_only = TRUE")
     return conn
 
 
-def insert_packet(conn: sqlite3.Connection, packet: dict) -> int:
-    payload = (
+SCHEMA_TABLES = frozenset(re.findall(r"CREATE (?:VIRTUAL )?TABLE IF NOT EXISTS (\w+)", SCHEMA))
+
+
+def schema_ready(conn: sqlite3.Connection) -> bool:
+    # Read-only processes cannot create tables; they wait until every table
+    # in SCHEMA exists, which means a writer has run connect() on this build.
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    return SCHEMA_TABLES <= names
+
+
+PACKET_COLUMNS = (
+    "rx_time, from_id, to_id, portnum, portname, payload_b64, text, details_json, "
+    "rssi, snr, hop_limit, hop_start, via_mqtt, channel, gateway_id, created_at"
+)
+
+
+def _packet_row(packet: dict | PacketRecord) -> tuple:
+    if isinstance(packet, PacketRecord):
+        return (
+            packet.rx_time,
+            packet.from_id,
+            packet.to_id,
+            packet.portnum,
+            packet.portname,
+            packet.payload_b64,
+            packet.text,
+            packet.details_json,
+            packet.rssi,
+            packet.snr,
+            packet.hop_limit,
+            packet.hop_start,
+            int(packet.via_mqtt) if packet.via_mqtt is not None else None,
+            packet.channel,
+            packet.gateway_id,
+            packet.created_at,
+        )
+    return (
         packet.get("rx_time"),
         packet.get("from_id"),
         packet.get("to_id"),
@@ -112,16 +332,120 @@ def insert_packet(conn: sqlite3.Connection, packet: dict) -> int:
         packet.get("gateway_id"),
         packet.get("created_at"),
     )
+
+
+def insert_packet(conn: sqlite3.Connection, packet: dict | PacketRecord) -> int:
+    started = time.perf_counter()
     cursor = conn.execute(
+        f"""
+        INSERT INTO packets ({PACKET_COLUMNS})
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        _packet_row(packet),
+    )
+    packet_id = cursor.lastrowid
+    if packet.get("text"):
+        conn.execute(
+            "INSERT INTO packets_fts (rowid, text) VALUES (?, ?)",
+            (packet_id, packet["text"]),
+        )
+    DB_INSERT.observe(time.perf_counter() - started)
+    return packet_id
+
+
+def insert_packets_bulk(conn: sqlite3.Connection, packets: list[dict | PacketRecord]) -> None:
+    conn.executemany(
+        f"""
+        INSERT INTO packets ({PACKET_COLUMNS})
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        [_packet_row(packet) for packet in packets],
+    )
+
+
+def insert_telemetry_samples(
+    conn: sqlite3.Connection,
+    samples: list[tuple[int, str, int, float]],
+) -> None:
+    conn.executemany(
+        """
+        INSERT OR REPLACE INTO telemetry_samples (node_id, metric, ts, value)
+        VALUES (?, ?, ?, ?)
+        """,
+        samples,
+    )
+
+
+def update_node_names(
+    conn: sqlite3.Connection,
+    names: dict[int, tuple[str | None, str | None]],
+) -> None:
+    conn.executemany(
         """
-        INSERT INTO packets (
-            rx_time, from_id, to_id, portnum, portname, payload_b64, text, details_json,
-            rssi, snr, hop_limit, hop_start, via_mqtt, channel, gateway_id, created_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT INTO nodes (node_id, long_name, short_name)
+        VALUES (?, ?, ?)
+        ON CONFLICT(node_id) DO UPDATE SET
+            long_name = COALESCE(excluded.long_name, nodes.long_name),
+            short_name = COALESCE(excluded.short_name, nodes.short_name)
         """,
-        payload,
+        [(node_id, long_name, short_name) for node_id, (long_name, short_name) in names.items()],
+    )
+
+
+def drop_packet_indexes(conn: sqlite3.Connection) -> list[str]:
+    names = [
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'packets' AND sql IS NOT NULL"
+        ).fetchall()
+    ]
+    for name in names:
+        conn.execute(f'DROP INDEX IF EXISTS "{name}"')
+    return names
+
+
+def rebuild_derived_tables(conn: sqlite3.Connection) -> None:
+    conn.executescript(SCHEMA)
+    conn.execute("INSERT INTO packets_fts (packets_fts) VALUES ('rebuild')")
+    conn.execute("DELETE FROM node_adjacency")
+    conn.execute("DELETE FROM node_positions")
+    conn.execute("DELETE FROM node_positions_rtree")
+    conn.execute(
+        """
+        INSERT INTO nodes (node_id, last_seen)
+        SELECT node_id, MAX(created_at) FROM (
+            SELECT from_id AS node_id, created_at FROM packets WHERE from_id IS NOT NULL
+            UNION ALL
+            SELECT to_id AS node_id, created_at FROM packets WHERE to_id IS NOT NULL
+        )
+        GROUP BY node_id
+        ON CONFLICT(node_id) DO UPDATE SET
+            last_seen = MAX(COALESCE(nodes.last_seen, 0), excluded.last_seen)
+        """
+    )
+    conn.execute("DELETE FROM telemetry_rollups")
+    steps = " UNION ALL ".join(f"SELECT {step} AS step" for step in TELEMETRY_ROLLUP_STEPS)
+    conn.execute(
+        f"""
+        INSERT INTO telemetry_rollups (node_id, metric, step, bucket, count, sum, min, max)
+        SELECT s.node_id, s.metric, steps.step, s.ts - s.ts % steps.step,
+            COUNT(*), SUM(s.value), MIN(s.value), MAX(s.value)
+        FROM telemetry_samples s, ({steps}) AS steps
+        GROUP BY s.node_id, s.metric, steps.step, s.ts - s.ts % steps.step
+        """
     )
-    return cursor.lastrowid
+    conn.commit()
+    backfill_node_adjacency(conn)
+    backfill_node_positions(conn)
+    conn.execute("DELETE FROM traffic_rollups")
+    conn.execute("DELETE FROM node_traffic_rollups")
+    backfill_traffic_rollups(conn)
+    # Rebuilt from packets by the next writer start.
+    conn.execute("DELETE FROM metric_sketches")
+    conn.execute("DELETE FROM gateway_reception")
+    conn.execute("DELETE FROM gateway_stats")
+    conn.commit()
+    backfill_gateway_reception(conn)
 
 
 def touch_node(conn: sqlite3.Connection, node_id: int | None) -> None:
@@ -153,6 +477,863 @@ def update_node(conn: sqlite3.Connection, node_id: int, long_name: str | None, s
     )
 
 
+def _valid_position(latitude: object, longitude: object) -> bool:
+    if not isinstance(latitude, (int, float)) or not isinstance(longitude, (int, float)):
+        return False
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        return False
+    return not (latitude == 0 and longitude == 0)
+
+
+def backfill_text_index(conn: sqlite3.Connection) -> int:
+    # Reading packets_fts itself goes through to the packets content table, so
+    # only the docsize shadow table says whether anything has been indexed.
+    existing = conn.execute("SELECT 1 FROM packets_fts_docsize LIMIT 1").fetchone()
+    if existing is not None:
+        return 0
+    cursor = conn.execute(
+        """
+        INSERT INTO packets_fts (rowid, text)
+        SELECT id, text FROM packets
+        WHERE text IS NOT NULL AND text != ''
+        """
+    )
+    conn.commit()
+    return cursor.rowcount
+
+
+def _fts_query(query: str) -> str | None:
+    terms = []
+    for token in query.split():
+        prefix = token.endswith("*")
+        token = token.rstrip("*").replace('"', '""')
+        if not token:
+            continue
+        terms.append(f'"{token}"*' if prefix else f'"{token}"')
+    return " ".join(terms) or None
+
+
+def search_text(
+    conn: sqlite3.Connection,
+    query: str,
+    limit: int,
+    offset: int = 0,
+    window_seconds: int | None = None,
+    channel: int | None = None,
+    node_id: int | None = None,
+    gateway_id: str | None = None,
+) -> list[dict]:
+    match = _fts_query(query)
+    if match is None:
+        return []
+    conditions, params = _build_packet_conditions(
+        "p", window_seconds, None, channel, gateway_id
+    )
+    conditions.insert(0, "packets_fts MATCH ?")
+    params.insert(0, match)
+    if node_id is not None:
+        conditions.append("(p.from_id = ? OR p.to_id = ?)")
+        params.extend([node_id, node_id])
+    where = _where_clause(conditions)
+    params.extend([limit, offset])
+    rows = conn.execute(
+        f"""
+        SELECT
+            p.*,
+            snippet(packets_fts, 0, '[', ']', '...', 16) AS snippet,
+            bm25(packets_fts) AS rank
+        FROM packets_fts
+        JOIN packets p ON p.id = packets_fts.rowid
+        {where}
+        ORDER BY rank, p.created_at DESC
+        LIMIT ? OFFSET ?
+        """,
+        params,
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def update_node_position(
+    conn: sqlite3.Connection,
+    node_id: int | None,
+    latitude: float | None,
+    longitude: float | None,
+    altitude: float | None,
+    timestamp: int,
+    packet_id: int | None = None,
+    keep_history: bool = False,
+) -> bool:
+    if node_id is None or not _valid_position(latitude, longitude):
+        return False
+    if not isinstance(altitude, (int, float)):
+        altitude = None
+    cursor = conn.execute(
+        """
+        INSERT INTO node_positions (node_id, latitude, longitude, altitude, packet_id, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(node_id) DO UPDATE SET
+            latitude = excluded.latitude,
+            longitude = excluded.longitude,
+            altitude = COALESCE(excluded.altitude, node_positions.altitude),
+            packet_id = excluded.packet_id,
+            updated_at = excluded.updated_at
+        WHERE excluded.updated_at >= node_positions.updated_at
+        """,
+        (node_id, latitude, longitude, altitude, packet_id, timestamp),
+    )
+    if cursor.rowcount:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO node_positions_rtree (node_id, min_lat, max_lat, min_lon, max_lon)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (node_id, latitude, latitude, longitude, longitude),
+        )
+    if keep_history:
+        conn.execute(
+            """
+            INSERT INTO node_position_history (node_id, latitude, longitude, altitude, packet_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (node_id, latitude, longitude, altitude, packet_id, timestamp),
+        )
+    return True
+
+
+def backfill_node_positions(conn: sqlite3.Connection) -> int:
+    existing = conn.execute("SELECT 1 FROM node_positions LIMIT 1").fetchone()
+    if existing is not None:
+        return 0
+    rows = conn.execute(
+        """
+        SELECT
+            from_id,
+            json_extract(details_json, '$.latitude') AS latitude,
+            json_extract(details_json, '$.longitude') AS longitude,
+            json_extract(details_json, '$.altitude') AS altitude,
+            id,
+            MAX(created_at) AS created_at
+        FROM packets
+        WHERE portnum = ?
+            AND from_id IS NOT NULL
+            AND json_extract(details_json, '$.latitude') IS NOT NULL
+            AND json_extract(details_json, '$.longitude') IS NOT NULL
+        GROUP BY from_id
+        """,
+        (POSITION_PORTNUM,),
+    ).fetchall()
+    count = 0
+    for row in rows:
+        if update_node_position(
+            conn,
+            row["from_id"],
+            row["latitude"],
+            row["longitude"],
+            row["altitude"],
+            row["created_at"],
+            packet_id=row["id"],
+        ):
+            count += 1
+    conn.commit()
+    return count
+
+
+def fetch_positions(
+    conn: sqlite3.Connection,
+    window_seconds: int | None = None,
+    bbox: tuple[float, float, float, float] | None = None,
+    limit: int | None = None,
+) -> list[dict]:
+    conditions: list[str] = []
+    params: list[object] = []
+    join = ""
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        join = "JOIN node_positions_rtree r ON r.node_id = np.node_id"
+        conditions.extend(
+            [
+                "r.max_lat >= ?",
+                "r.min_lat <= ?",
+                "r.max_lon >= ?",
+                "r.min_lon <= ?",
+                "np.latitude BETWEEN ? AND ?",
+                "np.longitude BETWEEN ? AND ?",
+            ]
+        )
+        params.extend([min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon])
+    if window_seconds is not None:
+        conditions.append("np.updated_at >= ?")
+        params.append(int(time.time()) - window_seconds)
+    where = _where_clause(conditions)
+    sql = f"""
+        SELECT
+            np.node_id,
+            np.latitude,
+            np.longitude,
+            np.altitude,
+            np.updated_at,
+            n.long_name,
+            n.short_name,
+            n.last_seen
+        FROM node_positions np
+        {join}
+        LEFT JOIN nodes n ON n.node_id = np.node_id
+        {where}
+        ORDER BY np.updated_at DESC
+    """
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    rows = conn.execute(sql, params).fetchall()
+    return [dict(row) for row in rows]
+
+
+def fetch_position_history(
+    conn: sqlite3.Connection,
+    node_id: int,
+    window_seconds: int,
+    limit: int,
+) -> list[dict]:
+    cutoff = int(time.time()) - window_seconds
+    rows = conn.execute(
+        """
+        SELECT latitude, longitude, altitude, packet_id, created_at
+        FROM node_position_history
+        WHERE node_id = ? AND created_at >= ?
+        ORDER BY created_at DESC
+        LIMIT ?
+        """,
+        (node_id, cutoff, limit),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def insert_telemetry(
+    conn: sqlite3.Connection,
+    node_id: int | None,
+    metrics: dict[str, float],
+    timestamp: int,
+) -> None:
+    if node_id is None or not metrics:
+        return
+    # Callers drop gateway copies of a report. A sample already stored under
+    # the same key is skipped rather than rolled up twice.
+    existing = {
+        row[0]
+        for row in conn.execute(
+            f"""
+            SELECT metric FROM telemetry_samples
+            WHERE node_id = ? AND metric IN ({','.join('?' for _ in metrics)}) AND ts = ?
+            """,
+            (node_id, *metrics, timestamp),
+        )
+    }
+    metrics = {metric: value for metric, value in metrics.items() if metric not in existing}
+    if not metrics:
+        return
+    conn.executemany(
+        """
+        INSERT INTO telemetry_samples (node_id, metric, ts, value)
+        VALUES (?, ?, ?, ?)
+        """,
+        [(node_id, metric, timestamp, value) for metric, value in metrics.items()],
+    )
+    conn.executemany(
+        """
+        INSERT INTO telemetry_rollups (node_id, metric, step, bucket, count, sum, min, max)
+        VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+        ON CONFLICT(node_id, metric, step, bucket) DO UPDATE SET
+            count = telemetry_rollups.count + 1,
+            sum = telemetry_rollups.sum + excluded.sum,
+            min = MIN(telemetry_rollups.min, excluded.min),
+            max = MAX(telemetry_rollups.max, excluded.max)
+        """,
+        [
+            (node_id, metric, step, timestamp - timestamp % step, value, value, value)
+            for metric, value in metrics.items()
+            for step in TELEMETRY_ROLLUP_STEPS
+        ],
+    )
+
+
+def telemetry_rollup_step(window_seconds: int, step: int | None, max_points: int = 500) -> int:
+    # Both window edges can fall inside a bucket, so leave room for one extra.
+    step = max(step or 0, -(-window_seconds // (max_points - 1)))
+    for candidate in TELEMETRY_ROLLUP_STEPS:
+        if step <= candidate:
+            return candidate
+    coarsest = TELEMETRY_ROLLUP_STEPS[-1]
+    return -(-step // coarsest) * coarsest
+
+
+def fetch_telemetry_metrics(conn: sqlite3.Connection, node_id: int) -> list[dict]:
+    rows = conn.execute(
+        """
+        SELECT metric, SUM(count) AS count, MAX(bucket) AS last_bucket
+        FROM telemetry_rollups
+        WHERE node_id = ? AND step = ?
+        GROUP BY metric
+        ORDER BY metric
+        """,
+        (node_id, TELEMETRY_ROLLUP_STEPS[-1]),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def fetch_telemetry_series(
+    conn: sqlite3.Connection,
+    node_id: int,
+    metric: str,
+    window_seconds: int,
+    step: int | None = None,
+) -> tuple[int, list[dict]]:
+    # A stored step, or a whole number of the coarsest one.
+    step = telemetry_rollup_step(window_seconds, step)
+    rollup_step = min(step, TELEMETRY_ROLLUP_STEPS[-1])
+    cutoff = int(time.time()) - window_seconds
+    cutoff -= cutoff % step
+    rows = conn.execute(
+        """
+        SELECT
+            (bucket / ?) * ? AS ts,
+            SUM(count) AS count,
+            SUM(sum) / SUM(count) AS avg,
+            MIN(min) AS min,
+            MAX(max) AS max
+        FROM telemetry_rollups
+        WHERE node_id = ? AND metric = ? AND step = ? AND bucket >= ?
+        GROUP BY 1
+        ORDER BY 1
+        """,
+        (step, step, node_id, metric, rollup_step, cutoff),
+    ).fetchall()
+    return step, [dict(row) for row in rows]
+
+
+def record_adjacency(
+    conn: sqlite3.Connection,
+    from_id: int | None,
+    to_id: int | None,
+    portnum: int | None,
+    timestamp: int,
+) -> None:
+    if from_id is None or to_id is None or portnum is None:
+        return
+    bucket = timestamp - timestamp % ADJACENCY_BUCKET_SECONDS
+    rows = [(from_id, bucket, to_id, portnum, timestamp)]
+    if to_id != from_id:
+        rows.append((to_id, bucket, from_id, portnum, timestamp))
+    conn.executemany(
+        """
+        INSERT INTO node_adjacency (node_id, bucket, peer_id, portnum, count, last_seen)
+        VALUES (?, ?, ?, ?, 1, ?)
+        ON CONFLICT(node_id, bucket, peer_id, portnum) DO UPDATE SET
+            count = node_adjacency.count + 1,
+            last_seen = MAX(node_adjacency.last_seen, excluded.last_seen)
+        """,
+        rows,
+    )
+
+
+def _traffic_upsert(table: str, keys: tuple[str, ...]) -> str:
+    key_list = ", ".join(keys)
+    extremes = ",\n".join(
+        f"{column}_{kind} = {kind.upper()}(COALESCE({table}.{column}_{kind}, excluded.{column}_{kind}), "
+        f"COALESCE(excluded.{column}_{kind}, {table}.{column}_{kind}))"
+        for column in ("rssi", "snr")
+        for kind in ("min", "max")
+    )
+    return f"""
+        INSERT INTO {table} (
+            step, bucket, {key_list}, count,
+            rssi_count, rssi_sum, rssi_min, rssi_max,
+            snr_count, snr_sum, snr_min, snr_max
+        )
+        VALUES (?, ?, {", ".join("?" for _ in keys)}, 1, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(step, bucket, {key_list}) DO UPDATE SET
+            count = {table}.count + 1,
+            rssi_count = {table}.rssi_count + excluded.rssi_count,
+            rssi_sum = {table}.rssi_sum + excluded.rssi_sum,
+            snr_count = {table}.snr_count + excluded.snr_count,
+            snr_sum = {table}.snr_sum + excluded.snr_sum,
+            {extremes}
+    """
+
+
+TRAFFIC_UPSERT = _traffic_upsert("traffic_rollups", ("portnum", "channel", "gateway_id"))
+NODE_TRAFFIC_UPSERT = _traffic_upsert(
+    "node_traffic_rollups", ("node_id", "portnum", "channel", "gateway_id")
+)
+
+
+def record_traffic(conn: sqlite3.Connection, packet: dict | PacketRecord, timestamp: int) -> None:
+    rssi = packet.get("rssi")
+    snr = packet.get("snr")
+    signal = (
+        int(rssi is not None), rssi or 0, rssi, rssi,
+        int(snr is not None), snr or 0, snr, snr,
+    )
+    keys = (
+        NO_PORTNUM if packet.get("portnum") is None else packet.get("portnum"),
+        NO_CHANNEL if packet.get("channel") is None else packet.get("channel"),
+        packet.get("gateway_id") or NO_GATEWAY,
+    )
+    conn.executemany(
+        TRAFFIC_UPSERT,
+        [(step, timestamp - timestamp % step, *keys, *signal) for step in TRAFFIC_ROLLUP_STEPS],
+    )
+    node_id = packet.get("from_id")
+    if node_id is not None:
+        conn.executemany(
+            NODE_TRAFFIC_UPSERT,
+            [
+                (step, timestamp - timestamp % step, node_id, *keys, *signal)
+                for step in NODE_TRAFFIC_ROLLUP_STEPS
+            ],
+        )
+
+
+def backfill_traffic_rollups(conn: sqlite3.Connection) -> int:
+    existing = conn.execute("SELECT 1 FROM traffic_rollups LIMIT 1").fetchone()
+    if existing is not None:
+        return 0
+    aggregates = """
+        COUNT(*), COUNT(rssi), COALESCE(SUM(rssi), 0), MIN(rssi), MAX(rssi),
+        COUNT(snr), COALESCE(SUM(snr), 0), MIN(snr), MAX(snr)
+    """
+    keys = (
+        f"COALESCE(portnum, {NO_PORTNUM}), COALESCE(channel, {NO_CHANNEL}), "
+        f"COALESCE(gateway_id, '{NO_GATEWAY}')"
+    )
+    total = 0
+    for table, steps, node_key, where in (
+        ("traffic_rollups", TRAFFIC_ROLLUP_STEPS, "", ""),
+        ("node_traffic_rollups", NODE_TRAFFIC_ROLLUP_STEPS, "from_id, ", "AND from_id IS NOT NULL"),
+    ):
+        columns = "node_id, " if node_key else ""
+        for step in steps:
+            cursor = conn.execute(
+                f"""
+                INSERT INTO {table} (
+                    step, bucket, {columns}portnum, channel, gateway_id, count,
+                    rssi_count, rssi_sum, rssi_min, rssi_max,
+                    snr_count, snr_sum, snr_min, snr_max
+                )
+                SELECT ?, created_at - created_at % ?, {node_key}{keys}, {aggregates}
+                FROM packets
+                WHERE created_at IS NOT NULL {where}
+                GROUP BY created_at - created_at % ?, {node_key}{keys}
+                """,
+                (step, step, step),
+            )
+            total += cursor.rowcount
+    conn.commit()
+    return total
+
+
+# Timeline and telemetry windows stop at 7 days, and 1-minute buckets are
+# only used for windows up to about a day and a half.
+TRAFFIC_ROLLUP_RETENTION = {60: 2 * 86400, 300: 8 * 86400, 3600: 8 * 86400}
+NODE_TRAFFIC_ROLLUP_RETENTION = {300: 8 * 86400, 3600: 8 * 86400}
+TELEMETRY_ROLLUP_RETENTION = {60: 2 * 86400, 900: 8 * 86400, 3600: 8 * 86400}
+TELEMETRY_SAMPLE_RETENTION = 8 * 86400
+ADJACENCY_RETENTION = 8 * 86400
+# Thinned counts fill in every timeline window the traffic rollups can serve.
+THINNING_RETENTION = max(TRAFFIC_ROLLUP_RETENTION.values())
+
+
+def prune_expired(
+    conn: sqlite3.Connection,
+    lock: threading.Lock,
+    now: int | None = None,
+    batch_nodes: int = 200,
+) -> dict[str, int]:
+    now = int(time.time()) if now is None else now
+    deleted = dict.fromkeys(
+        (
+            "traffic_rollups",
+            "node_traffic_rollups",
+            "telemetry_samples",
+            "telemetry_rollups",
+            "node_adjacency",
+            "packet_thinning",
+        ),
+        0,
+    )
+    with lock:
+        for table, retention in (
+            ("traffic_rollups", TRAFFIC_ROLLUP_RETENTION),
+            ("node_traffic_rollups", NODE_TRAFFIC_ROLLUP_RETENTION),
+        ):
+            for step, seconds in retention.items():
+                deleted[table] += conn.execute(
+                    f"DELETE FROM {table} WHERE step = ? AND bucket < ?", (step, now - seconds)
+                ).rowcount
+        deleted["packet_thinning"] += conn.execute(
+            "DELETE FROM packet_thinning WHERE bucket < ?", (now - THINNING_RETENTION,)
+        ).rowcount
+        conn.commit()
+        node_ids = [row[0] for row in conn.execute("SELECT node_id FROM nodes")]
+    # Telemetry and adjacency keys start with node_id, so deleting node by node
+    # stays on the primary key, and batches keep each hold of the writer lock short.
+    rollup_expired = " OR ".join("(step = ? AND bucket < ?)" for _ in TELEMETRY_ROLLUP_RETENTION)
+    rollup_cutoffs = [
+        value for step, seconds in TELEMETRY_ROLLUP_RETENTION.items() for value in (step, now - seconds)
+    ]
+    for start in range(0, len(node_ids), batch_nodes):
+        with lock:
+            for node_id in node_ids[start : start + batch_nodes]:
+                deleted["telemetry_samples"] += conn.execute(
+                    "DELETE FROM telemetry_samples WHERE node_id = ? AND ts < ?",
+                    (node_id, now - TELEMETRY_SAMPLE_RETENTION),
+                ).rowcount
+                deleted["telemetry_rollups"] += conn.execute(
+                    f"DELETE FROM telemetry_rollups WHERE node_id = ? AND ({rollup_expired})",
+                    (node_id, *rollup_cutoffs),
+                ).rowcount
+                deleted["node_adjacency"] += conn.execute(
+                    "DELETE FROM node_adjacency WHERE node_id = ? AND bucket < ?",
+                    (node_id, now - ADJACENCY_RETENTION),
+                ).rowcount
+            conn.commit()
+    return deleted
+
+
+RECEPTION_UPSERT = """
+    INSERT INTO gateway_reception (
+        gateway_id, node_id, count, first_heard, last_heard,
+        rssi_count, rssi_sum, rssi_best, snr_count, snr_sum, snr_best,
+        hops_count, hops_sum, hops_min
+    )
+    VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (gateway_id, node_id) DO UPDATE SET
+        count = gateway_reception.count + 1,
+        first_heard = MIN(gateway_reception.first_heard, excluded.first_heard),
+        last_heard = MAX(gateway_reception.last_heard, excluded.last_heard),
+        rssi_count = gateway_reception.rssi_count + excluded.rssi_count,
+        rssi_sum = gateway_reception.rssi_sum + excluded.rssi_sum,
+        rssi_best = COALESCE(
+            MAX(gateway_reception.rssi_best, excluded.rssi_best),
+            gateway_reception.rssi_best,
+            excluded.rssi_best
+        ),
+        snr_count = gateway_reception.snr_count + excluded.snr_count,
+        snr_sum = gateway_reception.snr_sum + excluded.snr_sum,
+        snr_best = COALESCE(
+            MAX(gateway_reception.snr_best, excluded.snr_best),
+            gateway_reception.snr_best,
+            excluded.snr_best
+        ),
+        hops_count = gateway_reception.hops_count + excluded.hops_count,
+        hops_sum = gateway_reception.hops_sum + excluded.hops_sum,
+        hops_min = COALESCE(
+            MIN(gateway_reception.hops_min, excluded.hops_min),
+            gateway_reception.hops_min,
+            excluded.hops_min
+        )
+    RETURNING count
+"""
+
+GATEWAY_STATS_UPSERT = """
+    INSERT INTO gateway_stats (gateway_id, count, nodes, first_heard, last_heard)
+    VALUES (?, 1, ?, ?, ?)
+    ON CONFLICT (gateway_id) DO UPDATE SET
+        count = gateway_stats.count + 1,
+        nodes = gateway_stats.nodes + excluded.nodes,
+        first_heard = MIN(gateway_stats.first_heard, excluded.first_heard),
+        last_heard = MAX(gateway_stats.last_heard, excluded.last_heard)
+"""
+
+# hop_start is 0 from firmware that predates it, so those packets carry no hop count.
+HOPS_AWAY_SQL = "CASE WHEN hop_start > 0 AND hop_start >= hop_limit THEN hop_start - hop_limit END"
+
+
+def hops_away(packet: dict | PacketRecord) -> int | None:
+    hop_start = packet.get("hop_start")
+    hop_limit = packet.get("hop_limit")
+    if not hop_start or hop_limit is None or hop_start < hop_limit:
+        return None
+    return hop_start - hop_limit
+
+
+def record_reception(conn: sqlite3.Connection, packet: dict | PacketRecord, timestamp: int) -> None:
+    gateway_id = packet.get("gateway_id")
+    node_id = packet.get("from_id")
+    # Packets the gateway took from MQTT were never heard over the air.
+    if not gateway_id or node_id is None or packet.get("via_mqtt"):
+        return
+    # Gateways that do not report RSSI send 0, which would always win "best".
+    rssi = packet.get("rssi") or None
+    snr = packet.get("snr")
+    hops = hops_away(packet)
+    count = conn.execute(
+        RECEPTION_UPSERT,
+        (
+            gateway_id, node_id, timestamp, timestamp,
+            int(rssi is not None), rssi or 0, rssi,
+            int(snr is not None), snr or 0, snr,
+            int(hops is not None), hops or 0, hops,
+        ),
+    ).fetchone()[0]
+    conn.execute(GATEWAY_STATS_UPSERT, (gateway_id, int(count == 1), timestamp, timestamp))
+
+
+def backfill_gateway_reception(conn: sqlite3.Connection) -> int:
+    existing = conn.execute("SELECT 1 FROM gateway_reception LIMIT 1").fetchone()
+    if existing is not None:
+        return 0
+    cursor = conn.execute(
+        f"""
+        INSERT INTO gateway_reception (
+            gateway_id, node_id, count, first_heard, last_heard,
+            rssi_count, rssi_sum, rssi_best, snr_count, snr_sum, snr_best,
+            hops_count, hops_sum, hops_min
+        )
+        SELECT gateway_id, from_id, COUNT(*), MIN(created_at), MAX(created_at),
+            COUNT(rssi), COALESCE(SUM(rssi), 0), MAX(rssi),
+            COUNT(snr), COALESCE(SUM(snr), 0), MAX(snr),
+            COUNT(hops), COALESCE(SUM(hops), 0), MIN(hops)
+        FROM (
+            SELECT gateway_id, from_id, created_at, NULLIF(rssi, 0) AS rssi, snr,
+                {HOPS_AWAY_SQL} AS hops
+            FROM packets
+            WHERE gateway_id IS NOT NULL AND gateway_id != ''
+                AND from_id IS NOT NULL AND created_at IS NOT NULL
+                AND NOT COALESCE(via_mqtt, 0)
+        )
+        GROUP BY gateway_id, from_id
+        """
+    )
+    conn.execute("DELETE FROM gateway_stats")
+    conn.execute(
+        """
+        INSERT INTO gateway_stats (gateway_id, count, nodes, first_heard, last_heard)
+        SELECT gateway_id, SUM(count), COUNT(*), MIN(first_heard), MAX(last_heard)
+        FROM gateway_reception
+        GROUP BY gateway_id
+        """
+    )
+    conn.commit()
+    return cursor.rowcount
+
+
+RECEPTION_COLUMNS = """
+    gateway_id, node_id, count, first_heard, last_heard,
+    rssi_best, rssi_sum / NULLIF(rssi_count, 0) AS rssi_mean,
+    snr_best, snr_sum / NULLIF(snr_count, 0) AS snr_mean,
+    hops_min, CAST(hops_sum AS REAL) / NULLIF(hops_count, 0) AS hops_mean
+"""
+
+
+def fetch_gateways(conn: sqlite3.Connection, heard_within: int | None, limit: int) -> list[dict]:
+    cutoff = int(time.time()) - heard_within if heard_within else 0
+    rows = conn.execute(
+        """
+        SELECT gateway_id, count, nodes, first_heard, last_heard
+        FROM gateway_stats
+        WHERE last_heard >= ?
+        ORDER BY count DESC
+        LIMIT ?
+        """,
+        (cutoff, limit),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def fetch_gateway_nodes(
+    conn: sqlite3.Connection, gateway_id: str, heard_within: int | None, limit: int
+) -> list[dict]:
+    cutoff = int(time.time()) - heard_within if heard_within else 0
+    rows = conn.execute(
+        f"""
+        SELECT {RECEPTION_COLUMNS}
+        FROM gateway_reception
+        WHERE gateway_id = ? AND last_heard >= ?
+        ORDER BY count DESC
+        LIMIT ?
+        """,
+        (gateway_id, cutoff, limit),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def fetch_node_gateways(
+    conn: sqlite3.Connection, node_id: int, heard_within: int | None
+) -> list[dict]:
+    cutoff = int(time.time()) - heard_within if heard_within else 0
+    rows = conn.execute(
+        f"""
+        SELECT {RECEPTION_COLUMNS}
+        FROM gateway_reception
+        WHERE node_id = ? AND last_heard >= ?
+        ORDER BY count DESC
+        """,
+        (node_id, cutoff),
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def timeline_base_step(window_seconds: int, per_node: bool = False) -> int:
+    # The finest stored step whose rollups are kept for the whole window.
+    # Timeline buckets are whole multiples of it, so a long window never
+    # lands on a step that retention has already trimmed.
+    steps = NODE_TRAFFIC_ROLLUP_STEPS if per_node else TRAFFIC_ROLLUP_STEPS
+    retention = NODE_TRAFFIC_ROLLUP_RETENTION if per_node else TRAFFIC_ROLLUP_RETENTION
+    for step in steps:
+        if retention[step] >= window_seconds + step:
+            return step
+    return steps[-1]
+
+
+def timeline_step(bucket_seconds: int) -> int:
+    # The coarsest stored step that divides the requested bucket evenly.
+    usable = [step for step in TRAFFIC_ROLLUP_STEPS if bucket_seconds % step == 0]
+    return max(usable) if usable else TRAFFIC_ROLLUP_STEPS[0]
+
+
+def fetch_timeline(
+    conn: sqlite3.Connection,
+    window_seconds: int,
+    bucket_seconds: int,
+    group_by: str | None = None,
+    portnums: list[int] | None = None,
+    channel: int | None = None,
+    gateway_id: str | None = None,
+) -> list[dict]:
+    if group_by == "node":
+        table = "node_traffic_rollups"
+        step = max(
+            [step for step in NODE_TRAFFIC_ROLLUP_STEPS if bucket_seconds % step == 0]
+            or [NODE_TRAFFIC_ROLLUP_STEPS[0]]
+        )
+    else:
+        table = "traffic_rollups"
+        step = timeline_step(bucket_seconds)
+    cutoff = int(time.time()) - window_seconds
+    cutoff -= cutoff % bucket_seconds
+    conditions, params = _build_packet_conditions(None, None, portnums, channel, gateway_id)
+    conditions = ["step = ?", "bucket >= ?", *conditions]
+    params = [step, cutoff, *params]
+    key = f"{TIMELINE_GROUPS[group_by]} AS key, " if group_by else ""
+    group = ", key" if group_by else ""
+    rows = conn.execute(
+        f"""
+        SELECT bucket - bucket % ? AS ts, {key}
+            SUM(count) AS count,
+            SUM(rssi_count) AS rssi_count, SUM(rssi_sum) AS rssi_sum,
+            MIN(rssi_min) AS rssi_min, MAX(rssi_max) AS rssi_max,
+            SUM(snr_count) AS snr_count, SUM(snr_sum) AS snr_sum,
+            MIN(snr_min) AS snr_min, MAX(snr_max) AS snr_max
+        FROM {table}
+        {_where_clause(conditions)}
+        GROUP BY ts{group}
+        ORDER BY ts
+        """,
+        [bucket_seconds, *params],
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def backfill_node_adjacency(conn: sqlite3.Connection) -> int:
+    existing = conn.execute("SELECT 1 FROM node_adjacency LIMIT 1").fetchone()
+    if existing is not None:
+        return 0
+    cursor = conn.execute(
+        """
+        INSERT INTO node_adjacency (node_id, bucket, peer_id, portnum, count, last_seen)
+        SELECT node_id, bucket, peer_id, portnum, COUNT(*), MAX(created_at)
+        FROM (
+            SELECT from_id AS node_id, to_id AS peer_id, portnum,
+                created_at - created_at % ? AS bucket, created_at
+            FROM packets
+            WHERE from_id IS NOT NULL AND to_id IS NOT NULL AND portnum IS NOT NULL
+            UNION ALL
+            SELECT to_id AS node_id, from_id AS peer_id, portnum,
+                created_at - created_at % ? AS bucket, created_at
+            FROM packets
+            WHERE from_id IS NOT NULL AND to_id IS NOT NULL AND portnum IS NOT NULL
+                AND to_id != from_id
+        )
+        GROUP BY node_id, bucket, peer_id, portnum
+        """,
+        (ADJACENCY_BUCKET_SECONDS, ADJACENCY_BUCKET_SECONDS),
+    )
+    conn.commit()
+    return cursor.rowcount
+
+
+def _adjacency_window(window_seconds: int) -> tuple[list[str], list[object]]:
+    cutoff = int(time.time()) - window_seconds
+    # The bucket bound keeps the primary key usable; last_seen drops an edge
+    # bucket whose traffic all came before the window opened.
+    return ["bucket >= ?", "last_seen >= ?"], [cutoff - cutoff % ADJACENCY_BUCKET_SECONDS, cutoff]
+
+
+def fetch_node_adjacency(
+    conn: sqlite3.Connection,
+    node_id: int,
+    window_seconds: int,
+    portnums: list[int] | None = None,
+) -> list[dict]:
+    window_conditions, window_params = _adjacency_window(window_seconds)
+    conditions = ["node_id = ?", *window_conditions]
+    params: list[object] = [node_id, *window_params]
+    if portnums:
+        conditions.append(f"portnum IN ({','.join('?' for _ in portnums)})")
+        params.extend(portnums)
+    rows = conn.execute(
+        f"""
+        SELECT peer_id, portnum, SUM(count) AS count, MAX(last_seen) AS last_seen
+        FROM node_adjacency
+        {_where_clause(conditions)}
+        GROUP BY peer_id, portnum
+        """,
+        params,
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def fetch_neighborhood_links(
+    conn: sqlite3.Connection,
+    node_ids: list[int],
+    window_seconds: int,
+    portnums: list[int] | None = None,
+) -> list[dict]:
+    if not node_ids:
+        return []
+    placeholders = ",".join("?" for _ in node_ids)
+    window_conditions, window_params = _adjacency_window(window_seconds)
+    conditions = [f"node_id IN ({placeholders})", *window_conditions, "peer_id != ?"]
+    params: list[object] = [*node_ids, *window_params, BROADCAST_ID]
+    if portnums:
+        conditions.append(f"portnum IN ({','.join('?' for _ in portnums)})")
+        params.extend(portnums)
+    rows = conn.execute(
+        f"""
+        SELECT node_id, peer_id, SUM(count) AS count, MAX(last_seen) AS last_seen
+        FROM node_adjacency
+        {_where_clause(conditions)}
+        GROUP BY node_id, peer_id
+        """,
+        params,
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
+def fetch_nodes_by_id(conn: sqlite3.Connection, node_ids: list[int]) -> dict[int, dict]:
+    result: dict[int, dict] = {}
+    unique_ids = list(dict.fromkeys(node_ids))
+    for start in range(0, len(unique_ids), 500):
+        chunk = unique_ids[start:start + 500]
+        placeholders = ",".join("?" for _ in chunk)
+        rows = conn.execute(
+            f"SELECT * FROM nodes WHERE node_id IN ({placeholders})",
+            chunk,
+        ).fetchall()
+        result.update({row["node_id"]: dict(row) for row in rows})
+    return result
+
+
 def fetch_packets(conn: sqlite3.Connection, limit: int) -> list[dict]:
     rows = conn.execute(
         """
@@ -194,6 +1375,31 @@ def fetch_packets_filtered(
     return [dict(row) for row in rows]
 
 
+def fetch_packets_after(
+    conn: sqlite3.Connection,
+    cursor: tuple[int, int],
+    end: int,
+    limit: int,
+    portnums: list[int] | None = None,
+    channel: int | None = None,
+    gateway_id: str | None = None,
+) -> list[dict]:
+    # Keyset page in (created_at, id) order; the plain created_at bound lets
+    # SQLite range-scan idx_packets_time before the row-value comparison.
+    conditions, params = _build_packet_conditions(None, None, portnums, channel, gateway_id)
+    conditions = ["created_at >= ?", "created_at < ?", "(created_at, id) > (?, ?)", *conditions]
+    rows = conn.execute(
+        f"""
+        SELECT * FROM packets
+        {_where_clause(conditions)}
+        ORDER BY created_at, id
+        LIMIT ?
+        """,
+        [cursor[0], end, cursor[0], cursor[1], *params, limit],
+    ).fetchall()
+    return [dict(row) for row in rows]
+
+
 def fetch_nodes(conn: sqlite3.Connection) -> dict[int, dict]:
     rows = conn.execute("SELECT * FROM nodes").fetchall()
     return {row["node_id"]: dict(row) for row in rows}
@@ -223,6 +1429,19 @@ def fetch_graph(
     return [dict(row) for row in rows]
 
 
+def fetch_graph_layout(conn: sqlite3.Connection) -> dict[int, tuple[float, float]]:
+    return {row[0]: (row[1], row[2]) for row in conn.execute("SELECT node_id, x, y FROM graph_layout")}
+
+
+def save_graph_layout(
+    conn: sqlite3.Connection, positions: dict[int, tuple[float, float]], timestamp: int
+) -> None:
+    conn.executemany(
+        "INSERT OR REPLACE INTO graph_layout (node_id, x, y, updated_at) VALUES (?, ?, ?, ?)",
+        [(node_id, x, y, timestamp) for node_id, (x, y) in positions.items()],
+    )
+
+
 def fetch_nodes_summary(
     conn: sqlite3.Connection,
     window_seconds: int,
@@ -371,6 +1590,65 @@ def fetch_ports_summary(
     return [dict(row) for row in rows]
 
 
+def record_thinned(conn: sqlite3.Connection, counts: dict[tuple[int, int], int]) -> None:
+    conn.executemany(
+        """
+        INSERT INTO packet_thinning (bucket, portnum, count)
+        VALUES (?, ?, ?)
+        ON CONFLICT(bucket, portnum) DO UPDATE SET
+            count = packet_thinning.count + excluded.count
+        """,
+        [(bucket, portnum, count) for (bucket, portnum), count in counts.items()],
+    )
+
+
+def fetch_thinned_counts(
+    conn: sqlite3.Connection,
+    window_seconds: int,
+    portnums: list[int] | None = None,
+) -> dict[int, int]:
+    conditions = ["bucket >= ?"]
+    params: list[object] = [int(time.time()) - window_seconds]
+    if portnums:
+        conditions.append(f"portnum IN ({','.join('?' for _ in portnums)})")
+        params.extend(portnums)
+    rows = conn.execute(
+        f"""
+        SELECT portnum, SUM(count) AS count
+        FROM packet_thinning
+        {_where_clause(conditions)}
+        GROUP BY portnum
+        """,
+        params,
+    ).fetchall()
+    return {row["portnum"]: row["count"] for row in rows}
+
+
+def fetch_thinned_timeline(
+    conn: sqlite3.Connection,
+    window_seconds: int,
+    bucket_seconds: int,
+    portnums: list[int] | None = None,
+) -> dict[tuple[int, int], int]:
+    cutoff = int(time.time()) - window_seconds
+    cutoff -= cutoff % bucket_seconds
+    conditions = ["bucket >= ?"]
+    params: list[object] = [cutoff]
+    if portnums:
+        conditions.append(f"portnum IN ({','.join('?' for _ in portnums)})")
+        params.extend(portnums)
+    rows = conn.execute(
+        f"""
+        SELECT bucket - bucket % ? AS ts, portnum, SUM(count) AS count
+        FROM packet_thinning
+        {_where_clause(conditions)}
+        GROUP BY ts, portnum
+        """,
+        [bucket_seconds, *params],
+    ).fetchall()
+    return {(row["ts"], row["portnum"]): row["count"] for row in rows}
+
+
 def fetch_channels_summary(
     conn: sqlite3.Connection,
     window_seconds: int,
@@ -401,6 +1679,7 @@ def fetch_metric_counts(
     portnums: list[int] | None = None,
     channel: int | None = None,
     gateway_id: str | None = None,
+    distinct_nodes: bool = True,
 ) -> dict:
     conditions, params = _build_packet_conditions(
         None, window_seconds, portnums, channel, gateway_id
@@ -414,17 +1693,19 @@ def fetch_metric_counts(
     to_conditions = conditions + ["to_id IS NOT NULL", "to_id != ?"]
     from_where = _where_clause(from_conditions)
     to_where = _where_clause(to_conditions)
-    active_nodes = conn.execute(
-        f"""
-        SELECT COUNT(DISTINCT node_id)
-        FROM (
-            SELECT from_id AS node_id FROM packets {from_where}
-            UNION
-            SELECT to_id AS node_id FROM packets {to_where}
-        )
-        """,
-        [*params, BROADCAST_ID, *params, BROADCAST_ID],
-    ).fetchone()[0]
+    active_nodes = None
+    if distinct_nodes:
+        active_nodes = conn.execute(
+            f"""
+            SELECT COUNT(DISTINCT node_id)
+            FROM (
+                SELECT from_id AS node_id FROM packets {from_where}
+                UNION
+                SELECT to_id AS node_id FROM packets {to_where}
+            )
+            """,
+            [*params, BROADCAST_ID, *params, BROADCAST_ID],
+        ).fetchone()[0]
     top_ports = conn.execute(
         """
         SELECT portnum, portname, COUNT(*) AS count
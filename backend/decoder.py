@@ -2,39 +2,61 @@ from __future__ import annotations
 
 import base64
 import hashlib
-import json
+import importlib
 import time
 import zlib
-from dataclasses import dataclass
 
 from Crypto.Cipher import AES
-from google.protobuf.json_format import MessageToDict
-from meshtastic.protobuf import admin_pb2, mesh_pb2, mqtt_pb2, paxcount_pb2, portnums_pb2, remote_hardware_pb2, storeforward_pb2, telemetry_pb2
-
-
-@dataclass(frozen=True)
-class DecodedPacket:
-    record: dict
-    details: dict | None
+from .extractors import message_to_dict
+from .metrics import DECRYPT_KEY_HITS
+from .packet import PacketRecord
+from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2
 
 
 PORTNUM_NAMES = {v.number: v.name for v in portnums_pb2.PortNum.DESCRIPTOR.values}
 
+# Payload message types by port, as (module, class) so each protobuf module is
+# only imported once a packet on that port is actually seen.
 PORTNUM_PROTO = {
-    portnums_pb2.PortNum.POSITION_APP: mesh_pb2.Position,
-    portnums_pb2.PortNum.ROUTING_APP: mesh_pb2.Routing,
-    portnums_pb2.PortNum.WAYPOINT_APP: mesh_pb2.Waypoint,
-    portnums_pb2.PortNum.NEIGHBORINFO_APP: mesh_pb2.NeighborInfo,
-    portnums_pb2.PortNum.TELEMETRY_APP: telemetry_pb2.Telemetry,
-    portnums_pb2.PortNum.ADMIN_APP: admin_pb2.AdminMessage,
-    portnums_pb2.PortNum.REMOTE_HARDWARE_APP: remote_hardware_pb2.HardwareMessage,
-    portnums_pb2.PortNum.PAXCOUNTER_APP: paxcount_pb2.Paxcount,
-    portnums_pb2.PortNum.STORE_FORWARD_APP: storeforward_pb2.StoreAndForward,
-    portnums_pb2.PortNum.MAP_REPORT_APP: mqtt_pb2.MapReport,
-    portnums_pb2.PortNum.KEY_VERIFICATION_APP: mesh_pb2.KeyVerification,
-    portnums_pb2.PortNum.TRACEROUTE_APP: mesh_pb2.RouteDiscovery,
+    portnums_pb2.PortNum.POSITION_APP: ("mesh_pb2", "Position"),
+    portnums_pb2.PortNum.ROUTING_APP: ("mesh_pb2", "Routing"),
+    portnums_pb2.PortNum.WAYPOINT_APP: ("mesh_pb2", "Waypoint"),
+    portnums_pb2.PortNum.NEIGHBORINFO_APP: ("mesh_pb2", "NeighborInfo"),
+    portnums_pb2.PortNum.TELEMETRY_APP: ("telemetry_pb2", "Telemetry"),
+    portnums_pb2.PortNum.ADMIN_APP: ("admin_pb2", "AdminMessage"),
+    portnums_pb2.PortNum.REMOTE_HARDWARE_APP: ("remote_hardware_pb2", "HardwareMessage"),
+    portnums_pb2.PortNum.PAXCOUNTER_APP: ("paxcount_pb2", "Paxcount"),
+    portnums_pb2.PortNum.STORE_FORWARD_APP: ("storeforward_pb2", "StoreAndForward"),
+    portnums_pb2.PortNum.MAP_REPORT_APP: ("mqtt_pb2", "MapReport"),
+    portnums_pb2.PortNum.KEY_VERIFICATION_APP: ("mesh_pb2", "KeyVerification"),
+    portnums_pb2.PortNum.TRACEROUTE_APP: ("mesh_pb2", "RouteDiscovery"),
+}
+
+_PROTO_CLASSES: dict[int, type] = {}
+
+
+def portnum_message_class(portnum: int | None):
+    message_cls = _PROTO_CLASSES.get(portnum)
+    if message_cls is None and portnum in PORTNUM_PROTO:
+        module_name, class_name = PORTNUM_PROTO[portnum]
+        module = importlib.import_module(f"meshtastic.protobuf.{module_name}")
+        message_cls = _PROTO_CLASSES[portnum] = getattr(module, class_name)
+    return message_cls
+
+
+# Ports whose payloads are converted with the compiled extractors in
+# extractors.py; everything else goes through MessageToDict.
+FAST_DECODE_PORTNUMS = {
+    portnums_pb2.PortNum.POSITION_APP,
+    portnums_pb2.PortNum.TELEMETRY_APP,
+    portnums_pb2.PortNum.NODEINFO_APP,
+    portnums_pb2.PortNum.ROUTING_APP,
+    portnums_pb2.PortNum.TRACEROUTE_APP,
+    portnums_pb2.PortNum.NEIGHBORINFO_APP,
 }
 
+ALLOWED_DECODE_STATUSES = {"decoded", "decrypted"}
+
 DEFAULT_KEY_B64 = "1PG7OiApB1nwvP+rz05pAQ=="
 DEFAULT_KEY = base64.b64decode(DEFAULT_KEY_B64)
 
@@ -45,6 +67,46 @@ def portnum_name(portnum: int | None) -> str:
     return PORTNUM_NAMES.get(portnum, f"UNKNOWN_{portnum}")
 
 
+def should_store(details: dict | None) -> bool:
+    if not isinstance(details, dict):
+        return False
+    return details.get("decode_status") in ALLOWED_DECODE_STATUSES
+
+
+def packet_signature(record: dict) -> str:
+    parts = [
+        record.get("from_id"),
+        record.get("to_id"),
+        record.get("portnum"),
+        record.get("rx_time"),
+        record.get("channel"),
+        record.get("payload_b64"),
+        record.get("text"),
+        record.get("gateway_id"),
+    ]
+    raw = "|".join("" if value is None else str(value) for value in parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def node_names(details: dict | None) -> tuple[str | None, str | None]:
+    user = details.get("user") if isinstance(details, dict) else None
+    if not isinstance(user, dict) and isinstance(details, dict):
+        user = details
+    long_name = user.get("long_name") if isinstance(user, dict) else None
+    short_name = user.get("short_name") if isinstance(user, dict) else None
+    return long_name, short_name
+
+
+def channel_from_topic(topic: str) -> str | None:
+    parts = topic.split("/")
+    if len(parts) < 5:
+        return None
+    candidate = parts[4]
+    if not candidate or candidate.startswith("!"):
+        return None
+    return candidate
+
+
 def derive_key_from_channel_name(channel_name: str | None, key: bytes) -> bytes:
     if not channel_name:
         return key
@@ -87,7 +149,7 @@ def decode_envelope(payload: bytes) -> mqtt_pb2.ServiceEnvelope | None:
     return env
 
 
-def _decode_proto(message_cls, payload: bytes) -> dict | None:
+def _decode_proto(message_cls, payload: bytes, fast: bool = False) -> dict | None:
     if not payload:
         return None
     msg = message_cls()
@@ -95,7 +157,7 @@ def _decode_proto(message_cls, payload: bytes) -> dict | None:
         msg.ParseFromString(payload)
     except Exception:
         return None
-    return MessageToDict(msg, preserving_proto_field_name=True)
+    return message_to_dict(msg, fast=fast)
 
 
 def _decode_text(payload: bytes) -> tuple[str | None, dict | None]:
@@ -134,16 +196,16 @@ def decode_payload(portnum: int | None, payload: bytes) -> tuple[str | None, dic
     if portnum == portnums_pb2.PortNum.TEXT_MESSAGE_COMPRESSED_APP:
         return _decode_compressed(payload)
     if portnum == portnums_pb2.PortNum.NODEINFO_APP:
-        details = _decode_proto(mesh_pb2.User, payload)
+        details = _decode_proto(mesh_pb2.User, payload, fast=True)
         if details is None:
-            details = _decode_proto(mesh_pb2.NodeInfo, payload)
+            details = _decode_proto(mesh_pb2.NodeInfo, payload, fast=True)
         if details is None:
             return None, None
         return None, details
 
-    message_cls = PORTNUM_PROTO.get(portnum)
+    message_cls = portnum_message_class(portnum)
     if message_cls:
-        details = _decode_proto(message_cls, payload)
+        details = _decode_proto(message_cls, payload, fast=portnum in FAST_DECODE_PORTNUMS)
         if details is None:
             return None, None
         if portnum == portnums_pb2.PortNum.POSITION_APP:
@@ -157,11 +219,33 @@ def decode_payload(portnum: int | None, payload: bytes) -> tuple[str | None, dic
     return None, None
 
 
+def extract_telemetry_metrics(details: dict | None) -> dict[str, float]:
+    metrics: dict[str, float] = {}
+    if not isinstance(details, dict):
+        return metrics
+    for group, values in details.items():
+        if not isinstance(values, dict):
+            continue
+        for field, value in values.items():
+            if isinstance(value, bool):
+                continue
+            if isinstance(value, str):
+                try:
+                    value = float(value)
+                except ValueError:
+                    continue
+            if not isinstance(value, (int, float)):
+                continue
+            metrics[f"{group}.{field}"] = float(value)
+    return metrics
+
+
 def decode_packet(
     envelope: mqtt_pb2.ServiceEnvelope,
     keys_b64: list[str],
     channel_name: str | None = None,
-) -> DecodedPacket | None:
+    received_at: float | None = None,
+) -> PacketRecord | None:
     packet = envelope.packet
     if packet is None:
         return None
@@ -173,7 +257,7 @@ def decode_packet(
         decode_status = "decoded"
     elif packet.encrypted:
         resolved_channel = channel_name or envelope.channel_id or None
-        for key_b64 in keys_b64:
+        for key_index, key_b64 in enumerate(keys_b64):
             try:
                 key = base64.b64decode(key_b64)
             except Exception:
@@ -202,6 +286,7 @@ def decode_packet(
                     continue
                 data = candidate
                 decode_status = "decrypted"
+                DECRYPT_KEY_HITS.inc(key=key_index, derived=candidate_key is not normalized)
                 break
             if data is not None:
                 break
@@ -218,7 +303,7 @@ def decode_packet(
     details["decode_status"] = decode_status
     details["encrypted"] = bool(packet.encrypted)
 
-    now = int(time.time())
+    now = int(received_at if received_at is not None else time.time())
     if portnum is None:
         if decode_status == "decrypt_failed":
             portname = "ENCRYPTED"
@@ -228,23 +313,21 @@ def decode_packet(
             portname = "UNKNOWN_APP"
     else:
         portname = portnum_name(portnum)
-    record = {
-        "rx_time": packet.rx_time,
-        "from_id": getattr(packet, "from", None),
-        "to_id": packet.to,
-        "portnum": portnum,
-        "portname": portname,
-        "payload_b64": payload_b64,
-        "text": text,
-        "details_json": json.dumps(details) if details else None,
-        "rssi": packet.rx_rssi,
-        "snr": packet.rx_snr,
-        "hop_limit": packet.hop_limit,
-        "hop_start": packet.hop_start,
-        "via_mqtt": packet.via_mqtt,
-        "channel": packet.channel,
-        "gateway_id": envelope.gateway_id or None,
-        "created_at": now,
-    }
-
-    return DecodedPacket(record=record, details=details)
+    return PacketRecord(
+        rx_time=packet.rx_time,
+        from_id=getattr(packet, "from", None),
+        to_id=packet.to,
+        portnum=portnum,
+        portname=portname,
+        payload_b64=payload_b64,
+        text=text,
+        rssi=packet.rx_rssi,
+        snr=packet.rx_snr,
+        hop_limit=packet.hop_limit,
+        hop_start=packet.hop_start,
+        via_mqtt=packet.via_mqtt,
+        channel=packet.channel,
+        gateway_id=envelope.gateway_id or None,
+        created_at=now,
+        details=details,
+    )
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import base64
+import math
+import struct
+from functools import lru_cache
+from typing import Callable
+
+from google.protobuf.descriptor import Descriptor, FieldDescriptor
+from google.protobuf.json_format import MessageToDict
+
+
+# Field converters mirror google.protobuf.json_format with
+# preserving_proto_field_name=True, so the dicts (and their key order, which
+# follows ListFields) are identical to MessageToDict output.
+
+_INT64_TYPES = {
+    FieldDescriptor.CPPTYPE_INT64,
+    FieldDescriptor.CPPTYPE_UINT64,
+}
+
+_FLOAT = struct.Struct("<f")
+
+
+class _Unsupported(Exception):
+    pass
+
+
+@lru_cache(maxsize=8192)
+def _shortest_float(value: float) -> float:
+    precision = 6
+    rounded = float(f"{value:.{precision}g}")
+    while _FLOAT.unpack(_FLOAT.pack(rounded))[0] != value:
+        precision += 1
+        rounded = float(f"{value:.{precision}g}")
+    return rounded
+
+
+def _float_value(value: float) -> float | str:
+    if math.isinf(value):
+        return "-Infinity" if value < 0 else "Infinity"
+    if math.isnan(value):
+        return "NaN"
+    if value == 0:
+        # 0.0 and -0.0 share a cache slot, so keep the sign from the input.
+        return value
+    return _shortest_float(value)
+
+
+def _double_value(value: float) -> float | str:
+    if math.isinf(value):
+        return "-Infinity" if value < 0 else "Infinity"
+    if math.isnan(value):
+        return "NaN"
+    return value
+
+
+def _bytes_value(value: bytes) -> str:
+    return base64.b64encode(value).decode("utf-8")
+
+
+def _enum_converter(field: FieldDescriptor) -> Callable:
+    enum_type = field.enum_type
+    if enum_type.is_closed:
+        raise _Unsupported(enum_type.full_name)
+    for value in enum_type.values:
+        for option, _ in value.GetOptions().ListFields():
+            # JSON name overrides on enum values are not mirrored here.
+            if option.full_name == "pb.enumvalue.json":
+                raise _Unsupported(enum_type.full_name)
+    names = {value.number: value.name for value in enum_type.values}
+    return lambda value: names.get(value, value)
+
+
+def _field_converter(field: FieldDescriptor, compiling: dict) -> Callable | None:
+    cpp_type = field.cpp_type
+    if cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+        message_type = field.message_type
+        if message_type.GetOptions().map_entry or message_type.full_name.startswith("google.protobuf."):
+            raise _Unsupported(message_type.full_name)
+        return _compile(message_type, compiling)
+    if cpp_type == FieldDescriptor.CPPTYPE_ENUM:
+        return _enum_converter(field)
+    if cpp_type == FieldDescriptor.CPPTYPE_STRING:
+        return _bytes_value if field.type == FieldDescriptor.TYPE_BYTES else None
+    if cpp_type in _INT64_TYPES:
+        return str
+    if cpp_type == FieldDescriptor.CPPTYPE_FLOAT:
+        return _float_value
+    if cpp_type == FieldDescriptor.CPPTYPE_DOUBLE:
+        return _double_value
+    return None
+
+
+def _compile(descriptor: Descriptor, compiling: dict) -> Callable:
+    existing = compiling.get(descriptor.full_name)
+    if existing is not None:
+        return existing
+
+    plan: dict[str, tuple[Callable | None, bool]] = {}
+
+    def extract(message) -> dict:
+        result = {}
+        for field, value in message.ListFields():
+            convert, repeated = plan[field.name]
+            if convert is None:
+                result[field.name] = list(value) if repeated else value
+            elif repeated:
+                result[field.name] = [convert(item) for item in value]
+            else:
+                result[field.name] = convert(value)
+        return result
+
+    # Registered before the fields are walked so recursive message types resolve.
+    compiling[descriptor.full_name] = extract
+    for field in descriptor.fields:
+        if field.is_extension:
+            raise _Unsupported(field.full_name)
+        plan[field.name] = (_field_converter(field, compiling), field.is_repeated)
+    return extract
+
+
+_EXTRACTORS: dict[str, Callable | None] = {}
+
+
+def fast_extractor(descriptor: Descriptor) -> Callable | None:
+    name = descriptor.full_name
+    if name not in _EXTRACTORS:
+        try:
+            _EXTRACTORS[name] = _compile(descriptor, {})
+        except _Unsupported:
+            _EXTRACTORS[name] = None
+    return _EXTRACTORS[name]
+
+
+def message_to_dict(message, fast: bool = True) -> dict:
+    if fast:
+        extractor = fast_extractor(message.DESCRIPTOR)
+        if extractor is not None:
+            return extractor(message)
+    return MessageToDict(message, preserving_proto_field_name=True)
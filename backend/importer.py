@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .capture import capture_files, read_capture
+from .config import load_config
+from .db import (
+    connect,
+    drop_packet_indexes,
+    insert_packets_bulk,
+    insert_telemetry_samples,
+    rebuild_derived_tables,
+    update_node_names,
+)
+from .decoder import (
+    channel_from_topic,
+    decode_envelope,
+    decode_packet,
+    extract_telemetry_metrics,
+    node_names,
+    packet_signature,
+    should_store,
+)
+from meshtastic.protobuf import portnums_pb2
+
+
+logger = logging.getLogger(__name__)
+
+_worker_keys: list[str] = []
+
+
+def _init_worker(keys_b64: list[str]) -> None:
+    global _worker_keys
+    _worker_keys = keys_b64
+
+
+def _derived(record: dict, details: dict | None) -> tuple[dict | None, tuple | None]:
+    portnum = record.get("portnum")
+    if portnum == portnums_pb2.PortNum.TELEMETRY_APP:
+        return extract_telemetry_metrics(details), None
+    if portnum == portnums_pb2.PortNum.NODEINFO_APP:
+        return None, node_names(details)
+    return None, None
+
+
+def _decode_chunk(chunk: list[tuple[float, str, bytes]]) -> list[tuple[dict, dict | None, tuple | None]]:
+    results = []
+    for received_at, topic, payload in chunk:
+        envelope = decode_envelope(payload)
+        if envelope is None:
+            continue
+        decoded = decode_packet(
+            envelope,
+            _worker_keys,
+            channel_name=channel_from_topic(topic),
+            received_at=received_at,
+        )
+        if decoded is None or not should_store(decoded.details):
+            continue
+        derived = _derived(decoded, decoded.details)
+        decoded.pack_details()
+        results.append((decoded, *derived))
+    return results
+
+
+def _chunks(items: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _decode_captures(
+    paths: list[Path],
+    keys_b64: list[str],
+    workers: int,
+    chunk_size: int,
+) -> Iterator[list[tuple[dict, dict | None, tuple | None]]]:
+    records = (record for path in paths for record in read_capture(path))
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(keys_b64,),
+    ) as pool:
+        pending: deque = deque()
+        for chunk in _chunks(records, chunk_size):
+            pending.append(pool.submit(_decode_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _read_export(path: Path, chunk_size: int) -> Iterator[list[tuple[dict, dict | None, tuple | None]]]:
+    source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    source.row_factory = sqlite3.Row
+    with closing(source):
+        cursor = source.execute("SELECT * FROM packets ORDER BY created_at, id")
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            results = []
+            for row in rows:
+                record = dict(row)
+                record.pop("id", None)
+                details = None
+                if record.get("portnum") in (
+                    portnums_pb2.PortNum.TELEMETRY_APP,
+                    portnums_pb2.PortNum.NODEINFO_APP,
+                ) and record.get("details_json"):
+                    try:
+                        details = json.loads(record["details_json"])
+                    except json.JSONDecodeError:
+                        details = None
+                results.append((record, *_derived(record, details)))
+            yield results
+
+
+def import_sources(
+    db_path: Path,
+    sources: list[Path],
+    keys_b64: list[str],
+    workers: int,
+    chunk_size: int = 2000,
+    commit_every: int = 200_000,
+    dedupe_window: int = 6,
+    force: bool = False,
+) -> dict:
+    conn = connect(db_path)
+    if not force and conn.execute("SELECT 1 FROM packets LIMIT 1").fetchone() is not None:
+        conn.close()
+        raise SystemExit(f"{db_path} already has packets; pass --force to append")
+
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -262144")
+    dropped = drop_packet_indexes(conn)
+    conn.commit()
+    logger.info("deferred %d packet indexes", len(dropped))
+
+    dedupe: dict[str, int] = {}
+    names: dict[int, tuple[str | None, str | None]] = {}
+    stats = {"stored": 0, "duplicates": 0, "telemetry_samples": 0}
+    pending_rows: list[dict] = []
+    pending_samples: list[tuple[int, str, int, float]] = []
+    uncommitted = 0
+    started = time.monotonic()
+
+    def flush() -> None:
+        if pending_rows:
+            insert_packets_bulk(conn, pending_rows)
+            pending_rows.clear()
+        if pending_samples:
+            insert_telemetry_samples(conn, pending_samples)
+            pending_samples.clear()
+
+    captures = capture_files([path for path in sources if path.suffix != ".db"])
+    streams = []
+    if captures:
+        streams.append(_decode_captures(captures, keys_b64, workers, chunk_size))
+    for path in sources:
+        if path.suffix == ".db":
+            streams.append(_read_export(path, chunk_size))
+
+    for stream in streams:
+        for batch in stream:
+            for record, metrics, node_name in batch:
+                created_at = record.get("created_at") or 0
+                signature = packet_signature(record)
+                last_seen = dedupe.get(signature)
+                if last_seen is not None and created_at - last_seen < dedupe_window:
+                    stats["duplicates"] += 1
+                    continue
+                dedupe[signature] = created_at
+                pending_rows.append(record)
+                if metrics and record.get("from_id") is not None:
+                    pending_samples.extend(
+                        (record["from_id"], metric, created_at, value)
+                        for metric, value in metrics.items()
+                    )
+                    stats["telemetry_samples"] += len(metrics)
+                if node_name and record.get("from_id") is not None and any(node_name):
+                    names[record["from_id"]] = node_name
+                stats["stored"] += 1
+                uncommitted += 1
+            if len(dedupe) > 200_000:
+                cutoff = max(dedupe.values()) - dedupe_window
+                dedupe = {sig: ts for sig, ts in dedupe.items() if ts >= cutoff}
+            if len(pending_rows) >= chunk_size * 10:
+                flush()
+            if uncommitted >= commit_every:
+                flush()
+                conn.commit()
+                uncommitted = 0
+                elapsed = time.monotonic() - started
+                logger.info(
+                    "%d packets stored (%.0f/s)", stats["stored"], stats["stored"] / elapsed
+                )
+
+    flush()
+    update_node_names(conn, names)
+    conn.commit()
+    logger.info("building indexes and derived tables")
+    rebuild_derived_tables(conn)
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA optimize")
+    conn.close()
+    stats["seconds"] = round(time.monotonic() - started, 1)
+    return stats
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import capture files or another mesh.db into a database.")
+    parser.add_argument("sources", nargs="+", type=Path, help="capture files, capture directories or .db exports")
+    base_dir = Path(__file__).resolve().parent.parent
+    parser.add_argument("--db", type=Path, default=Path(os.environ.get("DB_PATH", base_dir / "data" / "mesh.db")))
+    parser.add_argument("--config", type=Path, default=Path(os.environ.get("CONFIG_PATH", base_dir / "config.txt")))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--dedupe-window", type=int, default=int(os.environ.get("DEDUPE_WINDOW", "6")))
+    parser.add_argument("--force", action="store_true", help="append to a database that already has packets")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    config = load_config(args.config, args.db)
+    stats = import_sources(
+        args.db,
+        args.sources,
+        config.decode_keys_b64 or [config.default_key_b64],
+        workers=max(args.workers, 1),
+        chunk_size=args.chunk_size,
+        dedupe_window=args.dedupe_window,
+        force=args.force,
+    )
+    logger.info("import finished: %s", stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Callable
+
+from .metrics import IPC_DROPS, IPC_SUBSCRIBERS
+
+
+logger = logging.getLogger(__name__)
+
+MAX_LINE_BYTES = 4 * 1024 * 1024
+
+
+class EventPublisher:
+    def __init__(self, path: Path, max_buffer_bytes: int = 8 * 1024 * 1024) -> None:
+        self.path = Path(path)
+        self.max_buffer_bytes = max_buffer_bytes
+        self._subscribers: set[asyncio.StreamWriter] = set()
+        self._server: asyncio.AbstractServer | None = None
+        IPC_SUBSCRIBERS.set_function(lambda: len(self._subscribers))
+
+    async def start(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            self.path.unlink()
+        self._server = await asyncio.start_unix_server(self._handle, path=str(self.path))
+        logger.info("publishing live events on %s", self.path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._subscribers.add(writer)
+        try:
+            # Subscribers never send anything; this returns when they disconnect.
+            await reader.read()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            self._drop(writer)
+
+    def _drop(self, writer: asyncio.StreamWriter) -> None:
+        if writer in self._subscribers:
+            self._subscribers.discard(writer)
+            writer.close()
+
+    def publish(self, payload: str) -> None:
+        if not self._subscribers:
+            return
+        line = payload.encode("utf-8") + b"\n"
+        for writer in list(self._subscribers):
+            if writer.transport.get_write_buffer_size() > self.max_buffer_bytes:
+                logger.warning("dropping slow event subscriber")
+                IPC_DROPS.inc()
+                self._drop(writer)
+                continue
+            writer.write(line)
+
+    async def close(self) -> None:
+        for writer in list(self._subscribers):
+            self._drop(writer)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+async def subscribe_events(
+    path: Path,
+    handler: Callable[[dict, str], None],
+    retry_seconds: float = 1.0,
+) -> None:
+    while True:
+        try:
+            reader, writer = await asyncio.open_unix_connection(str(path), limit=MAX_LINE_BYTES)
+        except (FileNotFoundError, ConnectionError, OSError):
+            await asyncio.sleep(retry_seconds)
+            continue
+        logger.info("subscribed to live events on %s", path)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                raw = line.decode("utf-8").rstrip("\n")
+                try:
+                    event = json.loads(raw)
+                except json.JSONDecodeError:
+                    continue
+                handler(event, raw)
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            writer.close()
+        logger.warning("event stream from %s closed; reconnecting", path)
+        await asyncio.sleep(retry_seconds)
+
+
+def default_socket_path(db_path: Path) -> Path:
+    return Path(os.environ.get("EVENTS_SOCKET", Path(db_path).parent / "events.sock"))
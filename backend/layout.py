@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import math
+import random
+import sqlite3
+import threading
+import time
+
+from .db import BROADCAST_ID
+
+
+# Layout units: linked nodes settle about LINK_LENGTH apart.
+LINK_LENGTH = 1.0
+REPULSION_RADIUS = 2.0 * LINK_LENGTH
+GRAVITY = 0.02
+
+
+def _grid(positions: dict[int, tuple[float, float]]) -> dict[tuple[int, int], list[int]]:
+    cells: dict[tuple[int, int], list[int]] = {}
+    for node_id, (x, y) in positions.items():
+        cells.setdefault((int(x // REPULSION_RADIUS), int(y // REPULSION_RADIUS)), []).append(node_id)
+    return cells
+
+
+class GraphLayout:
+    # Force-directed positions kept across requests. A pass moves only nodes
+    # that are new or gained a link since the last one; everything else holds
+    # still, so clients get a stable picture that grows at the edges.
+    def __init__(self, iterations: int = 60, seed: int | None = None) -> None:
+        self.iterations = iterations
+        self._lock = threading.Lock()
+        self._positions: dict[int, tuple[float, float]] = {}
+        self._neighbors: dict[int, set[int]] = {}
+        self._dirty: set[int] = set()
+        self._random = random.Random(seed)
+
+    def observe(self, from_id: int | None, to_id: int | None) -> None:
+        ends = [node_id for node_id in (from_id, to_id) if node_id is not None and node_id != BROADCAST_ID]
+        with self._lock:
+            for node_id in ends:
+                if node_id not in self._neighbors:
+                    self._neighbors[node_id] = set()
+                    if node_id not in self._positions:
+                        self._dirty.add(node_id)
+            if len(ends) == 2 and ends[0] != ends[1] and ends[1] not in self._neighbors[ends[0]]:
+                self._neighbors[ends[0]].add(ends[1])
+                self._neighbors[ends[1]].add(ends[0])
+                self._dirty.update(ends)
+
+    def pending(self) -> int:
+        return len(self._dirty)
+
+    def _place(self, node_id: int, positions: dict, neighbors: dict) -> None:
+        anchors = [positions[peer] for peer in neighbors.get(node_id, ()) if peer in positions]
+        angle = self._random.uniform(0, 2 * math.pi)
+        if anchors:
+            x = sum(anchor[0] for anchor in anchors) / len(anchors)
+            y = sum(anchor[1] for anchor in anchors) / len(anchors)
+            radius = LINK_LENGTH * 0.5
+        else:
+            # Unlinked newcomers start on the rim and are pulled in by gravity.
+            x = y = 0.0
+            radius = math.sqrt(len(positions) + 1) * LINK_LENGTH
+        positions[node_id] = (x + math.cos(angle) * radius, y + math.sin(angle) * radius)
+
+    def relax(self) -> dict[int, tuple[float, float]]:
+        with self._lock:
+            moving = sorted(self._dirty)
+            self._dirty = set()
+            if not moving:
+                return {}
+            positions = dict(self._positions)
+            neighbors = {node_id: tuple(peers) for node_id, peers in self._neighbors.items()}
+        for node_id in moving:
+            if node_id not in positions:
+                self._place(node_id, positions, neighbors)
+        # A fresh layout needs room to unfold; a few newcomers only need to settle.
+        start = LINK_LENGTH * (2.0 if len(moving) * 2 > len(positions) else 0.5)
+        radius_sq = REPULSION_RADIUS * REPULSION_RADIUS
+        for step in range(self.iterations):
+            temperature = start * (1 - step / self.iterations) + 0.01
+            cells = _grid(positions)
+            for node_id in moving:
+                x, y = positions[node_id]
+                dx = -x * GRAVITY
+                dy = -y * GRAVITY
+                cell_x = int(x // REPULSION_RADIUS)
+                cell_y = int(y // REPULSION_RADIUS)
+                for offset_x in (-1, 0, 1):
+                    for offset_y in (-1, 0, 1):
+                        for other in cells.get((cell_x + offset_x, cell_y + offset_y), ()):
+                            if other == node_id:
+                                continue
+                            other_x, other_y = positions[other]
+                            delta_x = x - other_x
+                            delta_y = y - other_y
+                            distance_sq = delta_x * delta_x + delta_y * delta_y
+                            if distance_sq > radius_sq:
+                                continue
+                            if distance_sq < 1e-6:
+                                delta_x = self._random.uniform(-0.01, 0.01)
+                                delta_y = self._random.uniform(-0.01, 0.01)
+                                distance_sq = 1e-4
+                            force = LINK_LENGTH * LINK_LENGTH / distance_sq
+                            dx += delta_x * force
+                            dy += delta_y * force
+                for peer in neighbors.get(node_id, ()):
+                    peer_x, peer_y = positions[peer]
+                    delta_x = peer_x - x
+                    delta_y = peer_y - y
+                    force = math.hypot(delta_x, delta_y) / LINK_LENGTH
+                    dx += delta_x * force
+                    dy += delta_y * force
+                length = math.hypot(dx, dy)
+                if length > 0:
+                    scale = min(length, temperature) / length
+                    positions[node_id] = (x + dx * scale, y + dy * scale)
+        moved = {node_id: (round(positions[node_id][0], 3), round(positions[node_id][1], 3)) for node_id in moving}
+        with self._lock:
+            self._positions.update(moved)
+        return moved
+
+    def load(self, conn: sqlite3.Connection, window_seconds: int = 7 * 86400) -> int:
+        rows = conn.execute("SELECT node_id, x, y FROM graph_layout").fetchall()
+        with self._lock:
+            self._positions = {row["node_id"]: (row["x"], row["y"]) for row in rows}
+        for row in conn.execute(
+            "SELECT DISTINCT node_id, peer_id FROM node_adjacency WHERE bucket >= ?",
+            (int(time.time()) - window_seconds,),
+        ):
+            self.observe(row["node_id"], row["peer_id"])
+        with self._lock:
+            # Links seen again on startup are not changes; saved nodes stay put.
+            self._dirty = {node_id for node_id in self._dirty if node_id not in self._positions}
+        return len(rows)
+
+
+def cluster_low_degree(nodes: list[dict], links: list[dict], max_degree: int) -> tuple[list[dict], list[dict]]:
+    # Folds nodes with at most max_degree peers into one cluster node per
+    # busiest peer. Nodes that only broadcast are grouped under the broadcast node.
+    peers: dict[int, dict[int, int]] = {}
+    for link in links:
+        source, target = link["source"], link["target"]
+        if source == target:
+            continue
+        for node_id, peer in ((source, target), (target, source)):
+            counts = peers.setdefault(node_id, {})
+            counts[peer] = counts.get(peer, 0) + (link.get("count") or 0)
+    members: dict[int, list[int]] = {}
+    for node in nodes:
+        node_id = node["id"]
+        if node_id == BROADCAST_ID:
+            continue
+        counts = peers.get(node_id, {})
+        real = [peer for peer in counts if peer != BROADCAST_ID]
+        if len(real) > max_degree:
+            continue
+        if real:
+            anchor = max(real, key=lambda peer: counts[peer])
+        elif BROADCAST_ID in counts:
+            anchor = BROADCAST_ID
+        else:
+            continue
+        members.setdefault(anchor, []).append(node_id)
+    # A cluster of one is no simpler than the node itself; anchors keep their own place.
+    cluster_of = {
+        member: f"cluster:{anchor}"
+        for anchor, group in members.items()
+        if len(group) > 1
+        for member in group
+        if member not in members or len(members[member]) <= 1
+    }
+    if not cluster_of:
+        return nodes, links
+    by_id = {node["id"]: node for node in nodes}
+    clusters: dict[str, dict] = {}
+    kept = []
+    for node in nodes:
+        cluster_id = cluster_of.get(node["id"])
+        if cluster_id is None:
+            kept.append(node)
+            continue
+        cluster = clusters.get(cluster_id)
+        if cluster is None:
+            anchor = int(cluster_id.split(":", 1)[1])
+            cluster = clusters[cluster_id] = {
+                "id": cluster_id,
+                "label": f"{by_id.get(anchor, {}).get('label', anchor)} +",
+                "cluster": True,
+                "members": [],
+                "x": None,
+                "y": None,
+            }
+        cluster["members"].append(node["id"])
+    for cluster in clusters.values():
+        placed = [by_id[member] for member in cluster["members"] if by_id[member].get("x") is not None]
+        if placed:
+            cluster["x"] = round(sum(node["x"] for node in placed) / len(placed), 3)
+            cluster["y"] = round(sum(node["y"] for node in placed) / len(placed), 3)
+        cluster["size"] = len(cluster["members"])
+        cluster["label"] = f"{cluster['label']}{cluster['size']}"
+    merged: dict[tuple, dict] = {}
+    for link in links:
+        source = cluster_of.get(link["source"], link["source"])
+        target = cluster_of.get(link["target"], link["target"])
+        if source == target and link["source"] != link["target"]:
+            continue
+        key = (source, target, link.get("portnum"))
+        entry = merged.get(key)
+        if entry is None:
+            merged[key] = {**link, "source": source, "target": target}
+        else:
+            entry["count"] = (entry.get("count") or 0) + (link.get("count") or 0)
+            entry["last_seen"] = max(entry.get("last_seen") or 0, link.get("last_seen") or 0)
+    return kept + list(clusters.values()), list(merged.values())
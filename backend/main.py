@@ -1,43 +1,121 @@
 from __future__ import annotations
 
 import asyncio
-import hashlib
 import json
 import logging
 import os
+import queue
+import socket
+import sqlite3
 import threading
 import time
 from contextlib import closing
 from pathlib import Path
 
-import uvicorn
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import Depends, FastAPI, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
-from paho.mqtt.client import Client, CallbackAPIVersion
 
+from .archive import PacketArchive
+from .capture import CaptureWriter
+from .ipc import EventPublisher, default_socket_path, subscribe_events
 from .config import load_config
 from .db import (
+    BROADCAST_ID,
+    NO_CHANNEL,
+    NO_GATEWAY,
+    NO_PORTNUM,
+    TIMELINE_GROUPS,
+    backfill_gateway_reception,
+    backfill_node_adjacency,
+    backfill_node_positions,
+    backfill_text_index,
+    backfill_traffic_rollups,
     connect,
     connect_read,
     fetch_channels_summary,
+    fetch_gateway_nodes,
+    fetch_gateways,
     fetch_graph,
+    fetch_graph_layout,
     fetch_metric_counts,
+    fetch_neighborhood_links,
+    fetch_node_adjacency,
+    fetch_node_gateways,
     fetch_node_packets,
     fetch_node_peers,
     fetch_node_ports,
     fetch_nodes,
+    fetch_nodes_by_id,
     fetch_nodes_summary,
     fetch_packets,
+    fetch_packets_after,
     fetch_packets_filtered,
     fetch_ports_summary,
+    fetch_position_history,
+    fetch_positions,
+    fetch_telemetry_metrics,
+    fetch_telemetry_series,
+    fetch_thinned_counts,
+    fetch_thinned_timeline,
+    fetch_timeline,
     insert_packet,
+    insert_telemetry,
+    record_adjacency,
+    record_reception,
+    record_thinned,
+    record_traffic,
+    save_graph_layout,
+    schema_ready,
+    search_text,
+    timeline_base_step,
     touch_node,
     update_node,
+    update_node_position,
+)
+from .metrics import (
+    DB_COMMIT,
+    DB_LOCK_WAIT,
+    DB_WAL_BYTES,
+    DECODE_RESULTS,
+    DEDUPE_HITS,
+    LAST_PACKET_TIME,
+    MQTT_MESSAGES,
+    MQTT_SUBSCRIBED,
+    PACKETS_STORED,
+    QUEUE_DEPTH,
+    REGISTRY,
+    WS_CLIENTS,
+    PLAYBACK_PACKETS,
+    PLAYBACK_STREAMS,
+    WRITE_QUEUE_DEPTH,
+    WS_REPLAYED,
+    WS_RESETS,
+    WS_SEND_FAILURES,
+)
+from .layout import GraphLayout, cluster_low_degree
+from .maintenance import MaintenanceScheduler
+from .profiling import SLOW_QUERIES, ProfilerBusy, SamplingProfiler
+from .packet import PacketRecord
+from .sampling import StoragePolicy
+from .sketches import MetricSketches, merged_sketch
+from .stream import Broadcaster, EventRing, PlaybackClock, sequence_counter
+from .topology import TopologyEngine
+from .decoder import (
+    channel_from_topic,
+    decode_envelope,
+    decode_packet,
+    extract_telemetry_metrics,
+    node_names,
+    packet_signature,
+    portnum_name,
+    should_store,
 )
-from .decoder import decode_envelope, decode_packet, portnum_name
 from meshtastic.protobuf import portnums_pb2
 
 
+logger = logging.getLogger(__name__)
+
 class NoCacheStaticFiles(StaticFiles):
     async def get_response(self, path: str, scope):
         response = await super().get_response(path, scope)
@@ -58,9 +136,6 @@ def _node_label(node_id: int | None, node_info: dict[int, dict]) -> str:
     return f"!{node_id:08x}"
 
 
-ALLOWED_DECODE_STATUSES = {"decoded", "decrypted"}
-
-
 def _parse_portnums(portnum: str | None) -> list[int] | None:
     if not portnum:
         return None
@@ -95,13 +170,7 @@ def _packet_for_api(row: dict, node_info: dict[int, dict]) -> dict:
 
 
 def _include_in_feed(packet: dict) -> bool:
-    return _should_store(packet.get("details"))
-
-
-def _should_store(details: dict | None) -> bool:
-    if not isinstance(details, dict):
-        return False
-    return details.get("decode_status") in ALLOWED_DECODE_STATUSES
+    return should_store(packet.get("details"))
 
 
 def _decorate_route_details(packet: dict, node_info: dict[int, dict]) -> None:
@@ -165,19 +234,89 @@ def _decorate_route_details(packet: dict, node_info: dict[int, dict]) -> None:
         details["text"] = " | ".join(combined_parts)
 
 
-def _packet_signature(record: dict) -> str:
-    parts = [
-        record.get("from_id"),
-        record.get("to_id"),
-        record.get("portnum"),
-        record.get("rx_time"),
-        record.get("channel"),
-        record.get("payload_b64"),
-        record.get("text"),
-        record.get("gateway_id"),
-    ]
-    raw = "|".join("" if value is None else str(value) for value in parts)
-    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+def _summarize_adjacency(rows: list[dict], peer_limit: int) -> tuple[list[dict], list[dict]]:
+    ports: dict[int, dict] = {}
+    peers: dict[int, dict] = {}
+    for row in rows:
+        port = ports.setdefault(
+            row["portnum"],
+            {
+                "portnum": row["portnum"],
+                "portname": portnum_name(row["portnum"]),
+                "count": 0,
+                "last_seen": None,
+            },
+        )
+        peer = peers.setdefault(
+            row["peer_id"],
+            {"peer_id": row["peer_id"], "count": 0, "last_seen": None},
+        )
+        for entry in (port, peer):
+            entry["count"] += row["count"]
+            entry["last_seen"] = max(entry["last_seen"] or 0, row["last_seen"] or 0)
+    port_list = sorted(ports.values(), key=lambda item: item["count"], reverse=True)
+    peer_list = sorted(peers.values(), key=lambda item: item["count"], reverse=True)
+    return port_list, peer_list[:peer_limit]
+
+
+def _build_neighborhood(
+    node_id: int,
+    first_hop: list[int],
+    links: list[dict],
+    node_info: dict[int, dict],
+) -> dict:
+    hops = {node_id: 0}
+    for peer_id in first_hop:
+        hops[peer_id] = 1
+    seen_links = {}
+    for link in links:
+        source, target = link["node_id"], link["peer_id"]
+        hops.setdefault(target, 2)
+        key = (min(source, target), max(source, target))
+        existing = seen_links.get(key)
+        if existing is None or link["count"] > existing["count"]:
+            seen_links[key] = {
+                "source": key[0],
+                "target": key[1],
+                "count": link["count"],
+                "last_seen": link["last_seen"],
+            }
+    return {
+        "nodes": [
+            {"id": peer_id, "label": _node_label(peer_id, node_info), "hops": hop}
+            for peer_id, hop in hops.items()
+        ],
+        "links": list(seen_links.values()),
+    }
+
+
+def _merge_summary(rows: list[dict], cold: dict[tuple, list], keys: tuple[str, ...]) -> list[dict]:
+    merged = {tuple(row[key] for key in keys): row for row in rows}
+    for key, (count, last_seen) in cold.items():
+        row = merged.get(key)
+        if row is None:
+            merged[key] = {**dict(zip(keys, key)), "count": count, "last_seen": last_seen}
+        else:
+            row["count"] += count
+            row["last_seen"] = max(row["last_seen"] or 0, last_seen or 0) or None
+    return sorted(merged.values(), key=lambda row: row["count"], reverse=True)
+
+
+def _timeline_label(group_by: str | None, key: object, node_info: dict[int, dict]) -> tuple:
+    if group_by == "portnum":
+        if key == NO_PORTNUM:
+            return None, "unknown"
+        try:
+            return key, portnums_pb2.PortNum.Name(key)
+        except ValueError:
+            return key, str(key)
+    if group_by == "channel":
+        return (None, "unknown") if key == NO_CHANNEL else (key, str(key))
+    if group_by == "gateway":
+        return (None, "unknown") if key == NO_GATEWAY else (key, key)
+    if group_by == "node":
+        return key, _node_label(key, node_info)
+    return None, "all"
 
 
 def _median(values: list[float]) -> float | None:
@@ -190,119 +329,370 @@ def _median(values: list[float]) -> float | None:
     return sorted_values[mid]
 
 
-def _parse_channel_from_topic(topic: str) -> str | None:
-    parts = topic.split("/")
-    if len(parts) < 5:
+def _gateway_node_id(gateway_id: str) -> int | None:
+    try:
+        return int(gateway_id[1:], 16) if gateway_id.startswith("!") else None
+    except ValueError:
         return None
-    candidate = parts[4]
-    if not candidate or candidate.startswith("!"):
+
+
+def _label_gateways(rows: list[dict], node_info: dict[int, dict]) -> list[dict]:
+    for row in rows:
+        node_id = _gateway_node_id(row["gateway_id"])
+        row["gateway_label"] = _node_label(node_id, node_info) if node_id is not None else row["gateway_id"]
+    return rows
+
+
+def _top_senders(sketch, node_info: dict[int, dict]) -> list[dict]:
+    return [
+        {**entry, "key": int(entry["key"]), "label": _node_label(int(entry["key"]), node_info)}
+        for entry in sketch.senders.top(10)
+    ]
+
+
+def _decode_message(
+    topic: str,
+    payload: bytes,
+    keys_b64: list[str],
+    received_at: float | None = None,
+):
+    envelope = decode_envelope(payload)
+    if envelope is None:
+        DECODE_RESULTS.inc(status="invalid_envelope")
+        return None
+
+    channel_name = channel_from_topic(topic)
+    decoded = decode_packet(
+        envelope, keys_b64, channel_name=channel_name, received_at=received_at
+    )
+    if decoded is None:
+        DECODE_RESULTS.inc(status="empty")
         return None
-    return candidate
+    DECODE_RESULTS.inc(status=(decoded.details or {}).get("decode_status", "none"))
+    if not should_store(decoded.details or {}):
+        return None
+    return decoded
 
 
-def _make_mqtt_client(app: FastAPI, config):
-    keys_b64 = config.decode_keys_b64 or [config.default_key_b64]
+# Returned by _store_packet for packets the storage policy skipped. They are
+# still published live, without a database id; row ids start at 1.
+THINNED = 0
+
+# Telemetry copies are relayed by other gateways well after the first one.
+TELEMETRY_DEDUPE_SECONDS = 600
+
+
+def _first_telemetry_copy(app: FastAPI, record: PacketRecord, details: dict, now: float) -> bool:
+    # Packet dedupe is per gateway. Telemetry is keyed on the sender and the
+    # report's own time, or its payload when the device has no clock, so
+    # copies heard through several gateways are stored once.
+    key = (record.from_id, details.get("time") or record.payload_b64)
+    seen = app.state.telemetry_seen
+    last_seen = seen.get(key)
+    if last_seen is not None and now - last_seen < TELEMETRY_DEDUPE_SECONDS:
+        return False
+    seen[key] = now
+    if len(seen) > 5000:
+        cutoff = now - TELEMETRY_DEDUPE_SECONDS
+        app.state.telemetry_seen = {key: ts for key, ts in seen.items() if ts >= cutoff}
+    return True
 
-    db_lock = app.state.db_lock
+
+def _store_packet(app: FastAPI, record: PacketRecord) -> int | None:
+    details = record.details or {}
     conn = app.state.db
-    queue = app.state.queue
-    loop = app.state.loop
     node_cache = app.state.node_cache
+    config = app.state.config
 
-    def on_message(client, userdata, msg):
-        envelope = decode_envelope(msg.payload)
-        if envelope is None:
-            return
+    waited = time.perf_counter()
+    with app.state.db_lock:
+        DB_LOCK_WAIT.observe(time.perf_counter() - waited)
+        now = time.time()
+        signature = packet_signature(record)
+        last_seen = app.state.dedupe.get(signature)
+        if last_seen and (now - last_seen) < app.state.dedupe_window:
+            DEDUPE_HITS.inc()
+            return None
+        app.state.dedupe[signature] = now
+        if len(app.state.dedupe) > 5000:
+            cutoff = now - app.state.dedupe_window
+            app.state.dedupe = {
+                sig: ts for sig, ts in app.state.dedupe.items() if ts >= cutoff
+            }
+        # A thinned packet only skips its packets row and the traffic rollups
+        # built from those rows; it is counted in packet_thinning instead.
+        stored = app.state.storage_policy.admit(record, int(now), app.state.write_queue.qsize())
 
-        channel_name = _parse_channel_from_topic(msg.topic)
-        decoded = decode_packet(envelope, keys_b64, channel_name=channel_name)
-        if decoded is None:
-            return
+        try:
+            touch_node(conn, record.from_id)
+            touch_node(conn, record.to_id)
+
+            if record.portnum == portnums_pb2.PortNum.NODEINFO_APP:
+                long_name, short_name = node_names(details)
+                if record.from_id is not None:
+                    update_node(conn, record.from_id, long_name, short_name)
+                    cached = node_cache.get(record.from_id, {})
+                    node_cache[record.from_id] = {
+                        **cached,
+                        "long_name": long_name or cached.get("long_name"),
+                        "short_name": short_name or cached.get("short_name"),
+                    }
 
-        record = decoded.record
-        details = decoded.details or {}
-        if not _should_store(details):
-            return
+            packet_id = insert_packet(conn, record) if stored else None
+            record_adjacency(
+                conn,
+                record.from_id,
+                record.to_id,
+                record.portnum,
+                record.created_at or int(now),
+            )
+            if stored:
+                record_traffic(conn, record, record.created_at or int(now))
+            record_reception(conn, record, record.created_at or int(now))
+            app.state.sketches.observe(conn, record, record.created_at or int(now))
+            if record.portnum == portnums_pb2.PortNum.POSITION_APP:
+                update_node_position(
+                    conn,
+                    record.from_id,
+                    details.get("latitude"),
+                    details.get("longitude"),
+                    details.get("altitude"),
+                    record.created_at or int(now),
+                    packet_id=packet_id,
+                    keep_history=config.position_history,
+                )
+            elif record.portnum == portnums_pb2.PortNum.TELEMETRY_APP and _first_telemetry_copy(
+                app, record, details, now
+            ):
+                insert_telemetry(
+                    conn,
+                    record.from_id,
+                    extract_telemetry_metrics(details),
+                    record.created_at or int(now),
+                )
+            thinned = app.state.storage_policy.take_thinned()
+            if thinned:
+                record_thinned(conn, thinned)
+            app.state.sketches.flush(conn)
+            committing = time.perf_counter()
+            conn.commit()
+            DB_COMMIT.observe(time.perf_counter() - committing)
+        except Exception:
+            conn.rollback()
+            raise
+    if not stored:
+        return THINNED
+    PACKETS_STORED.inc(portname=record.portname)
+    LAST_PACKET_TIME.set(now)
+    return packet_id
 
-        with db_lock:
-            now = time.time()
-            signature = _packet_signature(record)
-            last_seen = app.state.dedupe.get(signature)
-            if last_seen and (now - last_seen) < app.state.dedupe_window:
-                return
-            app.state.dedupe[signature] = now
-            if len(app.state.dedupe) > 5000:
-                cutoff = now - app.state.dedupe_window
-                app.state.dedupe = {
-                    sig: ts for sig, ts in app.state.dedupe.items() if ts >= cutoff
-                }
 
-            try:
-                touch_node(conn, record.get("from_id"))
-                touch_node(conn, record.get("to_id"))
-
-                if record.get("portnum") == portnums_pb2.PortNum.NODEINFO_APP:
-                    user = details.get("user") if isinstance(details, dict) else None
-                    if not isinstance(user, dict) and isinstance(details, dict):
-                        user = details
-                    long_name = user.get("long_name") if isinstance(user, dict) else None
-                    short_name = user.get("short_name") if isinstance(user, dict) else None
-                    if record.get("from_id") is not None:
-                        update_node(conn, record["from_id"], long_name, short_name)
-                        cached = node_cache.get(record["from_id"], {})
-                        node_cache[record["from_id"]] = {
-                            **cached,
-                            "long_name": long_name or cached.get("long_name"),
-                            "short_name": short_name or cached.get("short_name"),
-                        }
-
-                packet_id = insert_packet(conn, record)
-                conn.commit()
-            except Exception:
-                conn.rollback()
-                raise
-
-        event = {
-            **record,
-            "id": packet_id,
-            "details": details,
-            "from_label": _node_label(record.get("from_id"), node_cache),
-            "to_label": _node_label(record.get("to_id"), node_cache),
+def _publish_packet(app: FastAPI, record: PacketRecord, packet_id: int | None) -> None:
+    node_cache = app.state.node_cache
+    app.state.topology.add_packet(record, record.details)
+    app.state.layout.observe(record.from_id, record.to_id)
+
+    record.id = packet_id
+    record.from_label = _node_label(record.from_id, node_cache)
+    record.to_label = _node_label(record.to_id, node_cache)
+    if record.portnum in (portnums_pb2.PortNum.TRACEROUTE_APP, portnums_pb2.PortNum.ROUTING_APP):
+        # The stored details_json is already written; only the live event carries labels.
+        _decorate_route_details(record, node_cache)
+        record.details_changed()
+
+    if not should_store(record.details) or app.state.loop is None:
+        return
+    # Assigned here so API workers behind an ingest process all see the same numbers.
+    record.seq = next(app.state.event_seq)
+    if app.state.publisher is not None:
+        app.state.loop.call_soon_threadsafe(app.state.publisher.publish, record.to_json())
+    else:
+        # Serialized lazily, and only once a client or a replay needs it.
+        app.state.loop.call_soon_threadsafe(
+            _enqueue_event, app, record.seq, record, record.portnum, record.from_id
+        )
+
+
+BROADCAST_LANES = ("critical", "normal", "bulk")
+BROADCAST_LANE_BY_PORT = {
+    portnums_pb2.PortNum.TEXT_MESSAGE_APP: "critical",
+    portnums_pb2.PortNum.TRACEROUTE_APP: "critical",
+    portnums_pb2.PortNum.ROUTING_APP: "critical",
+    portnums_pb2.PortNum.TELEMETRY_APP: "bulk",
+    portnums_pb2.PortNum.MAP_REPORT_APP: "bulk",
+}
+
+
+def _enqueue_event(
+    app: FastAPI,
+    seq: int,
+    item: PacketRecord | str,
+    portnum: int | None,
+    from_id: int | None,
+) -> None:
+    # The ring keeps every event for resuming clients even when the live
+    # broadcast coalesces or sheds it.
+    app.state.ring.append(seq, item)
+    lane = BROADCAST_LANE_BY_PORT.get(portnum, "normal")
+    app.state.broadcaster.put(lane, seq, item, key=(portnum, from_id))
+
+
+def _apply_remote_event(app: FastAPI, event: dict, raw: str) -> None:
+    details = event.get("details") or {}
+    app.state.topology.add_packet(event, details)
+    if event.get("portnum") == portnums_pb2.PortNum.NODEINFO_APP and event.get("from_id") is not None:
+        long_name, short_name = node_names(details)
+        cached = app.state.node_cache.get(event["from_id"], {})
+        app.state.node_cache[event["from_id"]] = {
+            **cached,
+            "long_name": long_name or cached.get("long_name"),
+            "short_name": short_name or cached.get("short_name"),
         }
-        _decorate_route_details(event, node_cache)
+    seq = event.get("seq")
+    if isinstance(seq, int):
+        _enqueue_event(app, seq, raw, event.get("portnum"), event.get("from_id"))
 
-        def _put_safe(q, item):
-            try:
-                q.put_nowait(item)
-            except asyncio.QueueFull:
-                pass
 
-        if _include_in_feed(event):
-            loop.call_soon_threadsafe(_put_safe, queue, event)
+def _writer_loop(app: FastAPI) -> None:
+    write_queue = app.state.write_queue
+    sketches = app.state.sketches
+    while True:
+        try:
+            record = write_queue.get(timeout=sketches.flush_seconds)
+        except queue.Empty:
+            # Save thinned counts and open sketch buckets when traffic goes quiet too.
+            _flush_pending(app)
+            continue
+        if record is None:
+            _flush_pending(app, force=True)
+            write_queue.task_done()
+            return
+        try:
+            packet_id = _store_packet(app, record)
+            if packet_id is not None:
+                _publish_packet(app, record, None if packet_id == THINNED else packet_id)
+        except Exception:
+            logger.exception("failed to store packet from %s", record.gateway_id)
+        finally:
+            write_queue.task_done()
+
+
+def _flush_pending(app: FastAPI, force: bool = False) -> None:
+    with app.state.db_lock:
+        try:
+            thinned = app.state.storage_policy.take_thinned()
+            if thinned:
+                record_thinned(app.state.db, thinned)
+            app.state.sketches.flush(app.state.db, force=force)
+            app.state.db.commit()
+        except sqlite3.Error:
+            app.state.db.rollback()
+            logger.exception("failed to save thinned counts and metric sketches")
+
 
+def _make_message_handler(app: FastAPI, config, label: str = ""):
+    keys_b64 = config.decode_keys_b64 or [config.default_key_b64]
+
+    capture = app.state.capture
+
+    def on_message(client, userdata, msg):
+        MQTT_MESSAGES.inc(subscription=label)
+        if capture is not None:
+            capture.write(msg.topic, msg.payload)
+        decoded = _decode_message(msg.topic, msg.payload, keys_b64)
+        if decoded is None:
+            return
+        # Blocks the client's network thread when the writer falls behind, which
+        # pushes backpressure onto the broker instead of dropping packets here.
+        app.state.write_queue.put(decoded)
+
+    return on_message
+
+
+def _make_mqtt_client(app: FastAPI, config, subscription, index: int = 0):
+    from paho.mqtt.client import MQTTv5, MQTTv311, Client, CallbackAPIVersion
+
+    client_id = config.mqtt_client_id if index == 0 else f"{config.mqtt_client_id}-{index}"
+    if subscription.share_group:
+        # Every member of a shared subscription needs its own session.
+        client_id = f"{client_id}-{socket.gethostname()}"
     client = Client(
-        client_id="meshviz-decoder",
+        client_id=client_id,
         callback_api_version=CallbackAPIVersion.VERSION2,
+        protocol=MQTTv5 if subscription.share_group else MQTTv311,
     )
-    client.on_message = on_message
+    label = subscription.label
+    client.on_message = _make_message_handler(app, config, label)
+
+    def set_subscribed(subscribed: bool) -> None:
+        app.state.mqtt_subscribed[label] = subscribed
+        MQTT_SUBSCRIBED.set(1 if subscribed else 0, subscription=label)
+
+    def on_connect(client, userdata, flags, reason_code, properties):
+        if reason_code.is_failure:
+            logger.warning("MQTT connect to %s refused: %s", label, reason_code)
+            return
+        client.subscribe(subscription.subscribe_topic)
 
-    if config.mqtt_user:
-        client.username_pw_set(config.mqtt_user, config.mqtt_pass)
+    def on_subscribe(client, userdata, mid, reason_code_list, properties):
+        granted = not any(code.is_failure for code in reason_code_list)
+        if not granted:
+            logger.warning("MQTT subscription %s refused: %s", label, reason_code_list)
+        set_subscribed(granted)
 
-    client.connect(config.mqtt_broker, config.mqtt_port, 60)
-    client.subscribe(config.mqtt_topic)
+    def on_disconnect(client, userdata, flags, reason_code, properties):
+        logger.warning("MQTT connection to %s lost: %s", label, reason_code)
+        set_subscribed(False)
+
+    client.on_connect = on_connect
+    client.on_subscribe = on_subscribe
+    client.on_disconnect = on_disconnect
+
+    if subscription.user:
+        client.username_pw_set(subscription.user, subscription.password)
+
+    set_subscribed(False)
+    # The network thread connects and keeps reconnecting, so a broker that is
+    # down at startup delays live data instead of failing the ingest stage.
+    client.connect_async(subscription.broker, subscription.port, 60)
     client.loop_start()
     return client
 
 
-def create_app() -> FastAPI:
+ROLES = ("all", "ingest", "api")
+
+
+def create_app(role: str | None = None) -> FastAPI:
+    role = role or os.environ.get("MESHVIZ_ROLE", "all")
+    if role not in ROLES:
+        raise ValueError(f"MESHVIZ_ROLE must be one of {', '.join(ROLES)}, got {role!r}")
     app = FastAPI()
+    app.state.role = role
     app.state.clients = set()
-    app.state.queue = asyncio.Queue(maxsize=1000)
+    app.state.broadcaster = Broadcaster(
+        BROADCAST_LANES,
+        size=int(os.environ.get("BROADCAST_LANE_SIZE", "1000")),
+        coalesce=("bulk",),
+    )
+    app.state.ring = EventRing(int(os.environ.get("WS_REPLAY_SIZE", "5000")))
+    app.state.event_seq = sequence_counter()
+    app.state.client_seq = {}
     app.state.db_lock = threading.Lock()
     app.state.loop = None
     app.state.dedupe = {}
     app.state.dedupe_window = int(os.environ.get("DEDUPE_WINDOW", "6"))
+    app.state.telemetry_seen = {}
+    app.state.profiler = SamplingProfiler()
+    app.state.admin_token = os.environ.get("ADMIN_TOKEN") or None
+    SLOW_QUERIES.configure(
+        enabled=os.environ.get("SLOW_QUERY_MS") is not None,
+        threshold_ms=float(os.environ.get("SLOW_QUERY_MS", "100")),
+    )
+    QUEUE_DEPTH.set_function(app.state.broadcaster.qsize)
+    WS_CLIENTS.set_function(lambda: len(app.state.clients))
+    app.state.playback_streams = set()
+    PLAYBACK_STREAMS.set_function(lambda: len(app.state.playback_streams))
+    app.state.topology = TopologyEngine(int(os.environ.get("TOPOLOGY_WINDOW", "86400")))
 
     base_dir = Path(__file__).resolve().parent.parent
     config_path = Path(os.environ.get("CONFIG_PATH", base_dir / "config.txt"))
@@ -310,34 +700,157 @@ def create_app() -> FastAPI:
 
     config = load_config(config_path, db_path)
     app.state.config = config
-    app.state.db = connect(config.db_path)
-    with app.state.db_lock:
-        app.state.node_cache = fetch_nodes(app.state.db)
+    app.state.archive = PacketArchive(config.archive_dir) if config.archive_dir else None
+    # With an archive, port and channel summaries reach back a year; the rest of
+    # the API stays on the hot database.
+    summary_window = 86400 * 366 if app.state.archive is not None else 86400 * 7
+    app.state.storage_policy = StoragePolicy(
+        dict(config.store_thin), config.store_thin_mode, config.store_thin_queue
+    )
+    app.state.events_socket = default_socket_path(config.db_path)
+    app.state.publisher = EventPublisher(app.state.events_socket) if role == "ingest" else None
+    app.state.db = None
+    app.state.mqtt_clients = []
+    app.state.write_queue = queue.Queue(maxsize=int(os.environ.get("WRITE_QUEUE_SIZE", "10000")))
+    app.state.writer = None
+    WRITE_QUEUE_DEPTH.set_function(app.state.write_queue.qsize)
+    app.state.capture = None
+    app.state.node_cache = {}
+    app.state.tasks = []
+    app.state.maintenance = None
+    app.state.layout = GraphLayout()
+    app.state.sketches = MetricSketches(float(os.environ.get("SKETCH_FLUSH_SECONDS", "5")))
+    app.state.ready = False
+    app.state.mqtt_subscribed = {}
+    app.state.startup_stage = "starting"
+    app.state.startup_error = None
+    app.state.startup_timings = {}
 
     @app.on_event("startup")
     async def _startup():
         app.state.loop = asyncio.get_running_loop()
-        app.state.mqtt = _make_mqtt_client(app, config)
-        app.state.broadcast_task = asyncio.create_task(_broadcast_loop(app))
+        app.state.tasks.append(asyncio.create_task(_broadcast_loop(app)))
+        # Storage and cache work runs after the server is listening, so
+        # /api/health answers at once and /api/ready reports progress.
+        app.state.tasks.append(asyncio.create_task(_warm_up(app)))
 
     @app.on_event("shutdown")
     async def _shutdown():
-        app.state.broadcast_task.cancel()
-        try:
-            await app.state.broadcast_task
-        except Exception:
-            pass
-        app.state.mqtt.loop_stop()
-        app.state.mqtt.disconnect()
+        for task in app.state.tasks:
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        for client in app.state.mqtt_clients:
+            client.loop_stop()
+            client.disconnect()
+        if app.state.writer is not None:
+            app.state.write_queue.put(None)
+            await asyncio.to_thread(app.state.writer.join, 10)
+        if app.state.publisher is not None:
+            await app.state.publisher.close()
+        if app.state.capture is not None:
+            app.state.capture.close()
 
     @app.get("/api/health")
     async def health():
         return {
             "status": "ok",
+            "ready": app.state.ready,
+            "role": role,
             "broker": config.mqtt_broker,
             "topic": config.mqtt_topic,
+            "subscriptions": [
+                subscription.label for subscription in config.mqtt_subscriptions
+            ],
         }
 
+    @app.get("/api/ready")
+    async def ready():
+        # Ingesting roles are only ready while every MQTT subscription is live.
+        subscribed = all(app.state.mqtt_subscribed.values())
+        body = {
+            "ready": app.state.ready and subscribed,
+            "stage": app.state.startup_stage,
+            "timings": app.state.startup_timings,
+        }
+        if app.state.mqtt_subscribed:
+            body["mqtt"] = dict(app.state.mqtt_subscribed)
+        if app.state.startup_error:
+            body["error"] = app.state.startup_error
+        return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+    def require_admin(x_admin_token: str | None = Header(default=None)):
+        # Without a configured token the admin endpoints stay switched off.
+        if not app.state.admin_token:
+            raise HTTPException(status_code=404, detail="admin endpoints are disabled; set ADMIN_TOKEN")
+        if x_admin_token != app.state.admin_token:
+            raise HTTPException(status_code=403, detail="admin token required")
+
+    @app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+    async def admin_profile(seconds: float = 10, interval_ms: float = 5):
+        seconds = max(0.1, min(seconds, 120))
+        interval = max(0.001, interval_ms / 1000)
+        try:
+            collapsed, samples = await asyncio.to_thread(
+                app.state.profiler.run, seconds, interval
+            )
+        except ProfilerBusy as exc:
+            raise HTTPException(status_code=409, detail=str(exc))
+        return PlainTextResponse(
+            collapsed,
+            headers={
+                "Content-Disposition": 'attachment; filename="profile.collapsed"',
+                "X-Profile-Samples": str(samples),
+            },
+        )
+
+    @app.get("/api/admin/slow-queries", dependencies=[Depends(require_admin)])
+    async def admin_slow_queries(limit: int = 100):
+        entries = list(SLOW_QUERIES.entries)[-max(limit, 0):] if limit else []
+        return {**SLOW_QUERIES.settings(), "entries": entries[::-1]}
+
+    @app.post("/api/admin/slow-queries", dependencies=[Depends(require_admin)])
+    async def admin_configure_slow_queries(
+        enabled: bool | None = None,
+        threshold_ms: float | None = None,
+        clear: bool = False,
+    ):
+        SLOW_QUERIES.configure(enabled=enabled, threshold_ms=threshold_ms)
+        if clear:
+            SLOW_QUERIES.entries.clear()
+        return SLOW_QUERIES.settings()
+
+    def require_maintenance() -> MaintenanceScheduler:
+        if app.state.maintenance is None:
+            raise HTTPException(
+                status_code=409, detail="maintenance runs in the process that writes the database"
+            )
+        return app.state.maintenance
+
+    @app.get("/api/admin/maintenance", dependencies=[Depends(require_admin)])
+    async def admin_maintenance():
+        return await asyncio.to_thread(require_maintenance().status)
+
+    @app.post("/api/admin/maintenance", dependencies=[Depends(require_admin)])
+    async def admin_run_maintenance(job: str):
+        maintenance = require_maintenance()
+        if job not in maintenance.jobs:
+            raise HTTPException(
+                status_code=400, detail=f"job must be one of {', '.join(maintenance.jobs)}"
+            )
+        try:
+            return await asyncio.to_thread(maintenance.run, job)
+        except sqlite3.Error as exc:
+            raise HTTPException(status_code=409, detail=str(exc))
+
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        return PlainTextResponse(
+            REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+        )
+
     @app.get("/api/packets")
     async def packets(
         limit: int = 200,
@@ -365,12 +878,46 @@ def create_app() -> FastAPI:
         packets = [_packet_for_api(row, nodes) for row in rows]
         return [packet for packet in packets if _include_in_feed(packet)]
 
+    @app.get("/api/search")
+    async def search(
+        q: str,
+        window: int | None = None,
+        channel: int | None = None,
+        node: int | None = None,
+        gateway: str | None = None,
+        limit: int = 50,
+        offset: int = 0,
+    ):
+        limit = max(1, min(limit, 200))
+        offset = max(offset, 0)
+        with closing(connect_read(app.state.config.db_path)) as conn:
+            rows = search_text(
+                conn,
+                q,
+                limit,
+                offset=offset,
+                window_seconds=window if window else None,
+                channel=channel,
+                node_id=node,
+                gateway_id=gateway,
+            )
+            nodes = fetch_nodes(conn)
+        results = [_packet_for_api(row, nodes) for row in rows]
+        return {
+            "query": q,
+            "offset": offset,
+            "next_offset": offset + limit if len(rows) == limit else None,
+            "results": results,
+        }
+
     @app.get("/api/graph")
     async def graph(
         window: int = 3600,
         portnum: str | None = None,
         channel: int | None = None,
         gateway: str | None = None,
+        cluster_above: int | None = None,
+        cluster_degree: int = 1,
     ):
         portnums = _parse_portnums(portnum)
         with closing(connect_read(app.state.config.db_path)) as conn:
@@ -382,6 +929,7 @@ def create_app() -> FastAPI:
                 gateway_id=gateway,
             )
             node_info = fetch_nodes(conn)
+            layout = fetch_graph_layout(conn)
 
         nodes = {}
         links = []
@@ -392,9 +940,12 @@ def create_app() -> FastAPI:
                 continue
             for node_id in (source, target):
                 if node_id not in nodes:
+                    x, y = layout.get(node_id, (None, None))
                     nodes[node_id] = {
                         "id": node_id,
                         "label": _node_label(node_id, node_info),
+                        "x": x,
+                        "y": y,
                     }
             links.append(
                 {
@@ -407,8 +958,29 @@ def create_app() -> FastAPI:
                 }
             )
 
+        nodes = list(nodes.values())
+        if cluster_above is not None and len(nodes) > cluster_above:
+            nodes, links = cluster_low_degree(nodes, links, cluster_degree)
+        return {
+            "nodes": nodes,
+            "links": links,
+        }
+
+    @app.get("/api/topology")
+    async def topology(component: int | None = None, min_count: int = 1):
+        snapshot = await asyncio.to_thread(app.state.topology.snapshot)
+        node_cache = app.state.node_cache
+        nodes = snapshot["nodes"]
+        links = snapshot["links"]
+        if component is not None:
+            nodes = [node for node in nodes if node["component"] == component]
+            members = {node["id"] for node in nodes}
+            links = [link for link in links if link["source"] in members]
+        if min_count > 1:
+            links = [link for link in links if link["count"] >= min_count]
         return {
-            "nodes": list(nodes.values()),
+            **snapshot,
+            "nodes": [{**node, "label": _node_label(node["id"], node_cache)} for node in nodes],
             "links": links,
         }
 
@@ -438,42 +1010,151 @@ def create_app() -> FastAPI:
         portnum: str | None = None,
         channel: int | None = None,
         gateway: str | None = None,
+        depth: int = 1,
     ):
         portnums = _parse_portnums(portnum)
+        window = min(window, 86400 * 7)
+        node_cache = app.state.node_cache
+        neighborhood = None
         with closing(connect_read(app.state.config.db_path)) as conn:
-            nodes = fetch_nodes(conn)
             packets = fetch_node_packets(
                 conn,
                 node_id,
-                min(window, 86400 * 7),
+                window,
                 min(limit, 200),
                 portnums=portnums,
                 channel=channel,
                 gateway_id=gateway,
             )
-            ports = fetch_node_ports(
+            use_adjacency = channel is None and not gateway
+            adjacency = []
+            if use_adjacency or depth >= 2:
+                adjacency = fetch_node_adjacency(conn, node_id, window, portnums=portnums)
+            if use_adjacency:
+                ports, peers = _summarize_adjacency(adjacency, 20)
+            else:
+                ports = fetch_node_ports(
+                    conn,
+                    node_id,
+                    window,
+                    portnums=portnums,
+                    channel=channel,
+                    gateway_id=gateway,
+                )
+                peers = fetch_node_peers(
+                    conn,
+                    node_id,
+                    window,
+                    20,
+                    portnums=portnums,
+                    channel=channel,
+                    gateway_id=gateway,
+                )
+            if depth >= 2:
+                first_hop = sorted(
+                    {
+                        row["peer_id"]
+                        for row in adjacency
+                        if row["peer_id"] not in (node_id, BROADCAST_ID)
+                    }
+                )
+                links = fetch_neighborhood_links(
+                    conn, [node_id, *first_hop], window, portnums=portnums
+                )
+                neighborhood = _build_neighborhood(node_id, first_hop, links, node_cache)
+            nodes = fetch_nodes_by_id(conn, [node_id])
+        node_info = nodes.get(node_id, {"node_id": node_id})
+        result = {
+            "node": node_info,
+            "packets": [_packet_for_api(row, node_cache) for row in packets],
+            "ports": ports,
+            "peers": peers,
+        }
+        if neighborhood is not None:
+            result["neighborhood"] = neighborhood
+        return result
+
+    @app.get("/api/node/{node_id}/gateways")
+    async def node_gateways(node_id: int, heard_within: int | None = None):
+        with closing(connect_read(app.state.config.db_path)) as conn:
+            rows = fetch_node_gateways(conn, node_id, heard_within)
+        return {
+            "node_id": node_id,
+            "label": _node_label(node_id, app.state.node_cache),
+            "gateways": _label_gateways(rows, app.state.node_cache),
+        }
+
+    @app.get("/api/gateways")
+    async def gateways(heard_within: int | None = None, limit: int = 500):
+        with closing(connect_read(app.state.config.db_path)) as conn:
+            rows = fetch_gateways(conn, heard_within, min(limit, 5000))
+        return _label_gateways(rows, app.state.node_cache)
+
+    @app.get("/api/gateway/{gateway_id}")
+    async def gateway_nodes(gateway_id: str, heard_within: int | None = None, limit: int = 500):
+        node_cache = app.state.node_cache
+        with closing(connect_read(app.state.config.db_path)) as conn:
+            rows = fetch_gateway_nodes(conn, gateway_id, heard_within, min(limit, 5000))
+        for row in rows:
+            row["label"] = _node_label(row["node_id"], node_cache)
+        return {"gateway_id": gateway_id, "nodes": rows}
+
+    @app.get("/api/positions")
+    async def positions(
+        window: int | None = None,
+        min_lat: float | None = None,
+        min_lon: float | None = None,
+        max_lat: float | None = None,
+        max_lon: float | None = None,
+        limit: int = 5000,
+    ):
+        bbox = None
+        if None not in (min_lat, min_lon, max_lat, max_lon):
+            bbox = (min_lat, min_lon, max_lat, max_lon)
+        with closing(connect_read(app.state.config.db_path)) as conn:
+            rows = fetch_positions(
                 conn,
-                node_id,
-                min(window, 86400 * 7),
-                portnums=portnums,
-                channel=channel,
-                gateway_id=gateway,
+                window_seconds=window if window else None,
+                bbox=bbox,
+                limit=min(limit, 20000),
             )
-            peers = fetch_node_peers(
+        for row in rows:
+            row["label"] = _node_label(row["node_id"], {row["node_id"]: row})
+        return rows
+
+    @app.get("/api/node/{node_id}/positions")
+    async def node_positions(
+        node_id: int,
+        window: int = 86400,
+        limit: int = 500,
+    ):
+        with closing(connect_read(app.state.config.db_path)) as conn:
+            rows = fetch_position_history(
                 conn,
                 node_id,
                 min(window, 86400 * 7),
-                20,
-                portnums=portnums,
-                channel=channel,
-                gateway_id=gateway,
+                min(limit, 5000),
             )
-        node_info = nodes.get(node_id, {"node_id": node_id})
+        return rows
+
+    @app.get("/api/node/{node_id}/telemetry")
+    async def node_telemetry(
+        node_id: int,
+        metric: str | None = None,
+        window: int = 86400,
+        step: int | None = None,
+    ):
+        window = min(window, 86400 * 7)
+        with closing(connect_read(app.state.config.db_path)) as conn:
+            if not metric:
+                return {"node_id": node_id, "metrics": fetch_telemetry_metrics(conn, node_id)}
+            step, points = fetch_telemetry_series(conn, node_id, metric, window, step)
         return {
-            "node": node_info,
-            "packets": [_packet_for_api(row, nodes) for row in packets],
-            "ports": ports,
-            "peers": peers,
+            "node_id": node_id,
+            "metric": metric,
+            "window": window,
+            "step": step,
+            "points": points,
         }
 
     @app.get("/api/metrics")
@@ -485,6 +1166,8 @@ def create_app() -> FastAPI:
     ):
         portnums = _parse_portnums(portnum)
         window = min(window, 86400 * 7)
+        # Sketches cover all traffic, so filtered views still count exactly.
+        unfiltered = not portnums and channel is None and not gateway
         with closing(connect_read(app.state.config.db_path)) as conn:
             data = fetch_metric_counts(
                 conn,
@@ -492,29 +1175,148 @@ def create_app() -> FastAPI:
                 portnums=portnums,
                 channel=channel,
                 gateway_id=gateway,
+                distinct_nodes=not unfiltered,
+            )
+            sketch = merged_sketch(conn, window) if unfiltered else None
+            # Thinning is tracked per port only, so it is left out of channel and gateway views.
+            thinned = (
+                sum(fetch_thinned_counts(conn, window, portnums).values())
+                if channel is None and not gateway
+                else None
             )
         packets_per_min = data["total_packets"] / max(window / 60, 1)
         return {
             "packets_per_min": round(packets_per_min, 2),
-            "active_nodes": data["active_nodes"],
+            "thinned_packets": thinned,
+            "active_nodes": sketch.nodes.count() if sketch else data["active_nodes"],
+            "active_nodes_estimated": sketch is not None,
             "top_ports": data["top_ports"],
+            "top_senders": _top_senders(sketch, app.state.node_cache) if sketch else None,
+            "top_gateways": sketch.gateways.top(10) if sketch else None,
+            "top_channels": (
+                [{**entry, "key": int(entry["key"])} for entry in sketch.channels.top(10)]
+                if sketch
+                else None
+            ),
             "median_rssi": _median([value for value in data["rssi_values"] if value is not None]),
             "median_snr": _median([value for value in data["snr_values"] if value is not None]),
         }
 
+    @app.get("/api/timeline")
+    async def timeline(
+        window: int = 3600,
+        bucket: int = 60,
+        group_by: str | None = None,
+        portnum: str | None = None,
+        channel: int | None = None,
+        gateway: str | None = None,
+        limit: int = 10,
+    ):
+        if group_by is not None and group_by not in TIMELINE_GROUPS:
+            raise HTTPException(
+                status_code=400, detail=f"group_by must be one of {', '.join(TIMELINE_GROUPS)}"
+            )
+        window = max(60, min(window, 86400 * 7))
+        # Whole rollup steps that retention still covers, and never more than
+        # 2000 points per series.
+        step = timeline_base_step(window, per_node=group_by == "node")
+        bucket = max(bucket, -(-window // 2000), step)
+        bucket = -(-bucket // step) * step
+        portnums = _parse_portnums(portnum)
+        with closing(connect_read(app.state.config.db_path)) as conn:
+            rows = fetch_timeline(
+                conn,
+                window,
+                bucket,
+                group_by=group_by,
+                portnums=portnums,
+                channel=channel,
+                gateway_id=gateway,
+            )
+            # Thinning is tracked per port only, so it is left out of channel,
+            # gateway and node views.
+            thinned_rows = (
+                fetch_thinned_timeline(conn, window, bucket, portnums)
+                if channel is None and not gateway and group_by in (None, "portnum")
+                else None
+            )
+        thinned: dict[tuple, int] | None = None
+        if thinned_rows is not None:
+            thinned = {}
+            for (ts, port), count in thinned_rows.items():
+                slot = (ts, port if group_by else None)
+                thinned[slot] = thinned.get(slot, 0) + count
+        series: dict[object, dict] = {}
+        for row in rows:
+            key = row.get("key")
+            entry = series.setdefault(key, {"key": key, "total": 0, "points": []})
+            entry["total"] += row["count"]
+            point = {
+                "ts": row["ts"],
+                "count": row["count"],
+                "rssi_avg": round(row["rssi_sum"] / row["rssi_count"], 2) if row["rssi_count"] else None,
+                "rssi_min": row["rssi_min"],
+                "rssi_max": row["rssi_max"],
+                "snr_avg": round(row["snr_sum"] / row["snr_count"], 2) if row["snr_count"] else None,
+                "snr_min": row["snr_min"],
+                "snr_max": row["snr_max"],
+            }
+            if thinned is not None:
+                point["thinned"] = thinned.pop((row["ts"], key), 0)
+            entry["points"].append(point)
+        if thinned:
+            # Buckets where every packet was thinned still get a point.
+            for (ts, key), count in thinned.items():
+                entry = series.setdefault(key, {"key": key, "total": 0, "points": []})
+                entry["points"].append(
+                    {
+                        "ts": ts,
+                        "count": 0,
+                        **dict.fromkeys(("rssi_avg", "rssi_min", "rssi_max", "snr_avg", "snr_min", "snr_max")),
+                        "thinned": count,
+                    }
+                )
+            for entry in series.values():
+                entry["points"].sort(key=lambda point: point["ts"])
+        if thinned_rows is not None:
+            for entry in series.values():
+                entry["thinned"] = sum(point["thinned"] for point in entry["points"])
+        ranked = sorted(series.values(), key=lambda entry: entry["total"], reverse=True)
+        for entry in ranked:
+            entry["key"], entry["label"] = _timeline_label(group_by, entry["key"], app.state.node_cache)
+        return {
+            "window": window,
+            "bucket": bucket,
+            "group_by": group_by,
+            "thinned_packets": sum(thinned_rows.values()) if thinned_rows is not None else None,
+            "series": ranked[: max(limit, 1)] if group_by else ranked,
+            "other_total": sum(entry["total"] for entry in ranked[max(limit, 1):]) if group_by else 0,
+        }
+
     @app.get("/api/ports")
     async def ports(
         window: int = 3600,
         channel: int | None = None,
         gateway: str | None = None,
     ):
+        window = min(window, summary_window)
         with closing(connect_read(app.state.config.db_path)) as conn:
             rows = fetch_ports_summary(
                 conn,
-                min(window, 86400 * 7),
+                window,
                 channel=channel,
                 gateway_id=gateway,
             )
+            thinned = fetch_thinned_counts(conn, window) if channel is None and not gateway else None
+        if app.state.archive is not None and window > 86400 * 7:
+            now = int(time.time())
+            cold = await asyncio.to_thread(
+                app.state.archive.ports_summary, now - window, now + 1, channel, gateway
+            )
+            rows = _merge_summary(rows, cold, ("portnum", "portname"))
+        if thinned is not None:
+            for row in rows:
+                row["thinned"] = thinned.get(row["portnum"], 0)
         return rows
 
     @app.get("/api/channels")
@@ -524,24 +1326,117 @@ def create_app() -> FastAPI:
         gateway: str | None = None,
     ):
         portnums = _parse_portnums(portnum)
+        window = min(window, summary_window)
         with closing(connect_read(app.state.config.db_path)) as conn:
             rows = fetch_channels_summary(
                 conn,
-                min(window, 86400 * 7),
+                window,
                 portnums=portnums,
                 gateway_id=gateway,
             )
+        if app.state.archive is not None and window > 86400 * 7:
+            now = int(time.time())
+            cold = await asyncio.to_thread(
+                app.state.archive.channels_summary, now - window, now + 1, portnums, gateway
+            )
+            rows = _merge_summary(rows, {(channel,): value for channel, value in cold.items()}, ("channel",))
         return rows
 
     @app.websocket("/ws")
-    async def ws(websocket: WebSocket):
+    async def ws(websocket: WebSocket, last_seq: int | None = None):
         await websocket.accept()
-        app.state.clients.add(websocket)
+        ring = app.state.ring
         try:
+            cursor = ring.last_seq
+            if last_seq is not None:
+                missed = ring.since(last_seq)
+                if missed is None:
+                    WS_RESETS.inc()
+                    await websocket.send_text(json.dumps({"type": "reset", "seq": ring.last_seq}))
+                else:
+                    cursor = last_seq
+                    # Keep replaying until nothing new arrived during the sends; the
+                    # client joins the live set with no await in between.
+                    while missed:
+                        for seq, item in missed:
+                            await websocket.send_text(_event_payload(item))
+                            cursor = seq
+                        WS_REPLAYED.inc(len(missed))
+                        missed = ring.since(cursor) or []
+            app.state.client_seq[websocket] = cursor
+            app.state.clients.add(websocket)
+            await websocket.send_text(json.dumps({"type": "hello", "seq": cursor}))
             while True:
                 await websocket.receive_text()
         except WebSocketDisconnect:
+            pass
+        finally:
             app.state.clients.discard(websocket)
+            app.state.client_seq.pop(websocket, None)
+
+    @app.websocket("/ws/playback")
+    async def ws_playback(
+        websocket: WebSocket,
+        start: int,
+        end: int | None = None,
+        speed: float = 60.0,
+        after_id: int = 0,
+        portnum: str | None = None,
+        channel: int | None = None,
+        gateway: str | None = None,
+        max_idle: float = 2.0,
+    ):
+        await websocket.accept()
+        end = end if end is not None else start + 86400
+        if end <= start or not 0 < speed <= PLAYBACK_MAX_SPEED:
+            await websocket.send_text(
+                json.dumps({"type": "error", "detail": f"need start < end and 0 < speed <= {PLAYBACK_MAX_SPEED}"})
+            )
+            await websocket.close(code=1008)
+            return
+        if len(app.state.playback_streams) >= PLAYBACK_MAX_STREAMS:
+            await websocket.send_text(json.dumps({"type": "error", "detail": "too many playback streams"}))
+            await websocket.close(code=1013)
+            return
+        portnums = _parse_portnums(portnum)
+        clock = PlaybackClock(start, speed)
+        app.state.playback_streams.add(websocket)
+        reader = asyncio.create_task(_playback_controls(websocket, clock))
+        try:
+            await websocket.send_text(
+                json.dumps({"type": "start", "start": start, "end": end, "speed": speed})
+            )
+            cursor = (start, after_id)
+            sent = 0
+            while not clock.stopped:
+                page = await asyncio.to_thread(
+                    _read_playback_page, app, cursor, end, portnums, channel, gateway
+                )
+                for row in page:
+                    await clock.wait_until(row["created_at"], max_idle)
+                    if clock.stopped:
+                        break
+                    # A client that stops reading stalls this send; past the timeout
+                    # the stream is dropped rather than buffered.
+                    await asyncio.wait_for(
+                        websocket.send_text(json.dumps(_packet_for_api(row, app.state.node_cache))),
+                        timeout=PLAYBACK_SEND_TIMEOUT,
+                    )
+                    cursor = (row["created_at"], row["id"])
+                    sent += 1
+                PLAYBACK_PACKETS.inc(len(page))
+                if len(page) < PLAYBACK_PAGE_SIZE:
+                    await websocket.send_text(
+                        json.dumps({"type": "end", "cursor": list(cursor), "sent": sent})
+                    )
+                    await websocket.close()
+                    break
+        except (WebSocketDisconnect, asyncio.TimeoutError, RuntimeError):
+            pass
+        finally:
+            clock.stop()
+            reader.cancel()
+            app.state.playback_streams.discard(websocket)
 
     web_dir = base_dir / "web"
     app.mount("/", NoCacheStaticFiles(directory=web_dir, html=True), name="static")
@@ -549,32 +1444,220 @@ def create_app() -> FastAPI:
     return app
 
 
+SCHEMA_WAIT_SECONDS = float(os.environ.get("SCHEMA_WAIT_SECONDS", "300"))
+
+
+def _wait_for_schema(db_path: Path) -> None:
+    deadline = time.monotonic() + SCHEMA_WAIT_SECONDS
+    delay = 0.25
+    while True:
+        # Opening a missing file would create it, so wait for ingest to do that.
+        if db_path.exists():
+            with closing(connect_read(db_path)) as conn:
+                if schema_ready(conn):
+                    return
+        if time.monotonic() >= deadline:
+            raise RuntimeError(f"schema not created in {db_path} after {SCHEMA_WAIT_SECONDS:.0f}s; is ingest running?")
+        logger.info("waiting for ingest to create the schema in %s", db_path)
+        time.sleep(delay)
+        delay = min(delay * 2, 5.0)
+
+
+def open_storage(app: FastAPI) -> None:
+    config = app.state.config
+    if app.state.role == "api":
+        # API workers never write; the ingest process owns schema setup and backfills.
+        _wait_for_schema(config.db_path)
+        with closing(connect_read(config.db_path)) as conn:
+            app.state.node_cache = fetch_nodes(conn)
+            app.state.topology.load(conn)
+        return
+    app.state.db = connect(config.db_path)
+    if config.capture_dir is not None:
+        app.state.capture = CaptureWriter(config.capture_dir, config.capture_max_bytes)
+    app.state.maintenance = MaintenanceScheduler(
+        app.state.db,
+        config.db_path,
+        app.state.db_lock,
+        archive=app.state.archive,
+        archive_after_days=config.archive_after_days,
+    )
+    DB_WAL_BYTES.set_function(app.state.maintenance.wal_bytes)
+    with app.state.db_lock:
+        app.state.node_cache = fetch_nodes(app.state.db)
+        backfill_node_positions(app.state.db)
+        backfill_text_index(app.state.db)
+        backfill_node_adjacency(app.state.db)
+        backfill_traffic_rollups(app.state.db)
+        backfill_gateway_reception(app.state.db)
+        app.state.sketches.backfill(app.state.db)
+        app.state.topology.load(app.state.db)
+        app.state.layout.load(app.state.db)
+
+
+def _start_ingest(app: FastAPI) -> None:
+    config = app.state.config
+    app.state.writer = threading.Thread(
+        target=_writer_loop, args=(app,), name="db-writer", daemon=True
+    )
+    app.state.writer.start()
+    for index, subscription in enumerate(config.mqtt_subscriptions):
+        app.state.mqtt_clients.append(_make_mqtt_client(app, config, subscription, index))
+
+
+def _warm_caches(app: FastAPI) -> None:
+    app.state.topology.snapshot()
+    # Pull the pages behind the default dashboard queries into the OS cache.
+    with closing(connect_read(app.state.config.db_path)) as conn:
+        fetch_nodes_summary(conn, 3600)
+        fetch_metric_counts(conn, 3600)
+        fetch_ports_summary(conn, 3600)
+
+
+async def _start_subscriber(app: FastAPI) -> None:
+    app.state.tasks.append(
+        asyncio.create_task(
+            subscribe_events(
+                app.state.events_socket,
+                lambda event, raw: _apply_remote_event(app, event, raw),
+            )
+        )
+    )
+
+
+async def _warm_up(app: FastAPI) -> None:
+    stages = [("storage", lambda: asyncio.to_thread(open_storage, app))]
+    if app.state.role == "ingest":
+        stages.append(("publisher", app.state.publisher.start))
+    if app.state.role == "api":
+        stages.append(("subscriber", lambda: _start_subscriber(app)))
+    else:
+        stages.append(("ingest", lambda: asyncio.to_thread(_start_ingest, app)))
+    stages.append(("caches", lambda: asyncio.to_thread(_warm_caches, app)))
+    try:
+        for stage, run in stages:
+            app.state.startup_stage = stage
+            started = time.perf_counter()
+            await run()
+            app.state.startup_timings[stage] = round(time.perf_counter() - started, 3)
+    except Exception as exc:
+        logger.exception("startup failed during %s", app.state.startup_stage)
+        app.state.startup_error = f"{app.state.startup_stage}: {exc}"
+        return
+    if app.state.maintenance is not None:
+        app.state.tasks.append(asyncio.create_task(app.state.maintenance.loop()))
+        app.state.tasks.append(asyncio.create_task(_layout_loop(app)))
+    app.state.startup_stage = "ready"
+    app.state.ready = True
+    logger.info("ready after %s", app.state.startup_timings)
+
+
+def _event_payload(item: PacketRecord | str) -> str:
+    return item if isinstance(item, str) else item.to_json()
+
+
+async def _send_all(app: FastAPI, payload: str, seq: int) -> None:
+    client_seq = app.state.client_seq
+    # Clients that resumed may already hold this event from their replay. Lanes
+    # reorder events, so this is only the replay boundary, not the last seq sent.
+    clients = [ws for ws in app.state.clients if client_seq.get(ws, 0) < seq]
+
+    async def _send(ws: WebSocket):
+        try:
+            await asyncio.wait_for(ws.send_text(payload), timeout=2.0)
+            return ws, None
+        except asyncio.TimeoutError as e:
+            WS_SEND_FAILURES.inc(reason="timeout")
+            return ws, e
+        except Exception as e:
+            WS_SEND_FAILURES.inc(reason="error")
+            return ws, e
+
+    results = await asyncio.gather(*[_send(ws) for ws in clients])
+
+    for ws, error in results:
+        if error is not None:
+            app.state.clients.discard(ws)
+            client_seq.pop(ws, None)
+
+
 async def _broadcast_loop(app: FastAPI) -> None:
     while True:
-        event = await app.state.queue.get()
-        if not app.state.clients:
+        seq, item = await app.state.broadcaster.get()
+        if app.state.clients:
+            await _send_all(app, _event_payload(item), seq)
+
+
+PLAYBACK_PAGE_SIZE = int(os.environ.get("PLAYBACK_PAGE_SIZE", "200"))
+PLAYBACK_MAX_STREAMS = int(os.environ.get("PLAYBACK_MAX_STREAMS", "8"))
+PLAYBACK_MAX_SPEED = 86400.0
+PLAYBACK_SEND_TIMEOUT = 10.0
+
+
+def _read_playback_page(app: FastAPI, cursor, end, portnums, channel, gateway) -> list[dict]:
+    with closing(connect_read(app.state.config.db_path)) as conn:
+        return fetch_packets_after(
+            conn, cursor, end, PLAYBACK_PAGE_SIZE,
+            portnums=portnums, channel=channel, gateway_id=gateway,
+        )
+
+
+async def _playback_controls(websocket: WebSocket, clock: PlaybackClock) -> None:
+    # Runs until the client goes away, which is also how the sender notices.
+    while True:
+        try:
+            message = json.loads(await websocket.receive_text())
+        except json.JSONDecodeError:
             continue
-        payload = json.dumps(event)
-        
-        clients = list(app.state.clients)
-        
-        async def _send(ws: WebSocket):
+        except (WebSocketDisconnect, RuntimeError):
+            clock.stop()
+            return
+        action = message.get("type") if isinstance(message, dict) else None
+        if action == "pause":
+            clock.pause()
+        elif action == "resume":
+            clock.resume()
+        elif action == "speed":
             try:
-                await asyncio.wait_for(ws.send_text(payload), timeout=2.0)
-                return ws, None
-            except Exception as e:
-                return ws, e
+                speed = float(message.get("value"))
+            except (TypeError, ValueError):
+                continue
+            if 0 < speed <= PLAYBACK_MAX_SPEED:
+                clock.set_speed(speed)
+
+
+def _save_layout(app: FastAPI, positions: dict) -> None:
+    with app.state.db_lock:
+        try:
+            save_graph_layout(app.state.db, positions, int(time.time()))
+            app.state.db.commit()
+        except sqlite3.Error:
+            app.state.db.rollback()
+            logger.exception("failed to save graph layout")
+
 
-        results = await asyncio.gather(*[_send(ws) for ws in clients])
-        
-        for ws, error in results:
-            if error is not None:
-                app.state.clients.discard(ws)
+async def _layout_loop(app: FastAPI) -> None:
+    # Relaxation runs off the writer thread; only the save takes the write lock.
+    interval = float(os.environ.get("LAYOUT_SECONDS", "10"))
+    while True:
+        moved = await asyncio.to_thread(app.state.layout.relax)
+        if moved:
+            await asyncio.to_thread(_save_layout, app, moved)
+        await asyncio.sleep(interval)
 
 
-app = create_app()
+def __getattr__(name: str):
+    # `uvicorn backend.main:app` resolves this on first access, so importing
+    # the module has no side effects beyond loading code.
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
+    import uvicorn
+
     logging.basicConfig(level=logging.INFO)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(create_app(), host="0.0.0.0", port=8000)
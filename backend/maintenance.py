@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+
+from .archive import PacketArchive, archive_packets, day_start
+from .db import connect_read, prune_expired
+from .metrics import MAINTENANCE_DURATION
+
+
+logger = logging.getLogger(__name__)
+
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+
+class MaintenanceScheduler:
+    # Periodic housekeeping on the write connection. Every job takes the same
+    # lock as the packet writer, so it runs between transactions, never inside one.
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        db_path: Path,
+        lock: threading.Lock,
+        archive: PacketArchive | None = None,
+        archive_after_days: int = 8,
+    ) -> None:
+        self.conn = conn
+        self.db_path = Path(db_path)
+        self.lock = lock
+        self.archive = archive
+        self.archive_after_days = archive_after_days
+        self.wal_truncate_bytes = _env_int("WAL_TRUNCATE_MB", 64) * 1024 * 1024
+        self.vacuum_pages = _env_int("VACUUM_PAGES", 2000)
+        self.intervals = {
+            "checkpoint": _env_int("CHECKPOINT_SECONDS", 60),
+            "incremental_vacuum": _env_int("VACUUM_SECONDS", 3600),
+            "optimize": _env_int("OPTIMIZE_SECONDS", 3600),
+            "analyze": _env_int("ANALYZE_SECONDS", 86400),
+            "retention": _env_int("RETENTION_SECONDS", 3600),
+            "archive": _env_int("ARCHIVE_SECONDS", 3600) if archive is not None else 0,
+        }
+        self.jobs = {
+            "checkpoint": self._checkpoint,
+            "truncate": lambda: self._wal_checkpoint("TRUNCATE"),
+            "incremental_vacuum": self._incremental_vacuum,
+            "optimize": self._optimize,
+            "analyze": self._analyze,
+            "vacuum": self._vacuum,
+            "retention": self._retention,
+        }
+        if archive is not None:
+            self.jobs["archive"] = self._archive
+        # These take the lock themselves, only around their writes.
+        self.self_locking = {"archive", "retention"}
+        self.history: dict[str, dict] = {}
+
+    def wal_bytes(self) -> int:
+        try:
+            return os.path.getsize(f"{self.db_path}-wal")
+        except OSError:
+            return 0
+
+    def run(self, job: str) -> dict:
+        started = time.perf_counter()
+        if job in self.self_locking:
+            result = self.jobs[job]()
+        else:
+            with self.lock:
+                result = self.jobs[job]()
+        duration = time.perf_counter() - started
+        MAINTENANCE_DURATION.observe(duration, job=job)
+        entry = self.history.setdefault(job, {"runs": 0})
+        entry.update(
+            runs=entry["runs"] + 1,
+            last_run=time.time(),
+            duration_ms=round(duration * 1000, 3),
+            result=result,
+        )
+        return entry
+
+    def _wal_checkpoint(self, mode: str) -> dict:
+        busy, log_frames, checkpointed = self.conn.execute(
+            f"PRAGMA wal_checkpoint({mode})"
+        ).fetchone()
+        return {
+            "mode": mode,
+            "busy": bool(busy),
+            "log_frames": log_frames,
+            "checkpointed_frames": checkpointed,
+            "wal_bytes": self.wal_bytes(),
+        }
+
+    def _checkpoint(self) -> dict:
+        # PASSIVE never waits on readers. Only when the WAL has grown past the
+        # limit is it worth waiting for them to truncate the file back to zero.
+        if self.wal_bytes() > self.wal_truncate_bytes:
+            return self._wal_checkpoint("TRUNCATE")
+        return self._wal_checkpoint("PASSIVE")
+
+    def _incremental_vacuum(self) -> dict:
+        if self.conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            return {"skipped": "auto_vacuum is not incremental; run the vacuum job once"}
+        before = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        self.conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_pages})").fetchall()
+        after = self.conn.execute("PRAGMA freelist_count").fetchone()[0]
+        return {"freed_pages": before - after, "freelist_pages": after}
+
+    def _optimize(self) -> dict:
+        self.conn.execute("PRAGMA analysis_limit = 1000")
+        self.conn.execute("PRAGMA optimize")
+        return {}
+
+    def _analyze(self) -> dict:
+        self.conn.execute("PRAGMA analysis_limit = 1000")
+        self.conn.execute("ANALYZE")
+        self.conn.commit()
+        return {}
+
+    def _vacuum(self) -> dict:
+        # A full VACUUM rewrites the file, which is also how an existing
+        # database switches to auto_vacuum = INCREMENTAL. Only run on request.
+        self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        self.conn.execute("VACUUM")
+        return {"page_count": self.conn.execute("PRAGMA page_count").fetchone()[0]}
+
+    def _retention(self) -> dict:
+        return {"deleted": prune_expired(self.conn, self.lock)}
+
+    def _archive(self) -> dict:
+        before = day_start(time.time()) - (self.archive_after_days - 1) * 86400
+        with closing(connect_read(self.db_path)) as read_conn:
+            return archive_packets(self.conn, read_conn, self.lock, self.archive, before)
+
+    def status(self) -> dict:
+        with self.lock:
+            pragmas = {
+                name: self.conn.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in (
+                    "page_size",
+                    "page_count",
+                    "freelist_count",
+                    "auto_vacuum",
+                    "synchronous",
+                    "cache_size",
+                    "mmap_size",
+                )
+            }
+        pragmas["auto_vacuum"] = AUTO_VACUUM_MODES.get(pragmas["auto_vacuum"], pragmas["auto_vacuum"])
+        try:
+            db_bytes = os.path.getsize(self.db_path)
+        except OSError:
+            db_bytes = 0
+        return {
+            **pragmas,
+            "db_bytes": db_bytes,
+            "wal_bytes": self.wal_bytes(),
+            "wal_truncate_bytes": self.wal_truncate_bytes,
+            "intervals": self.intervals,
+            "jobs": self.history,
+        }
+
+    async def loop(self, tick: float = 5.0) -> None:
+        due = {job: time.monotonic() + interval for job, interval in self.intervals.items()}
+        while True:
+            await asyncio.sleep(tick)
+            now = time.monotonic()
+            for job, interval in self.intervals.items():
+                if interval <= 0 or now < due[job]:
+                    continue
+                due[job] = now + interval
+                try:
+                    await asyncio.to_thread(self.run, job)
+                except sqlite3.Error:
+                    logger.exception("maintenance job %s failed", job)
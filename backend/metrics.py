@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import bisect
+import math
+import threading
+from typing import Callable, Iterable
+
+
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: object) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = self.header()
+        if not items and not self.label_names:
+            items = [((), 0)]
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        callback: Callable[[], float] | None = None,
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels: object) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: object) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, callback: Callable[[], float] | None) -> None:
+        self._callback = callback
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        if self._callback is not None:
+            try:
+                value = float(self._callback())
+            except Exception:
+                value = math.nan
+            lines.append(f"{self.name} {_format_value(value) if not math.isnan(value) else 'NaN'}")
+            return lines
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: object) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = sorted(
+                (key, list(counts), total, count)
+                for key, (counts, total, count) in self._series.items()
+            )
+        lines = self.header()
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, math.inf), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labels))
+
+    def gauge(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        callback: Callable[[], float] | None = None,
+    ) -> Gauge:
+        return self._register(Gauge(name, help_text, labels, callback))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labels: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: list[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+MQTT_MESSAGES = REGISTRY.counter(
+    "meshviz_mqtt_messages_total", "MQTT messages received by subscription.", ["subscription"]
+)
+MQTT_SUBSCRIBED = REGISTRY.gauge(
+    "meshviz_mqtt_subscribed", "1 while the subscription is connected and its topic granted.", ["subscription"]
+)
+WRITE_QUEUE_DEPTH = REGISTRY.gauge(
+    "meshviz_write_queue_depth", "Decoded packets waiting for the database writer."
+)
+DECODE_RESULTS = REGISTRY.counter(
+    "meshviz_decode_total", "Decode outcomes by status.", ["status"]
+)
+DECRYPT_KEY_HITS = REGISTRY.counter(
+    "meshviz_decrypt_key_hits_total",
+    "Successful decryptions by configured key index and whether the channel-derived key matched.",
+    ["key", "derived"],
+)
+DEDUPE_HITS = REGISTRY.counter(
+    "meshviz_dedupe_hits_total", "Packets dropped as duplicates inside the dedupe window."
+)
+PACKETS_STORED = REGISTRY.counter(
+    "meshviz_packets_stored_total", "Packets written to the database by port.", ["portname"]
+)
+STORAGE_POLICY = REGISTRY.counter(
+    "meshviz_storage_policy_total",
+    "Packets on thinned ports, by port and outcome (stored or thinned).",
+    ["portname", "outcome"],
+)
+LAST_PACKET_TIME = REGISTRY.gauge(
+    "meshviz_last_packet_timestamp_seconds", "Unix time of the last stored packet."
+)
+DB_LOCK_WAIT = REGISTRY.histogram(
+    "meshviz_db_lock_wait_seconds", "Time spent waiting for the ingest database lock."
+)
+DB_COMMIT = REGISTRY.histogram(
+    "meshviz_db_commit_seconds", "Duration of ingest transaction commits."
+)
+MAINTENANCE_DURATION = REGISTRY.histogram(
+    "meshviz_db_maintenance_seconds", "Time spent in scheduled database maintenance, by job.", ["job"]
+)
+DB_WAL_BYTES = REGISTRY.gauge(
+    "meshviz_db_wal_bytes", "Size of the SQLite write-ahead log file."
+)
+DB_INSERT = REGISTRY.histogram(
+    "meshviz_db_insert_seconds", "Duration of packet row inserts."
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "meshviz_event_queue_depth", "Live events waiting for WebSocket broadcast."
+)
+QUEUE_DROPS = REGISTRY.counter(
+    "meshviz_event_queue_drops_total",
+    "Live events not broadcast, by priority lane and reason (overflow or coalesced).",
+    ["lane", "reason"],
+)
+WS_CLIENTS = REGISTRY.gauge(
+    "meshviz_websocket_clients", "Connected WebSocket clients."
+)
+WS_SEND_FAILURES = REGISTRY.counter(
+    "meshviz_websocket_send_failures_total", "WebSocket sends that failed, by reason.", ["reason"]
+)
+WS_REPLAYED = REGISTRY.counter(
+    "meshviz_websocket_replayed_events_total", "Live events resent from the replay ring after a reconnect."
+)
+WS_RESETS = REGISTRY.counter(
+    "meshviz_websocket_resets_total", "Clients told to refresh because their gap was no longer in the replay ring."
+)
+PLAYBACK_STREAMS = REGISTRY.gauge(
+    "meshviz_playback_streams", "Open historical playback WebSockets."
+)
+PLAYBACK_PACKETS = REGISTRY.counter(
+    "meshviz_playback_packets_total", "Stored packets sent to playback WebSockets."
+)
+IPC_SUBSCRIBERS = REGISTRY.gauge(
+    "meshviz_ipc_subscribers", "API workers subscribed to the ingest event socket."
+)
+IPC_DROPS = REGISTRY.counter(
+    "meshviz_ipc_subscriber_drops_total", "Event subscribers disconnected for falling behind."
+)
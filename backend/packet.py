@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+import json
+
+
+RECORD_FIELDS = (
+    "rx_time",
+    "from_id",
+    "to_id",
+    "portnum",
+    "portname",
+    "payload_b64",
+    "text",
+    "rssi",
+    "snr",
+    "hop_limit",
+    "hop_start",
+    "via_mqtt",
+    "channel",
+    "gateway_id",
+    "created_at",
+)
+
+EVENT_FIELDS = ("id", *RECORD_FIELDS, "from_label", "to_label", "seq")
+
+
+class PacketRecord:
+    # One object per packet from decode through insert and broadcast. Mapping
+    # style get()/[] access keeps it usable wherever a row dict is accepted.
+    __slots__ = (
+        *RECORD_FIELDS,
+        "details",
+        "id",
+        "from_label",
+        "to_label",
+        "seq",
+        "_details_json",
+        "_json",
+    )
+
+    def __init__(
+        self,
+        rx_time=None,
+        from_id=None,
+        to_id=None,
+        portnum=None,
+        portname=None,
+        payload_b64=None,
+        text=None,
+        rssi=None,
+        snr=None,
+        hop_limit=None,
+        hop_start=None,
+        via_mqtt=None,
+        channel=None,
+        gateway_id=None,
+        created_at=None,
+        details: dict | None = None,
+    ) -> None:
+        self.rx_time = rx_time
+        self.from_id = from_id
+        self.to_id = to_id
+        self.portnum = portnum
+        self.portname = portname
+        self.payload_b64 = payload_b64
+        self.text = text
+        self.rssi = rssi
+        self.snr = snr
+        self.hop_limit = hop_limit
+        self.hop_start = hop_start
+        self.via_mqtt = via_mqtt
+        self.channel = channel
+        self.gateway_id = gateway_id
+        self.created_at = created_at
+        self.details = details
+        self.id = None
+        self.from_label = None
+        self.to_label = None
+        self.seq = None
+        self._details_json = None
+        self._json = None
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state) -> None:
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def get(self, key: str, default=None):
+        if key == "details_json":
+            return self.details_json
+        return getattr(self, key, default)
+
+    def __getitem__(self, key: str):
+        if key == "details_json":
+            return self.details_json
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    @property
+    def details_json(self) -> str | None:
+        if self._details_json is None and self.details:
+            self._details_json = json.dumps(self.details)
+        return self._details_json
+
+    def pack_details(self) -> None:
+        # Keep only the serialized form, e.g. before pickling to another process.
+        self._details_json = self.details_json
+        self.details = None
+
+    def details_changed(self) -> None:
+        self._details_json = None
+        self._json = None
+
+    def to_json(self) -> str:
+        if self._json is None:
+            head = json.dumps({name: getattr(self, name) for name in EVENT_FIELDS})
+            self._json = f'{head[:-1]}, "details": {self.details_json or "null"}}}'
+        return self._json
+
+    def to_dict(self) -> dict:
+        return {
+            **{name: getattr(self, name) for name in EVENT_FIELDS},
+            "details": self.details,
+        }
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+class SamplingProfiler:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._lock.locked()
+
+    def run(self, seconds: float, interval: float = 0.005) -> tuple[str, int]:
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(seconds, interval)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds: float, interval: float) -> tuple[str, int]:
+        own_thread = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks: Counter[str] = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                parts = []
+                while frame is not None:
+                    code = frame.f_code
+                    parts.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                parts.append(names.get(thread_id, f"thread-{thread_id}"))
+                stacks[";".join(reversed(parts))] += 1
+            samples += 1
+            time.sleep(interval)
+        collapsed = "\n".join(f"{stack} {count}" for stack, count in stacks.most_common())
+        return collapsed + "\n", samples
+
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float = 100.0, max_entries: int = 200) -> None:
+        self.enabled = False
+        self.threshold = threshold_ms / 1000
+        self.entries: deque[dict] = deque(maxlen=max_entries)
+
+    def configure(
+        self,
+        enabled: bool | None = None,
+        threshold_ms: float | None = None,
+    ) -> None:
+        if threshold_ms is not None:
+            self.threshold = max(threshold_ms, 0) / 1000
+        if enabled is not None:
+            self.enabled = enabled
+
+    def settings(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "threshold_ms": round(self.threshold * 1000, 3),
+            "max_entries": self.entries.maxlen,
+        }
+
+    def record(
+        self,
+        conn: sqlite3.Connection,
+        sql: str,
+        params: object,
+        duration: float,
+        rows: int,
+    ) -> None:
+        plan = None
+        statement = sql.lstrip().upper()
+        if statement.startswith(("SELECT", "WITH")):
+            try:
+                plan = [
+                    row[-1]
+                    for row in sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", params or ())
+                ]
+            except sqlite3.Error:
+                plan = None
+        self.entries.append(
+            {
+                "at": time.time(),
+                "sql": " ".join(sql.split()),
+                "params": list(params) if isinstance(params, (list, tuple)) else params,
+                "duration_ms": round(duration * 1000, 3),
+                "rows": rows,
+                "plan": plan,
+            }
+        )
+
+
+SLOW_QUERIES = SlowQueryLog()
+
+
+class _TimedCursor:
+    def __init__(self, conn, cursor: sqlite3.Cursor, sql: str, params: object, elapsed: float) -> None:
+        self._conn = conn
+        self._cursor = cursor
+        self._sql = sql
+        self._params = params
+        self._elapsed = elapsed
+        self._rows = 0
+        self._done = False
+
+    def __getattr__(self, name: str):
+        return getattr(self._cursor, name)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def _finish(self) -> None:
+        if self._done:
+            return
+        self._done = True
+        if self._elapsed >= SLOW_QUERIES.threshold:
+            SLOW_QUERIES.record(self._conn, self._sql, self._params, self._elapsed, self._rows)
+
+    def fetchall(self) -> list:
+        started = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._elapsed += time.perf_counter() - started
+        self._rows += row is not None
+        self._finish()
+        return row
+
+    def fetchmany(self, size: int | None = None) -> list:
+        started = time.perf_counter()
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        self._elapsed += time.perf_counter() - started
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+
+class ProfiledConnection(sqlite3.Connection):
+    def execute(self, sql: str, parameters=(), /):
+        if not SLOW_QUERIES.enabled:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        elapsed = time.perf_counter() - started
+        if cursor.description is None:
+            if elapsed >= SLOW_QUERIES.threshold:
+                SLOW_QUERIES.record(self, sql, parameters, elapsed, max(cursor.rowcount, 0))
+            return cursor
+        return _TimedCursor(self, cursor, sql, parameters, elapsed)
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+from collections import defaultdict
+
+from meshtastic.protobuf import portnums_pb2
+
+from .metrics import STORAGE_POLICY
+from .packet import PacketRecord
+
+
+THIN_MODES = ("off", "always", "pressure")
+THIN_BUCKET_SECONDS = 60
+
+# Never thinned, whatever the config says.
+PROTECTED_PORTNUMS = {
+    portnums_pb2.PortNum.TEXT_MESSAGE_APP,
+    portnums_pb2.PortNum.TRACEROUTE_APP,
+    portnums_pb2.PortNum.NODEINFO_APP,
+}
+
+
+def _portnum(name: str) -> int:
+    name = name.strip().upper()
+    if name.isdigit():
+        return int(name)
+    try:
+        return portnums_pb2.PortNum.Value(name if name.endswith("_APP") else f"{name}_APP")
+    except ValueError:
+        raise ValueError(f"Unknown port in STORE_THIN: {name}") from None
+
+
+class StoragePolicy:
+    # Decides per packet whether the writer stores it. Listed ports keep at most
+    # one packet per node per interval, either always or only while the write
+    # queue is deeper than the threshold. Thinned packets are counted per port
+    # and minute so summaries can account for them.
+    def __init__(
+        self,
+        intervals: dict[str, int],
+        mode: str = "pressure",
+        queue_threshold: int = 5000,
+    ) -> None:
+        if mode not in THIN_MODES:
+            raise ValueError(f"STORE_THIN_MODE must be one of {', '.join(THIN_MODES)}, got {mode!r}")
+        self.mode = mode
+        self.queue_threshold = queue_threshold
+        self.intervals: dict[int, int] = {}
+        for name, seconds in intervals.items():
+            portnum = _portnum(name)
+            if portnum in PROTECTED_PORTNUMS:
+                raise ValueError(f"{name} packets are always stored and cannot be thinned")
+            if seconds > 0:
+                self.intervals[portnum] = seconds
+        self._last_kept: dict[tuple[int, int | None], int] = {}
+        self._thinned: defaultdict[tuple[int, int], int] = defaultdict(int)
+
+    def admit(self, record: PacketRecord, now: int, queue_depth: int) -> bool:
+        interval = self.intervals.get(record.portnum)
+        if interval is None or self.mode == "off":
+            return True
+        timestamp = record.created_at or now
+        key = (record.portnum, record.from_id)
+        last_kept = self._last_kept.get(key)
+        thinning = self.mode == "always" or queue_depth >= self.queue_threshold
+        if thinning and last_kept is not None and 0 <= timestamp - last_kept < interval:
+            STORAGE_POLICY.inc(portname=record.portname, outcome="thinned")
+            self._thinned[(timestamp - timestamp % THIN_BUCKET_SECONDS, record.portnum)] += 1
+            return False
+        self._last_kept[key] = timestamp
+        if len(self._last_kept) > 100_000:
+            cutoff = timestamp - max(self.intervals.values())
+            self._last_kept = {k: ts for k, ts in self._last_kept.items() if ts >= cutoff}
+        STORAGE_POLICY.inc(portname=record.portname, outcome="stored")
+        return True
+
+    def take_thinned(self) -> dict[tuple[int, int], int]:
+        thinned = dict(self._thinned)
+        self._thinned.clear()
+        return thinned
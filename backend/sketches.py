@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import sqlite3
+import time
+
+from .packet import PacketRecord
+
+
+BROADCAST_ID = 0xFFFFFFFF
+SKETCH_STEPS = (300, 3600)
+# Fine buckets serve short windows; the hourly ones cover up to the 7-day limit.
+SKETCH_RETENTION = {300: 2 * 86400, 3600: 8 * 86400}
+TOP_CAPACITY = 64
+
+
+def _hash64(value: object) -> int:
+    data = value.to_bytes(8, "little", signed=True) if isinstance(value, int) else str(value).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = 11, registers: bytes | None = None) -> None:
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(self.size)
+
+    def add(self, value: object) -> None:
+        hashed = _hash64(value)
+        index = hashed >> (64 - self.precision)
+        rest = (hashed << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = min(64 - rest.bit_length() + 1, 64 - self.precision + 1)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other: HyperLogLog) -> None:
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self) -> int:
+        size = self.size
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # Linear counting is more accurate while most registers are empty.
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+
+class SpaceSaving:
+    # Top-k counter with a bounded number of slots. When a new key arrives and
+    # the table is full it replaces the smallest counter and inherits its count
+    # as error, so counts are overestimates by at most that error.
+    def __init__(self, capacity: int = TOP_CAPACITY, counters: dict | None = None) -> None:
+        self.capacity = capacity
+        self.counters: dict[str, list[int]] = counters or {}
+
+    def add(self, key: object, count: int = 1) -> None:
+        key = str(key)
+        counter = self.counters.get(key)
+        if counter is not None:
+            counter[0] += count
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[key] = [count, 0]
+            return
+        smallest = min(self.counters, key=lambda name: self.counters[name][0])
+        floor = self.counters.pop(smallest)[0]
+        self.counters[key] = [floor + count, floor]
+
+    def _floor(self) -> int:
+        # A key missing from a full summary may have been counted up to its
+        # smallest counter; one missing from a summary with free slots was not seen.
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other: SpaceSaving) -> None:
+        floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for key in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(key, (floor, floor))
+            other_count, other_error = other.counters.get(key, (other_floor, other_floor))
+            merged[key] = [count + other_count, error + other_error]
+        self.counters = merged
+        if len(self.counters) > self.capacity:
+            kept = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+            self.counters = dict(kept[: self.capacity])
+
+    def top(self, limit: int) -> list[dict]:
+        ranked = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+        return [{"key": key, "count": count, "error": error} for key, (count, error) in ranked[:limit]]
+
+    def to_json(self) -> str:
+        return json.dumps(self.counters, separators=(",", ":"))
+
+
+class BucketSketch:
+    __slots__ = ("nodes", "senders", "gateways", "channels")
+
+    def __init__(self, row: sqlite3.Row | None = None) -> None:
+        stored = row is not None
+        self.nodes = HyperLogLog(registers=row["nodes"] if stored else None)
+        self.senders = SpaceSaving(counters=json.loads(row["senders"]) if stored else None)
+        self.gateways = SpaceSaving(counters=json.loads(row["gateways"]) if stored else None)
+        self.channels = SpaceSaving(counters=json.loads(row["channels"]) if stored else None)
+
+    def merge(self, other: BucketSketch) -> None:
+        self.nodes.merge(other.nodes)
+        self.senders.merge(other.senders)
+        self.gateways.merge(other.gateways)
+        self.channels.merge(other.channels)
+
+
+class MetricSketches:
+    # Per-bucket sketches kept by the writer and saved with its transactions,
+    # so any process can answer active-node and top-N questions by merging a
+    # bounded number of rows instead of scanning packets.
+    def __init__(self, flush_seconds: float = 5.0) -> None:
+        self.flush_seconds = flush_seconds
+        self._open: dict[tuple[int, int], BucketSketch] = {}
+        self._dirty: set[tuple[int, int]] = set()
+        self._flushed = time.monotonic()
+
+    def _bucket(self, conn: sqlite3.Connection, step: int, bucket: int) -> BucketSketch:
+        key = (step, bucket)
+        sketch = self._open.get(key)
+        if sketch is None:
+            # Late packets for a bucket that was already saved build on it.
+            row = conn.execute(
+                "SELECT * FROM metric_sketches WHERE step = ? AND bucket = ?", key
+            ).fetchone()
+            sketch = self._open[key] = BucketSketch(row)
+        return sketch
+
+    def observe(self, conn: sqlite3.Connection, packet: dict | PacketRecord, timestamp: int) -> None:
+        from_id = packet.get("from_id")
+        to_id = packet.get("to_id")
+        for step in SKETCH_STEPS:
+            sketch = self._bucket(conn, step, timestamp - timestamp % step)
+            for node_id in (from_id, to_id):
+                if node_id is not None and node_id != BROADCAST_ID:
+                    sketch.nodes.add(node_id)
+            if from_id is not None:
+                sketch.senders.add(from_id)
+            if packet.get("gateway_id"):
+                sketch.gateways.add(packet.get("gateway_id"))
+            if packet.get("channel") is not None:
+                sketch.channels.add(packet.get("channel"))
+            self._dirty.add((step, timestamp - timestamp % step))
+
+    def flush(self, conn: sqlite3.Connection, force: bool = False) -> None:
+        if not self._dirty or (not force and time.monotonic() - self._flushed < self.flush_seconds):
+            return
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO metric_sketches (step, bucket, nodes, senders, gateways, channels)
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (
+                    step,
+                    bucket,
+                    self._open[(step, bucket)].nodes.to_bytes(),
+                    self._open[(step, bucket)].senders.to_json(),
+                    self._open[(step, bucket)].gateways.to_json(),
+                    self._open[(step, bucket)].channels.to_json(),
+                )
+                for step, bucket in self._dirty
+            ],
+        )
+        self._dirty.clear()
+        self._flushed = time.monotonic()
+        newest = {step: max((bucket for s, bucket in self._open if s == step), default=0) for step in SKETCH_STEPS}
+        for step, bucket in list(self._open):
+            # Keep only the current and previous bucket of each step in memory.
+            if bucket < newest[step] - step:
+                del self._open[(step, bucket)]
+        for step, retention in SKETCH_RETENTION.items():
+            conn.execute(
+                "DELETE FROM metric_sketches WHERE step = ? AND bucket < ?",
+                (step, newest[step] - retention),
+            )
+
+    def backfill(self, conn: sqlite3.Connection, window_seconds: int = 7 * 86400) -> int:
+        if conn.execute("SELECT 1 FROM metric_sketches LIMIT 1").fetchone() is not None:
+            return 0
+        rows = conn.execute(
+            """
+            SELECT from_id, to_id, gateway_id, channel, created_at
+            FROM packets
+            WHERE created_at >= ?
+            ORDER BY created_at
+            """,
+            (int(time.time()) - window_seconds,),
+        )
+        count = 0
+        for row in rows:
+            self.observe(conn, dict(row), row["created_at"])
+            count += 1
+        self.flush(conn, force=True)
+        conn.commit()
+        return count
+
+
+def sketch_step(window_seconds: int) -> int:
+    return SKETCH_STEPS[0] if window_seconds <= 6 * 3600 else SKETCH_STEPS[-1]
+
+
+def merged_sketch(conn: sqlite3.Connection, window_seconds: int) -> BucketSketch:
+    step = sketch_step(window_seconds)
+    cutoff = int(time.time()) - window_seconds
+    # Whole buckets only, so the oldest one may reach up to one step further back.
+    cutoff -= cutoff % step
+    merged = BucketSketch()
+    for row in conn.execute(
+        "SELECT * FROM metric_sketches WHERE step = ? AND bucket >= ?", (step, cutoff)
+    ):
+        merged.merge(BucketSketch(row))
+    return merged
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+
+from .metrics import QUEUE_DROPS
+
+
+def sequence_counter():
+    # Starting from the wall clock keeps numbers increasing across restarts, so
+    # a client holding a sequence from before a restart always looks evicted.
+    return itertools.count(int(time.time() * 1000))
+
+
+class EventRing:
+    def __init__(self, size: int = 5000) -> None:
+        self._items: deque[tuple[int, object]] = deque(maxlen=max(size, 1))
+        self.last_seq = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def first_seq(self) -> int | None:
+        return self._items[0][0] if self._items else None
+
+    def append(self, seq: int, item: object) -> None:
+        if seq <= self.last_seq:
+            return
+        self._items.append((seq, item))
+        self.last_seq = seq
+
+    def since(self, seq: int) -> list[tuple[int, object]] | None:
+        # None means the caller cannot be caught up from the ring and has to
+        # reload from the database.
+        if seq == self.last_seq:
+            return []
+        if not self._items or seq > self.last_seq or seq < self._items[0][0] - 1:
+            return None
+        return [entry for entry in self._items if entry[0] > seq]
+
+
+class Broadcaster:
+    # Pending live events in priority lanes. get() always drains the highest
+    # lane first; a coalescing lane keeps only the newest event per key, and a
+    # full lane sheds its oldest event, so overload costs bulk traffic first.
+    def __init__(self, lanes: tuple[str, ...], size: int = 1000, coalesce: tuple[str, ...] = ()) -> None:
+        self.lanes = lanes
+        self.size = max(size, 1)
+        self.coalesce = set(coalesce)
+        self._pending: dict[str, OrderedDict] = {lane: OrderedDict() for lane in lanes}
+        self._ready = asyncio.Event()
+
+    def qsize(self) -> int:
+        return sum(len(pending) for pending in self._pending.values())
+
+    def empty(self) -> bool:
+        return not any(self._pending.values())
+
+    def put(self, lane: str, seq: int, item: object, key: object = None) -> None:
+        pending = self._pending[lane]
+        if lane in self.coalesce and key is not None:
+            if pending.pop(key, None) is not None:
+                QUEUE_DROPS.inc(lane=lane, reason="coalesced")
+        else:
+            key = seq
+        pending[key] = (seq, item)
+        if len(pending) > self.size:
+            pending.popitem(last=False)
+            QUEUE_DROPS.inc(lane=lane, reason="overflow")
+        self._ready.set()
+
+    async def get(self) -> tuple[int, object]:
+        while True:
+            for lane in self.lanes:
+                pending = self._pending[lane]
+                if pending:
+                    return pending.popitem(last=False)[1]
+            self._ready.clear()
+            await self._ready.wait()
+
+
+class PlaybackClock:
+    # Maps stored timestamps onto wall-clock time at an adjustable speed.
+    # Speed changes and pauses re-anchor the clock, so the position never jumps.
+    def __init__(self, start: float, speed: float) -> None:
+        self.speed = speed
+        self.paused = False
+        self.stopped = False
+        self.changed = asyncio.Event()
+        self._anchor_position = start
+        self._anchor_wall = time.monotonic()
+
+    def position(self) -> float:
+        if self.paused:
+            return self._anchor_position
+        return self._anchor_position + (time.monotonic() - self._anchor_wall) * self.speed
+
+    def _rebase(self, position: float | None = None) -> None:
+        self._anchor_position = self.position() if position is None else position
+        self._anchor_wall = time.monotonic()
+        self.changed.set()
+
+    def set_speed(self, speed: float) -> None:
+        self._rebase()
+        self.speed = speed
+
+    def pause(self) -> None:
+        self._rebase()
+        self.paused = True
+
+    def resume(self) -> None:
+        self._rebase()
+        self.paused = False
+
+    def stop(self) -> None:
+        self.stopped = True
+        self.changed.set()
+
+    async def wait_until(self, timestamp: float, max_idle: float) -> None:
+        while not self.stopped:
+            if not self.paused:
+                delay = (timestamp - self.position()) / self.speed
+                if delay <= 0:
+                    return
+                if delay > max_idle:
+                    # Long quiet stretches are cut short instead of replayed in full.
+                    self._rebase(timestamp - max_idle * self.speed)
+                    delay = max_idle
+            else:
+                delay = None
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
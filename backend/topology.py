@@ -0,0 +1,319 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from .db import BROADCAST_ID
+
+
+TRACEROUTE_PORTNUM = 70
+ROUTING_PORTNUM = 5
+NEIGHBORINFO_PORTNUM = 71
+
+
+@dataclass
+class TopologyLink:
+    source: int
+    target: int
+    count: int = 0
+    snr_sum: float = 0.0
+    snr_count: int = 0
+    last_seen: int = 0
+    sources: set[str] = field(default_factory=set)
+
+    def as_dict(self) -> dict:
+        return {
+            "source": self.source,
+            "target": self.target,
+            "count": self.count,
+            "snr": round(self.snr_sum / self.snr_count, 2) if self.snr_count else None,
+            "last_seen": self.last_seen,
+            "sources": sorted(self.sources),
+        }
+
+
+def _coerce_node_id(value: object) -> int | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith("!"):
+            try:
+                return int(text[1:], 16)
+            except ValueError:
+                return None
+        try:
+            return int(text)
+        except ValueError:
+            return None
+    return None
+
+
+def _route_hops(
+    route: object,
+    snrs: object,
+    start: int | None,
+    end: int | None,
+) -> list[tuple[int, int, float | None]]:
+    if not isinstance(route, list):
+        return []
+    path = [start] + [_coerce_node_id(value) for value in route] + [end]
+    path = [node_id for node_id in path if node_id is not None]
+    snr_values = snrs if isinstance(snrs, list) else []
+    hops = []
+    for index in range(len(path) - 1):
+        source, target = path[index], path[index + 1]
+        if source == target or BROADCAST_ID in (source, target):
+            continue
+        snr = None
+        if index < len(snr_values) and isinstance(snr_values[index], (int, float)):
+            # RouteDiscovery reports SNR in quarter-dB steps; -128 marks unknown.
+            if snr_values[index] != -128:
+                snr = snr_values[index] / 4
+        hops.append((source, target, snr))
+    return hops
+
+
+def extract_topology_edges(record: dict, details: dict | None) -> list[tuple[int, int, float | None, str]]:
+    if not isinstance(details, dict):
+        details = {}
+    portnum = record.get("portnum")
+    from_id = record.get("from_id")
+    to_id = record.get("to_id")
+    edges: list[tuple[int, int, float | None, str]] = []
+
+    if portnum == TRACEROUTE_PORTNUM:
+        for source, target, snr in _route_hops(
+            details.get("route"), details.get("snr_towards"), from_id, to_id
+        ):
+            edges.append((source, target, snr, "traceroute"))
+        for source, target, snr in _route_hops(
+            details.get("route_back"), details.get("snr_back"), to_id, from_id
+        ):
+            edges.append((source, target, snr, "traceroute"))
+    elif portnum == ROUTING_PORTNUM:
+        for key, start, end in (("route_request", from_id, to_id), ("route_reply", to_id, from_id)):
+            block = details.get(key)
+            if not isinstance(block, dict):
+                continue
+            for source, target, snr in _route_hops(
+                block.get("route"), block.get("snr_towards"), start, end
+            ):
+                edges.append((source, target, snr, "routing"))
+    elif portnum == NEIGHBORINFO_PORTNUM:
+        owner = _coerce_node_id(details.get("node_id")) or from_id
+        neighbors = details.get("neighbors")
+        if owner is not None and isinstance(neighbors, list):
+            for neighbor in neighbors:
+                if not isinstance(neighbor, dict):
+                    continue
+                neighbor_id = _coerce_node_id(neighbor.get("node_id"))
+                if neighbor_id is None or neighbor_id in (owner, BROADCAST_ID):
+                    continue
+                snr = neighbor.get("snr")
+                edges.append(
+                    (neighbor_id, owner, snr if isinstance(snr, (int, float)) else None, "neighborinfo")
+                )
+
+    hop_start = record.get("hop_start")
+    hop_limit = record.get("hop_limit")
+    gateway = _coerce_node_id(record.get("gateway_id"))
+    if (
+        gateway is not None
+        and from_id is not None
+        and from_id != gateway
+        and not record.get("via_mqtt")
+        and isinstance(hop_start, int)
+        and hop_start > 0
+        and hop_start == hop_limit
+    ):
+        snr = record.get("snr")
+        edges.append((from_id, gateway, snr if isinstance(snr, (int, float)) else None, "direct"))
+    return edges
+
+
+def _betweenness(adjacency: dict[int, set[int]], members: list[int]) -> dict[int, float]:
+    # Brandes' algorithm over hop counts, normalized within the component.
+    scores = {node_id: 0.0 for node_id in members}
+    for source in members:
+        stack = []
+        predecessors: dict[int, list[int]] = {node_id: [] for node_id in members}
+        sigma = dict.fromkeys(members, 0)
+        sigma[source] = 1
+        distance = dict.fromkeys(members, -1)
+        distance[source] = 0
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            stack.append(current)
+            for neighbor in adjacency[current]:
+                if distance[neighbor] < 0:
+                    distance[neighbor] = distance[current] + 1
+                    queue.append(neighbor)
+                if distance[neighbor] == distance[current] + 1:
+                    sigma[neighbor] += sigma[current]
+                    predecessors[neighbor].append(current)
+        delta = dict.fromkeys(members, 0.0)
+        while stack:
+            current = stack.pop()
+            for previous in predecessors[current]:
+                delta[previous] += sigma[previous] / sigma[current] * (1 + delta[current])
+            if current != source:
+                scores[current] += delta[current]
+    size = len(members)
+    scale = 1 / ((size - 1) * (size - 2)) if size > 2 else 0.0
+    return {node_id: value * scale for node_id, value in scores.items()}
+
+
+class TopologyEngine:
+    def __init__(self, max_age_seconds: int = 86400) -> None:
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._links: dict[tuple[int, int], TopologyLink] = {}
+        self._adjacency: dict[int, set[int]] = {}
+        self._dirty_nodes: set[int] = set()
+        self._component_cache: dict[frozenset[int], dict[int, float]] = {}
+        self._snapshot: dict | None = None
+        self._last_prune = 0
+
+    def add_packet(self, record: dict, details: dict | None) -> int:
+        edges = extract_topology_edges(record, details)
+        if not edges:
+            return 0
+        timestamp = record.get("created_at") or int(time.time())
+        with self._lock:
+            for source, target, snr, kind in edges:
+                self._add_edge(source, target, snr, kind, timestamp)
+        return len(edges)
+
+    def _add_edge(self, source: int, target: int, snr: float | None, kind: str, timestamp: int) -> None:
+        key = (min(source, target), max(source, target))
+        link = self._links.get(key)
+        if link is None:
+            link = TopologyLink(source=key[0], target=key[1])
+            self._links[key] = link
+            self._adjacency.setdefault(key[0], set()).add(key[1])
+            self._adjacency.setdefault(key[1], set()).add(key[0])
+            self._dirty_nodes.update(key)
+        link.count += 1
+        if snr is not None:
+            link.snr_sum += snr
+            link.snr_count += 1
+        link.last_seen = max(link.last_seen, timestamp)
+        link.sources.add(kind)
+        self._snapshot = None
+
+    def _prune(self, now: int) -> None:
+        cutoff = now - self.max_age_seconds
+        expired = [key for key, link in self._links.items() if link.last_seen < cutoff]
+        for key in expired:
+            del self._links[key]
+            for node_id, other in (key, key[::-1]):
+                neighbors = self._adjacency.get(node_id)
+                if neighbors is None:
+                    continue
+                neighbors.discard(other)
+                if not neighbors:
+                    del self._adjacency[node_id]
+            self._dirty_nodes.update(key)
+        if expired:
+            self._snapshot = None
+        self._last_prune = now
+
+    def _components(self) -> list[list[int]]:
+        seen: set[int] = set()
+        components = []
+        for start in self._adjacency:
+            if start in seen:
+                continue
+            members = []
+            queue = deque([start])
+            seen.add(start)
+            while queue:
+                current = queue.popleft()
+                members.append(current)
+                for neighbor in self._adjacency[current]:
+                    if neighbor not in seen:
+                        seen.add(neighbor)
+                        queue.append(neighbor)
+            components.append(sorted(members))
+        components.sort(key=len, reverse=True)
+        return components
+
+    def snapshot(self) -> dict:
+        now = int(time.time())
+        with self._lock:
+            if now - self._last_prune >= 60:
+                self._prune(now)
+            if self._snapshot is not None:
+                return self._snapshot
+            components = self._components()
+            cache: dict[frozenset[int], dict[int, float]] = {}
+            recomputed = 0
+            for members in components:
+                key = frozenset(members)
+                scores = self._component_cache.get(key)
+                if scores is None or not self._dirty_nodes.isdisjoint(key):
+                    scores = _betweenness(self._adjacency, members)
+                    recomputed += 1
+                cache[key] = scores
+            self._component_cache = cache
+            self._dirty_nodes.clear()
+
+            total = len(self._adjacency)
+            nodes = []
+            component_list = []
+            for index, members in enumerate(components):
+                scores = cache[frozenset(members)]
+                component_list.append({"id": index, "size": len(members), "nodes": members})
+                for node_id in members:
+                    degree = len(self._adjacency[node_id])
+                    nodes.append(
+                        {
+                            "id": node_id,
+                            "component": index,
+                            "degree": degree,
+                            "degree_centrality": degree / (total - 1) if total > 1 else 0.0,
+                            "betweenness": scores.get(node_id, 0.0),
+                        }
+                    )
+            self._snapshot = {
+                "generated_at": now,
+                "max_age": self.max_age_seconds,
+                "recomputed_components": recomputed,
+                "nodes": nodes,
+                "links": [link.as_dict() for link in self._links.values()],
+                "components": component_list,
+            }
+            return self._snapshot
+
+    def load(self, conn: sqlite3.Connection) -> int:
+        cutoff = int(time.time()) - self.max_age_seconds
+        rows = conn.execute(
+            """
+            SELECT from_id, to_id, portnum, details_json, snr, hop_start, hop_limit,
+                via_mqtt, gateway_id, created_at
+            FROM packets
+            WHERE created_at >= ?
+                AND (portnum IN (?, ?, ?) OR (hop_start > 0 AND hop_start = hop_limit))
+            ORDER BY created_at
+            """,
+            (cutoff, TRACEROUTE_PORTNUM, ROUTING_PORTNUM, NEIGHBORINFO_PORTNUM),
+        ).fetchall()
+        added = 0
+        for row in rows:
+            record = dict(row)
+            details = None
+            if record.get("details_json"):
+                try:
+                    details = json.loads(record["details_json"])
+                except json.JSONDecodeError:
+                    details = None
+            added += self.add_packet(record, details)
+        return added
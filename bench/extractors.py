@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from google.protobuf.descriptor import FieldDescriptor
+from google.protobuf.json_format import MessageToDict
+from meshtastic.protobuf import mesh_pb2, portnums_pb2
+
+from backend.decoder import FAST_DECODE_PORTNUMS, portnum_message_class
+from backend.extractors import fast_extractor
+
+from .synthetic import _node_ids, _payload_for
+
+
+HOT_TYPES = {
+    portnum: portnum_message_class(portnum) or mesh_pb2.User
+    for portnum in sorted(FAST_DECODE_PORTNUMS)
+}
+EXTRA_TYPES = (mesh_pb2.NodeInfo,)
+
+_INT_RANGES = {
+    FieldDescriptor.TYPE_INT32: (-(1 << 31), (1 << 31) - 1),
+    FieldDescriptor.TYPE_SINT32: (-(1 << 31), (1 << 31) - 1),
+    FieldDescriptor.TYPE_SFIXED32: (-(1 << 31), (1 << 31) - 1),
+    FieldDescriptor.TYPE_UINT32: (0, (1 << 32) - 1),
+    FieldDescriptor.TYPE_FIXED32: (0, (1 << 32) - 1),
+    FieldDescriptor.TYPE_INT64: (-(1 << 63), (1 << 63) - 1),
+    FieldDescriptor.TYPE_SINT64: (-(1 << 63), (1 << 63) - 1),
+    FieldDescriptor.TYPE_SFIXED64: (-(1 << 63), (1 << 63) - 1),
+    FieldDescriptor.TYPE_UINT64: (0, (1 << 64) - 1),
+    FieldDescriptor.TYPE_FIXED64: (0, (1 << 64) - 1),
+}
+_SPECIAL_FLOATS = (0.0, -0.0, float("nan"), float("inf"), float("-inf"), 1e-40, 3.4e38)
+
+
+def _random_scalar(rng: random.Random, field: FieldDescriptor):
+    if field.type in _INT_RANGES:
+        low, high = _INT_RANGES[field.type]
+        return rng.choice((0, 1, -1 if low else 2, low, high, rng.randint(low, high)))
+    if field.type in (FieldDescriptor.TYPE_FLOAT, FieldDescriptor.TYPE_DOUBLE):
+        if rng.random() < 0.15:
+            return rng.choice(_SPECIAL_FLOATS)
+        return rng.uniform(-1e4, 1e4)
+    if field.type == FieldDescriptor.TYPE_BOOL:
+        return rng.random() < 0.5
+    if field.type == FieldDescriptor.TYPE_STRING:
+        return "".join(rng.choice("ab Zé✓🙂") for _ in range(rng.randint(0, 12)))
+    if field.type == FieldDescriptor.TYPE_BYTES:
+        return bytes(rng.randrange(256) for _ in range(rng.randint(0, 33)))
+    if field.type == FieldDescriptor.TYPE_ENUM:
+        numbers = [value.number for value in field.enum_type.values]
+        if not field.enum_type.is_closed and rng.random() < 0.1:
+            return max(numbers) + rng.randint(1, 50)
+        return rng.choice(numbers)
+    raise ValueError(f"unhandled field type {field.type}")
+
+
+def fill_random(message, rng: random.Random, depth: int = 0) -> None:
+    for field in message.DESCRIPTOR.fields:
+        if rng.random() < 0.4:
+            continue
+        if field.cpp_type == FieldDescriptor.CPPTYPE_MESSAGE:
+            if depth >= 3:
+                continue
+            if field.is_repeated:
+                for _ in range(rng.randint(0, 3)):
+                    fill_random(getattr(message, field.name).add(), rng, depth + 1)
+            else:
+                child = getattr(message, field.name)
+                child.SetInParent()
+                fill_random(child, rng, depth + 1)
+        elif field.is_repeated:
+            getattr(message, field.name).extend(
+                _random_scalar(rng, field) for _ in range(rng.randint(0, 4))
+            )
+        else:
+            setattr(message, field.name, _random_scalar(rng, field))
+
+
+def _reference(message) -> dict:
+    return MessageToDict(message, preserving_proto_field_name=True)
+
+
+def _same(left: dict, right: dict) -> bool:
+    # NaN never compares equal, so compare the serialized form as well as the structure.
+    return json.dumps(left) == json.dumps(right)
+
+
+def check_parity(samples: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    failures = []
+    for message_cls in (*HOT_TYPES.values(), *EXTRA_TYPES):
+        extractor = fast_extractor(message_cls.DESCRIPTOR)
+        if extractor is None:
+            failures.append(f"{message_cls.DESCRIPTOR.full_name}: no fast extractor")
+            continue
+        for index in range(samples):
+            original = message_cls()
+            fill_random(original, rng)
+            message = message_cls()
+            message.ParseFromString(original.SerializeToString())
+            expected = _reference(message)
+            actual = extractor(message)
+            if not _same(actual, expected):
+                failures.append(
+                    f"{message_cls.DESCRIPTOR.full_name} sample {index}: "
+                    f"{json.dumps(actual)} != {json.dumps(expected)}"
+                )
+                break
+    return failures
+
+
+def _traffic(count: int, seed: int) -> dict[int, list]:
+    rng = random.Random(seed)
+    node_ids = _node_ids(rng, 300)
+    messages = {}
+    for portnum, message_cls in HOT_TYPES.items():
+        batch = []
+        for _ in range(count):
+            message = message_cls()
+            message.ParseFromString(_payload_for(rng, portnum, rng.choice(node_ids), node_ids))
+            batch.append(message)
+        messages[portnum] = batch
+    return messages
+
+
+def _time(convert, messages: list, rounds: int) -> float:
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for message in messages:
+            convert(message)
+        elapsed = (time.perf_counter() - started) / len(messages)
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_benchmark(count: int, rounds: int, seed: int) -> dict:
+    results = {}
+    for portnum, messages in _traffic(count, seed).items():
+        extractor = fast_extractor(messages[0].DESCRIPTOR)
+        reference_us = _time(_reference, messages, rounds) * 1e6
+        fast_us = _time(extractor, messages, rounds) * 1e6
+        results[portnums_pb2.PortNum.Name(portnum)] = {
+            "message_to_dict_us": round(reference_us, 2),
+            "fast_us": round(fast_us, 2),
+            "speedup": round(reference_us / fast_us, 1) if fast_us else None,
+        }
+    return results
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Check the compiled protobuf extractors against MessageToDict and time both."
+    )
+    parser.add_argument("--samples", type=int, default=2000, help="random messages per type for the parity check")
+    parser.add_argument("--count", type=int, default=2000, help="realistic messages per port for timing")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1234)
+    args = parser.parse_args(argv)
+
+    failures = check_parity(args.samples, args.seed)
+    for line in failures:
+        print(f"MISMATCH: {line}", file=sys.stderr)
+    print(json.dumps(run_benchmark(args.count, args.rounds, args.seed), indent=2))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from itertools import islice
+from pathlib import Path
+
+from .synthetic import TrafficProfile, generate_messages
+
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baselines" / "ingest.json"
+STAGES = ("decode", "store", "publish", "total")
+
+
+class _CountingClient:
+    def __init__(self) -> None:
+        self.messages = 0
+        self.bytes = 0
+
+    async def send_text(self, payload: str) -> None:
+        self.messages += 1
+        self.bytes += len(payload)
+
+
+def _percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _db_size(db_path: Path) -> int:
+    total = 0
+    for suffix in ("", "-wal", "-shm"):
+        path = Path(f"{db_path}{suffix}")
+        if path.exists():
+            total += path.stat().st_size
+    return total
+
+
+def _drain(app, loop: asyncio.AbstractEventLoop, client: _CountingClient, timeout: float = 5.0) -> None:
+    # Run the enqueue callbacks already scheduled on the loop, then wait until
+    # the lanes are empty and the sent count has stopped moving.
+    asyncio.run_coroutine_threadsafe(asyncio.sleep(0), loop).result(timeout)
+    deadline = time.monotonic() + timeout
+    sent = -1
+    while time.monotonic() < deadline and (sent != client.messages or not app.state.broadcaster.empty()):
+        sent = client.messages
+        time.sleep(0.05)
+
+
+def _prepare_environment(workdir: Path, profile: TrafficProfile) -> None:
+    config_path = workdir / "config.txt"
+    config_path.write_text(
+        "\n".join(
+            [
+                'MQTT_BROKER = "localhost"',
+                'MQTT_TOPIC = "msh/#"',
+                'DEFAULT_KEY = "AQ=="',
+                f'DECODE_KEYS = "{profile.custom_key_b64}"',
+            ]
+        )
+        + "\n",
+        encoding="utf-8",
+    )
+    os.environ["CONFIG_PATH"] = str(config_path)
+    os.environ["DB_PATH"] = str(workdir / "mesh.db")
+
+
+def run_benchmark(
+    count: int,
+    profile: TrafficProfile,
+    warmup: int = 500,
+    capture_paths: list[Path] | None = None,
+) -> dict:
+    with tempfile.TemporaryDirectory(prefix="meshviz-bench-") as workdir:
+        return _measure(Path(workdir), count, profile, warmup, capture_paths)
+
+
+def _measure(
+    workdir: Path,
+    count: int,
+    profile: TrafficProfile,
+    warmup: int,
+    capture_paths: list[Path] | None,
+) -> dict:
+    _prepare_environment(workdir, profile)
+
+    from backend import main as backend_main
+
+    app = backend_main.create_app()
+    backend_main.open_storage(app)
+    config = app.state.config
+    keys_b64 = config.decode_keys_b64 or [config.default_key_b64]
+
+    loop = asyncio.new_event_loop()
+    app.state.loop = loop
+    client = _CountingClient()
+    app.state.clients.add(client)
+    loop_thread = threading.Thread(target=loop.run_forever, daemon=True)
+    loop_thread.start()
+    broadcast = asyncio.run_coroutine_threadsafe(backend_main._broadcast_loop(app), loop)
+
+    if capture_paths:
+        from backend.capture import iter_captures
+
+        messages = [
+            (topic, payload)
+            for _, topic, payload in islice(iter_captures(capture_paths), count + warmup)
+        ]
+        count = max(len(messages) - warmup, 0)
+    else:
+        messages = list(generate_messages(count + warmup, profile))
+    size_before = _db_size(config.db_path)
+    timings: dict[str, list[float]] = {stage: [] for stage in STAGES}
+    outcome = {"decoded": 0, "rejected": 0, "duplicates": 0, "thinned": 0, "stored": 0}
+
+    def ingest(topic: str, payload: bytes, record_timing: bool) -> None:
+        started = time.perf_counter()
+        decoded = backend_main._decode_message(topic, payload, keys_b64)
+        decoded_at = time.perf_counter()
+        stored_at = published_at = decoded_at
+        packet_id = None
+        if decoded is None:
+            outcome["rejected"] += record_timing
+        else:
+            outcome["decoded"] += record_timing
+            packet_id = backend_main._store_packet(app, decoded)
+            stored_at = time.perf_counter()
+            if packet_id is None:
+                outcome["duplicates"] += record_timing
+            elif packet_id == backend_main.THINNED:
+                outcome["thinned"] += record_timing
+                backend_main._publish_packet(app, decoded, None)
+            else:
+                outcome["stored"] += record_timing
+                backend_main._publish_packet(app, decoded, packet_id)
+            published_at = time.perf_counter()
+        if not record_timing:
+            return
+        timings["decode"].append(decoded_at - started)
+        timings["total"].append(published_at - started)
+        if decoded is not None:
+            timings["store"].append(stored_at - decoded_at)
+            if packet_id is not None:
+                timings["publish"].append(published_at - stored_at)
+
+    for topic, payload in messages[:warmup]:
+        ingest(topic, payload, False)
+    # Warm-up events still in flight would otherwise count as measured sends.
+    _drain(app, loop, client)
+    sent_before = client.messages
+
+    started = time.perf_counter()
+    for topic, payload in messages[warmup:]:
+        ingest(topic, payload, True)
+    elapsed = time.perf_counter() - started
+
+    _drain(app, loop, client)
+    broadcast.cancel()
+    loop.call_soon_threadsafe(loop.stop)
+    loop_thread.join(timeout=5)
+
+    size_after = _db_size(config.db_path)
+    app.state.db.close()
+    stages = {}
+    for stage, values in timings.items():
+        stages[stage] = {
+            "count": len(values),
+            "p50_us": round((_percentile(values, 0.5) or 0) * 1e6, 1),
+            "p99_us": round((_percentile(values, 0.99) or 0) * 1e6, 1),
+        }
+    return {
+        "messages": count,
+        "seconds": round(elapsed, 3),
+        "messages_per_sec": round(count / elapsed, 1) if elapsed else None,
+        "stored_per_sec": round(outcome["stored"] / elapsed, 1) if elapsed else None,
+        **outcome,
+        "broadcast_sent": client.messages - sent_before,
+        "broadcast_dropped": outcome["stored"] + outcome["thinned"] - (client.messages - sent_before),
+        "db_growth_bytes": size_after - size_before,
+        "db_bytes_per_stored": round((size_after - size_before) / outcome["stored"], 1)
+        if outcome["stored"]
+        else None,
+        "stages": stages,
+    }
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    base_rate = baseline.get("messages_per_sec")
+    if base_rate and result["messages_per_sec"] < base_rate * (1 - tolerance):
+        regressions.append(
+            f"throughput {result['messages_per_sec']}/s < baseline {base_rate}/s"
+        )
+    for stage in STAGES:
+        base_stage = baseline.get("stages", {}).get(stage)
+        current = result["stages"].get(stage)
+        if not base_stage or not current:
+            continue
+        for key in ("p50_us", "p99_us"):
+            if base_stage[key] and current[key] > base_stage[key] * (1 + tolerance):
+                regressions.append(
+                    f"{stage} {key} {current[key]} > baseline {base_stage[key]}"
+                )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the MQTT ingest pipeline in-process.")
+    parser.add_argument("--count", type=int, default=20000)
+    parser.add_argument("--warmup", type=int, default=500)
+    parser.add_argument("--nodes", type=int, default=300)
+    parser.add_argument("--gateways", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--capture", type=Path, nargs="*", help="replay captured traffic instead of synthetic")
+    args = parser.parse_args(argv)
+
+    profile = TrafficProfile(nodes=args.nodes, gateways=args.gateways, seed=args.seed)
+    result = run_benchmark(
+        args.count, profile, warmup=args.warmup, capture_paths=args.capture
+    )
+    print(json.dumps(result, indent=2))
+
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(result, indent=2) + "\n", encoding="utf-8")
+        print(f"baseline written to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if args.baseline.exists():
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        regressions = compare(result, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION: {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
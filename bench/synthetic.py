@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import base64
+import random
+import zlib
+from dataclasses import dataclass, field
+
+from meshtastic.protobuf import mesh_pb2, mqtt_pb2, portnums_pb2, telemetry_pb2
+
+from backend.decoder import DEFAULT_KEY, _normalize_psk, decrypt_payload
+
+
+BROADCAST_ID = 0xFFFFFFFF
+
+PORT_WEIGHTS = {
+    portnums_pb2.PortNum.TEXT_MESSAGE_APP: 8,
+    portnums_pb2.PortNum.TEXT_MESSAGE_COMPRESSED_APP: 1,
+    portnums_pb2.PortNum.POSITION_APP: 22,
+    portnums_pb2.PortNum.TELEMETRY_APP: 30,
+    portnums_pb2.PortNum.NODEINFO_APP: 14,
+    portnums_pb2.PortNum.ROUTING_APP: 8,
+    portnums_pb2.PortNum.TRACEROUTE_APP: 4,
+    portnums_pb2.PortNum.NEIGHBORINFO_APP: 5,
+    portnums_pb2.PortNum.MAP_REPORT_APP: 8,
+}
+
+WORDS = (
+    "mesh node relay test hello from the hill antenna battery weather "
+    "check copy signal repeater solar park trail camp net tonight"
+).split()
+
+
+@dataclass
+class TrafficProfile:
+    nodes: int = 300
+    gateways: int = 12
+    channels: tuple[str, ...] = ("LongFast", "MediumSlow", "Ops")
+    encrypted_ratio: float = 0.7
+    custom_key_ratio: float = 0.15
+    undecryptable_ratio: float = 0.05
+    gateway_copies: tuple[int, int] = (1, 4)
+    redelivery_ratio: float = 0.03
+    seed: int = 1234
+    custom_key_b64: str = field(default_factory=lambda: base64.b64encode(bytes(range(16))).decode("ascii"))
+
+
+def _node_ids(rng: random.Random, count: int) -> list[int]:
+    return [rng.randrange(0x10000000, 0xFFFFFFF0) for _ in range(count)]
+
+
+def _text(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 14)))
+
+
+def _payload_for(rng: random.Random, portnum: int, sender: int, node_ids: list[int]) -> bytes:
+    if portnum == portnums_pb2.PortNum.TEXT_MESSAGE_APP:
+        return _text(rng).encode("utf-8")
+    if portnum == portnums_pb2.PortNum.TEXT_MESSAGE_COMPRESSED_APP:
+        msg = mesh_pb2.Compressed()
+        msg.portnum = portnums_pb2.PortNum.TEXT_MESSAGE_APP
+        msg.data = zlib.compress(_text(rng).encode("utf-8"))
+        return msg.SerializeToString()
+    if portnum == portnums_pb2.PortNum.POSITION_APP:
+        msg = mesh_pb2.Position()
+        msg.latitude_i = int((43.5 + rng.random()) * 1e7)
+        msg.longitude_i = int((-80.0 + rng.random()) * 1e7)
+        msg.altitude = rng.randint(80, 400)
+        msg.time = rng.randint(1_700_000_000, 1_800_000_000)
+        msg.precision_bits = 32
+        return msg.SerializeToString()
+    if portnum == portnums_pb2.PortNum.TELEMETRY_APP:
+        msg = telemetry_pb2.Telemetry()
+        msg.time = rng.randint(1_700_000_000, 1_800_000_000)
+        if rng.random() < 0.7:
+            metrics = msg.device_metrics
+            metrics.battery_level = rng.randint(5, 101)
+            metrics.voltage = 3.3 + rng.random()
+            metrics.channel_utilization = rng.random() * 40
+            metrics.air_util_tx = rng.random() * 10
+            metrics.uptime_seconds = rng.randint(0, 10_000_000)
+        else:
+            metrics = msg.environment_metrics
+            metrics.temperature = rng.uniform(-20, 40)
+            metrics.relative_humidity = rng.uniform(10, 100)
+            metrics.barometric_pressure = rng.uniform(950, 1050)
+        return msg.SerializeToString()
+    if portnum == portnums_pb2.PortNum.NODEINFO_APP:
+        msg = mesh_pb2.User()
+        msg.id = f"!{sender:08x}"
+        msg.long_name = f"Node {sender & 0xFFFF:04X}"
+        msg.short_name = f"{sender & 0xFFFF:04x}"
+        msg.hw_model = rng.randint(1, 60)
+        return msg.SerializeToString()
+    if portnum == portnums_pb2.PortNum.ROUTING_APP:
+        msg = mesh_pb2.Routing()
+        if rng.random() < 0.5:
+            msg.error_reason = rng.choice([0, 1, 3, 8])
+        else:
+            msg.route_reply.route.extend(rng.sample(node_ids, rng.randint(1, 4)))
+        return msg.SerializeToString()
+    if portnum == portnums_pb2.PortNum.TRACEROUTE_APP:
+        msg = mesh_pb2.RouteDiscovery()
+        hops = rng.sample(node_ids, rng.randint(1, 5))
+        msg.route.extend(hops)
+        msg.snr_towards.extend(rng.randint(-40, 40) for _ in range(len(hops) + 1))
+        back = rng.sample(node_ids, rng.randint(0, 4))
+        msg.route_back.extend(back)
+        msg.snr_back.extend(rng.randint(-40, 40) for _ in range(len(back) + 1 if back else 0))
+        return msg.SerializeToString()
+    if portnum == portnums_pb2.PortNum.NEIGHBORINFO_APP:
+        msg = mesh_pb2.NeighborInfo()
+        msg.node_id = sender
+        msg.node_broadcast_interval_secs = 900
+        for neighbor_id in rng.sample(node_ids, rng.randint(1, 8)):
+            neighbor = msg.neighbors.add()
+            neighbor.node_id = neighbor_id
+            neighbor.snr = rng.uniform(-15, 12)
+        return msg.SerializeToString()
+    if portnum == portnums_pb2.PortNum.MAP_REPORT_APP:
+        msg = mqtt_pb2.MapReport()
+        msg.long_name = f"Node {sender & 0xFFFF:04X}"
+        msg.short_name = f"{sender & 0xFFFF:04x}"
+        msg.firmware_version = "2.5.0"
+        msg.latitude_i = int((43.5 + rng.random()) * 1e7)
+        msg.longitude_i = int((-80.0 + rng.random()) * 1e7)
+        msg.num_online_local_nodes = rng.randint(1, 200)
+        return msg.SerializeToString()
+    return b""
+
+
+def generate_messages(count: int, profile: TrafficProfile | None = None):
+    """Yield (topic, payload) tuples shaped like real MQTT ServiceEnvelope traffic."""
+    profile = profile or TrafficProfile()
+    rng = random.Random(profile.seed)
+    node_ids = _node_ids(rng, profile.nodes)
+    gateway_ids = rng.sample(node_ids, min(profile.gateways, len(node_ids)))
+    default_key = _normalize_psk(base64.b64decode("AQ==")) or DEFAULT_KEY
+    custom_key = _normalize_psk(base64.b64decode(profile.custom_key_b64))
+    unknown_key = bytes(rng.randrange(256) for _ in range(16))
+    ports = list(PORT_WEIGHTS)
+    weights = list(PORT_WEIGHTS.values())
+    packet_id = rng.randrange(1, 1 << 30)
+
+    emitted = 0
+    while emitted < count:
+        packet_id = (packet_id + rng.randint(1, 97)) & 0xFFFFFFFF
+        portnum = rng.choices(ports, weights)[0]
+        sender = rng.choice(node_ids)
+        to = BROADCAST_ID if rng.random() < 0.8 else rng.choice(node_ids)
+        channel_name = rng.choice(profile.channels)
+
+        data = mesh_pb2.Data()
+        data.portnum = portnum
+        data.payload = _payload_for(rng, portnum, sender, node_ids)
+        if portnum in (portnums_pb2.PortNum.TRACEROUTE_APP, portnums_pb2.PortNum.ROUTING_APP):
+            data.request_id = rng.randrange(1, 1 << 31)
+
+        packet = mesh_pb2.MeshPacket()
+        setattr(packet, "from", sender)
+        packet.to = to
+        packet.id = packet_id
+        packet.channel = rng.randrange(0, 256)
+        packet.hop_start = rng.choice((3, 3, 3, 5, 7))
+        packet.rx_time = rng.randint(1_700_000_000, 1_800_000_000)
+
+        roll = rng.random()
+        if roll < profile.encrypted_ratio:
+            key_roll = rng.random()
+            if key_roll < profile.undecryptable_ratio:
+                key = unknown_key
+            elif key_roll < profile.undecryptable_ratio + profile.custom_key_ratio:
+                key = custom_key
+            else:
+                key = default_key
+            packet.encrypted = decrypt_payload(data.SerializeToString(), key, packet_id, sender)
+        else:
+            packet.decoded.CopyFrom(data)
+
+        copies = rng.randint(*profile.gateway_copies)
+        for gateway in rng.sample(gateway_ids, copies):
+            packet.hop_limit = rng.randint(0, packet.hop_start)
+            packet.rx_rssi = rng.randint(-130, -40)
+            packet.rx_snr = round(rng.uniform(-20, 12), 2)
+            envelope = mqtt_pb2.ServiceEnvelope()
+            envelope.packet.CopyFrom(packet)
+            envelope.channel_id = channel_name
+            envelope.gateway_id = f"!{gateway:08x}"
+            topic = f"msh/US/2/e/{channel_name}/!{gateway:08x}"
+            payload = envelope.SerializeToString()
+            yield topic, payload
+            emitted += 1
+            if rng.random() < profile.redelivery_ratio and emitted < count:
+                yield topic, payload
+                emitted += 1
+            if emitted >= count:
+                break
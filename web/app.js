@@ -10,6 +10,8 @@ const state = {
   lastUpdate: null,
   connection: "connecting",
   socket: null,
+  lastSeq: null,
+  seqAhead: new Set(),
   refreshTimer: null,
   drawerRequestId: 0,
   activeNodeId: null,
@@ -1324,8 +1326,10 @@ function applyGraphData(graphData) {
   const existingNodes = new Map(state.nodes);
   (graphData.nodes || []).forEach((node) => {
     const current = existingNodes.get(node.id);
+    const layout = Number.isFinite(node.x) && Number.isFinite(node.y) ? { x: node.x, y: node.y } : null;
     if (current) {
       current.label = node.label || current.label;
+      current.layout = layout || current.layout || null;
       current.isBroadcast = node.id === BROADCAST_ID;
       if (!current.color) {
         current.color = colorForNode(node.id);
@@ -1351,6 +1355,7 @@ function applyGraphData(graphData) {
         lastHeatAt: 0,
         lastSendColor: null,
         lastReceiveColor: null,
+        layout,
       });
     }
   });
@@ -1570,8 +1575,12 @@ function addPacket(packet, options = {}) {
   if (!packetMatchesFilters(normalized)) {
     return { graphChanged: false, hasRoutes: false };
   }
-  state.packets.unshift(normalized);
-  state.packets = state.packets.slice(0, PACKET_RENDER_LIMIT);
+  // Packets thinned before storage have no id; they animate the graph but
+  // stay out of the table, which lists stored packets.
+  if (normalized.id !== null && normalized.id !== undefined) {
+    state.packets.unshift(normalized);
+    state.packets = state.packets.slice(0, PACKET_RENDER_LIMIT);
+  }
 
   const source = normalized.from_id;
   const target = normalized.to_id;
@@ -2203,6 +2212,34 @@ function populateChannelFilter(channels) {
   }
 }
 
+// Lanes deliver events out of order and drop bulk ones under load, so
+// lastSeq is the highest seq below which every event arrived; later ones are
+// held in seqAhead to skip their replay after a resume.
+const SEQ_AHEAD_LIMIT = 20000;
+
+function advanceSeq(seq) {
+  state.lastSeq = Math.max(state.lastSeq || 0, seq || 0);
+  for (const held of state.seqAhead) {
+    if (held <= state.lastSeq) state.seqAhead.delete(held);
+  }
+  while (state.seqAhead.delete(state.lastSeq + 1)) {
+    state.lastSeq += 1;
+  }
+}
+
+function acceptSeq(seq) {
+  if (state.lastSeq === null) {
+    state.lastSeq = seq;
+    return true;
+  }
+  if (seq <= state.lastSeq || state.seqAhead.has(seq)) return false;
+  state.seqAhead.add(seq);
+  advanceSeq(state.lastSeq);
+  // A gap this old is past the replay ring, so the next resume reloads anyway.
+  if (state.seqAhead.size > SEQ_AHEAD_LIMIT) state.seqAhead.clear();
+  return true;
+}
+
 function connectWs() {
   const protocol = window.location.protocol === "https:" ? "wss" : "ws";
   if (state.socket) {
@@ -2211,7 +2248,9 @@ function connectWs() {
   state.connection = "connecting";
   updateLiveStatus();
 
-  const socket = new WebSocket(`${protocol}://${window.location.host}/ws`);
+  // Resume below the first missing event so a short drop does not lose packets.
+  const resume = state.lastSeq ? `?last_seq=${state.lastSeq}` : "";
+  const socket = new WebSocket(`${protocol}://${window.location.host}/ws${resume}`);
   state.socket = socket;
 
   socket.addEventListener("open", () => {
@@ -2220,8 +2259,22 @@ function connectWs() {
   });
 
   socket.addEventListener("message", (event) => {
+    const data = JSON.parse(event.data);
+    if (data.type === "hello") {
+      // Everything up to the hello seq was replayed or predates this page.
+      advanceSeq(data.seq);
+      return;
+    }
+    if (data.type === "reset") {
+      // The server no longer holds everything we missed; reload instead.
+      state.lastSeq = data.seq || null;
+      state.seqAhead.clear();
+      refreshAll();
+      return;
+    }
+    if (typeof data.seq === "number" && !acceptSeq(data.seq)) return;
     if (state.paused) return;
-    const packet = normalizePacket(JSON.parse(event.data));
+    const packet = normalizePacket(data);
     enqueuePacket(packet);
     updateLoadingState();
   });
@@ -2274,6 +2327,7 @@ const graph = (() => {
     canvas.height = height * ratio;
     ctx.setTransform(ratio, 0, 0, ratio, 0, 0);
     padding = Math.max(70, Math.min(width, height) * 0.08);
+    placeFromLayout();
     const broadcastNode = nodeIndex.get(BROADCAST_ID);
     if (broadcastNode) {
       broadcastNode.fx = width / 2;
@@ -2282,6 +2336,37 @@ const graph = (() => {
     applyDynamicForces();
   }
 
+  // Maps the server's persistent layout onto the canvas. Nodes start at and are
+  // held near these homes, so the simulation only resolves overlaps locally.
+  function placeFromLayout() {
+    const laidOut = nodes.filter((node) => node.layout);
+    if (!laidOut.length || !width || !height) return 0;
+    let minX = Infinity;
+    let minY = Infinity;
+    let maxX = -Infinity;
+    let maxY = -Infinity;
+    laidOut.forEach((node) => {
+      minX = Math.min(minX, node.layout.x);
+      maxX = Math.max(maxX, node.layout.x);
+      minY = Math.min(minY, node.layout.y);
+      maxY = Math.max(maxY, node.layout.y);
+    });
+    const scale = Math.min(
+      (width - padding * 2) / Math.max(maxX - minX, 1),
+      (height - padding * 2) / Math.max(maxY - minY, 1),
+    );
+    const offsetX = width / 2 - ((minX + maxX) / 2) * scale;
+    const offsetY = height / 2 - ((minY + maxY) / 2) * scale;
+    laidOut.forEach((node) => {
+      node.home = { x: node.layout.x * scale + offsetX, y: node.layout.y * scale + offsetY };
+      if (!Number.isFinite(node.x) || !Number.isFinite(node.y)) {
+        node.x = node.home.x;
+        node.y = node.home.y;
+      }
+    });
+    return laidOut.length;
+  }
+
   function rebuildIndex() {
     nodeIndex = new Map(nodes.map((node) => [node.id, node]));
   }
@@ -3474,6 +3559,7 @@ const graph = (() => {
     }
 
     if (simulation) {
+      const laidOut = placeFromLayout();
       const jitterX = width * 0.4;
       const jitterY = height * 0.4;
       nodes.forEach((node) => {
@@ -3489,7 +3575,8 @@ const graph = (() => {
       simulation.force("link").links(links);
       applyDynamicForces();
       if (shouldReheat) {
-        simulation.alpha(0.18).restart();
+        // With server positions for most nodes there is little left to settle.
+        simulation.alpha(laidOut * 2 > nodes.length ? 0.05 : 0.18).restart();
       } else {
         simulation.alphaTarget(0);
       }
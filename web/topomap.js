@@ -7,7 +7,10 @@ const state = {
   connection: "connecting",
   lastUpdate: null,
   socket: null,
+  lastSeq: null,
+  seqAhead: new Set(),
   hasFit: false,
+  playback: null,
 };
 
 const viewState = {
@@ -87,6 +90,12 @@ const cameraFlat = document.getElementById("cameraFlat");
 const glowToggle = document.getElementById("glowToggle");
 const loadingOverlay = document.getElementById("loadingOverlay");
 const loadingStatus = document.getElementById("loadingStatus");
+const playbackStart = document.getElementById("playbackStart");
+const playbackHours = document.getElementById("playbackHours");
+const playbackSpeed = document.getElementById("playbackSpeed");
+const playbackBtn = document.getElementById("playbackBtn");
+const playbackStop = document.getElementById("playbackStop");
+const playbackStatus = document.getElementById("playbackStatus");
 let loadingHidden = false;
 
 function updateLiveStatus() {
@@ -532,6 +541,27 @@ function updateNodePosition(nodeId, details, timestamp) {
   return true;
 }
 
+function applyStoredPositions(positions) {
+  if (!Array.isArray(positions)) {
+    return 0;
+  }
+  let applied = 0;
+  positions.forEach((entry) => {
+    const nodeId = coerceNodeId(entry.node_id);
+    if (nodeId === null) return;
+    const label = nodeLabelFromInfo(nodeId, entry);
+    state.nodeNames.set(nodeId, label);
+    const node = ensureNode(nodeId, label);
+    if (node && node.lastSeenEpoch === null) {
+      node.lastSeenEpoch = entry.last_seen || entry.updated_at || null;
+    }
+    if (updateNodePosition(nodeId, entry, entry.updated_at)) {
+      applied += 1;
+    }
+  });
+  return applied;
+}
+
 function pathHasPositions(path) {
   return path.every((nodeId) => {
     const node = state.nodes.get(nodeId);
@@ -626,7 +656,7 @@ function animateRouteForPacket(packet) {
 
 function ingestPacket(packet, options = {}) {
   if (!packet) return;
-  if (state.paused) return;
+  if (state.paused && !options.playback) return;
   const normalized = normalizePacket(packet);
   const now = performance.now();
   const source = normalized.from_id;
@@ -774,6 +804,34 @@ function ingestPacketBatch(packets, options = {}) {
   });
 }
 
+// Lanes deliver events out of order and drop bulk ones under load, so
+// lastSeq is the highest seq below which every event arrived; later ones are
+// held in seqAhead to skip their replay after a resume.
+const SEQ_AHEAD_LIMIT = 20000;
+
+function advanceSeq(seq) {
+  state.lastSeq = Math.max(state.lastSeq || 0, seq || 0);
+  for (const held of state.seqAhead) {
+    if (held <= state.lastSeq) state.seqAhead.delete(held);
+  }
+  while (state.seqAhead.delete(state.lastSeq + 1)) {
+    state.lastSeq += 1;
+  }
+}
+
+function acceptSeq(seq) {
+  if (state.lastSeq === null) {
+    state.lastSeq = seq;
+    return true;
+  }
+  if (seq <= state.lastSeq || state.seqAhead.has(seq)) return false;
+  state.seqAhead.add(seq);
+  advanceSeq(state.lastSeq);
+  // A gap this old is past the replay ring, so the next resume reloads anyway.
+  if (state.seqAhead.size > SEQ_AHEAD_LIMIT) state.seqAhead.clear();
+  return true;
+}
+
 function connectWs() {
   const protocol = window.location.protocol === "https:" ? "wss" : "ws";
   if (state.socket) {
@@ -782,7 +840,9 @@ function connectWs() {
   state.connection = "connecting";
   updateLiveStatus();
 
-  const socket = new WebSocket(`${protocol}://${window.location.host}/ws`);
+  // Resume below the first missing event so a short drop does not lose packets.
+  const resume = state.lastSeq ? `?last_seq=${state.lastSeq}` : "";
+  const socket = new WebSocket(`${protocol}://${window.location.host}/ws${resume}`);
   state.socket = socket;
 
   socket.addEventListener("open", () => {
@@ -791,8 +851,23 @@ function connectWs() {
   });
 
   socket.addEventListener("message", (event) => {
-    if (state.paused) return;
-    const packet = normalizePacket(JSON.parse(event.data));
+    const data = JSON.parse(event.data);
+    if (data.type === "hello") {
+      // Everything up to the hello seq was replayed or predates this page.
+      advanceSeq(data.seq);
+      return;
+    }
+    if (data.type === "reset") {
+      // The server no longer holds everything we missed; reload instead.
+      state.lastSeq = data.seq || null;
+      state.seqAhead.clear();
+      refreshStoredState();
+      return;
+    }
+    if (typeof data.seq === "number" && !acceptSeq(data.seq)) return;
+    // Live traffic stays off the map while a playback is running.
+    if (state.paused || state.playback) return;
+    const packet = normalizePacket(data);
     ingestPacket(packet, { animate: true });
   });
 
@@ -803,6 +878,100 @@ function connectWs() {
   });
 }
 
+function clearLinks() {
+  state.links.clear();
+  overlay.markLinksDirty();
+  updateLegend(state.links);
+  updateStats();
+}
+
+function toLocalInputValue(date) {
+  const offset = date.getTimezoneOffset() * 60000;
+  return new Date(date.getTime() - offset).toISOString().slice(0, 16);
+}
+
+function startPlayback() {
+  const start = Math.floor(new Date(playbackStart.value).getTime() / 1000);
+  if (!Number.isFinite(start)) {
+    playbackStatus.textContent = "Pick a start time";
+    return;
+  }
+  const end = start + Number(playbackHours.value) * 3600;
+  const protocol = window.location.protocol === "https:" ? "wss" : "ws";
+  const query = `start=${start}&end=${end}&speed=${Number(playbackSpeed.value)}`;
+  const socket = new WebSocket(`${protocol}://${window.location.host}/ws/playback?${query}`);
+  state.playback = { socket, paused: false, finished: false };
+  clearLinks();
+  playbackBtn.textContent = "Pause";
+  playbackStatus.textContent = "Starting playback...";
+
+  socket.addEventListener("message", (event) => {
+    const data = JSON.parse(event.data);
+    if (data.type === "start") {
+      playbackStatus.textContent = `Playing from ${formatTime(data.start)}`;
+      return;
+    }
+    if (data.type === "end") {
+      state.playback.finished = true;
+      playbackStatus.textContent = `Finished, ${data.sent} packets`;
+      playbackBtn.textContent = "Play";
+      return;
+    }
+    if (data.type === "error") {
+      playbackStatus.textContent = data.detail || "Playback failed";
+      return;
+    }
+    ingestPacket(normalizePacket(data), { animate: true, playback: true });
+    playbackStatus.textContent = `${formatTime(data.created_at)} at ${playbackSpeed.value}x`;
+  });
+
+  socket.addEventListener("close", () => {
+    if (state.playback && state.playback.socket === socket && !state.playback.finished) {
+      playbackStatus.textContent = "Playback stopped";
+      playbackBtn.textContent = "Play";
+      state.playback.finished = true;
+    }
+  });
+}
+
+function stopPlayback() {
+  if (!state.playback) return;
+  const { socket } = state.playback;
+  state.playback = null;
+  socket.close();
+  clearLinks();
+  playbackBtn.textContent = "Play";
+  playbackStatus.textContent = "Showing live traffic";
+}
+
+function sendPlayback(message) {
+  const socket = state.playback && state.playback.socket;
+  if (socket && socket.readyState === WebSocket.OPEN) {
+    socket.send(JSON.stringify(message));
+  }
+}
+
+function setupPlaybackControls() {
+  if (!playbackBtn) return;
+  playbackStart.value = toLocalInputValue(new Date(Date.now() - 86400 * 1000));
+  playbackBtn.addEventListener("click", () => {
+    if (!state.playback || state.playback.finished) {
+      if (state.playback) {
+        state.playback.socket.close();
+      }
+      startPlayback();
+      return;
+    }
+    state.playback.paused = !state.playback.paused;
+    sendPlayback({ type: state.playback.paused ? "pause" : "resume" });
+    playbackBtn.textContent = state.playback.paused ? "Resume" : "Pause";
+  });
+  playbackStop.addEventListener("click", stopPlayback);
+  playbackSpeed.addEventListener("change", () => {
+    sendPlayback({ type: "speed", value: Number(playbackSpeed.value) });
+  });
+}
+
 function setupPauseButton() {
   pauseBtn.addEventListener("click", () => {
     state.paused = !state.paused;
@@ -2289,9 +2458,24 @@ const overlay = (() => {
     },
   };
 })();
+async function refreshStoredState() {
+  const [nodesData, positionsData] = await Promise.all([
+    fetchJson(`/api/nodes?window=${HISTORY_WINDOW_SECONDS}`),
+    fetchJson("/api/positions"),
+  ]);
+  if (Array.isArray(nodesData)) {
+    nodesData.forEach((node) => {
+      state.nodeNames.set(node.node_id, nodeLabelFromInfo(node.node_id, node));
+    });
+  }
+  applyStoredPositions(positionsData);
+  updateStats();
+}
+
 async function bootstrap() {
   updateLiveStatus();
   setupPauseButton();
+  setupPlaybackControls();
   updateStats();
   updateFocusDisplay();
 
@@ -2299,13 +2483,15 @@ async function bootstrap() {
 
   const healthPromise = fetchJson("/api/health");
   const nodesPromise = fetchJson(`/api/nodes?window=${HISTORY_WINDOW_SECONDS}`);
+  const positionsPromise = fetchJson("/api/positions");
   const packetsPromise = fetchJson(
     `/api/packets?limit=${HISTORY_PACKET_LIMIT}&window=${HISTORY_WINDOW_SECONDS}`,
   );
 
-  const [health, nodesData, packetsData] = await Promise.all([
+  const [health, nodesData, positionsData, packetsData] = await Promise.all([
     healthPromise,
     nodesPromise,
+    positionsPromise,
     packetsPromise,
   ]);
 
@@ -2321,6 +2507,10 @@ async function bootstrap() {
     });
   }
 
+  if (applyStoredPositions(positionsData) > 0 && !state.hasFit) {
+    fitMapToNodes();
+  }
+
   let historyLoaded = false;
   if (Array.isArray(packetsData)) {
     historyLoaded = true;